@@ -0,0 +1,60 @@
+"""
+Микробенчмарк GET /api/tasks/{id}: задержка с кешем пользователей в get_current_user и без него.
+
+Приложение запускается в этом же процессе через httpx.ASGITransport на временной SQLite базе:
+    python benchmarks/bench_auth_cache.py --requests 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from inprocess import app_client, login
+
+import httpx
+
+from routers import auth
+
+
+async def measure(client: httpx.AsyncClient, url: str, headers: dict, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return sorted(latencies)
+
+
+def report(name: str, latencies: list[float]) -> None:
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{name:<22} p50 {p50:6.2f} ms   p95 {p95:6.2f} ms")
+
+
+async def run(requests: int) -> None:
+    async with app_client() as client:
+        headers = await login(client)
+        response = await client.post("/tasks", json={"title": "Task", "description": "bench"}, headers=headers)
+        url = f"/tasks/{response.json()['id']}"
+
+        cache = auth.user_cache
+        auth.user_cache = type(cache)(maxsize=0, ttl=0)
+        report("without user cache", await measure(client, url, headers, requests))
+
+        auth.user_cache = cache
+        report("with user cache", await measure(client, url, headers, requests))
+
+        auth.AUTH_TRUST_TOKEN_CLAIMS = True
+        report("trusted token claims", await measure(client, url, headers, requests))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Бенчмарк выгрузки задач: время до первого байта, общее время и пиковая память
+(tracemalloc) для GET /api/tasks/export и для обычного GET /api/tasks.
+
+Приложение запускается в этом же процессе на временной SQLite базе:
+    python benchmarks/bench_export.py --tasks 50000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from inprocess import app, app_client, login
+
+from bench_task_list import seed
+
+
+async def measure(url: str, query: str, headers: dict) -> dict:
+    """Вызывает ASGI-приложение напрямую: httpx.ASGITransport копит всё тело до конца ответа,
+    поэтому по нему нельзя увидеть ни первый байт, ни память без учёта буфера клиента."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/api" + url, "raw_path": ("/api" + url).encode(), "root_path": "",
+        "query_string": query.encode(), "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+    result = {"first_byte_ms": None, "size_mb": 0.0}
+    request_sent = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # StreamingResponse ждёт отключения клиента, пока отдаёт тело
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"{url} returned {message['status']}")
+        if message["type"] == "http.response.body" and message.get("body"):
+            if result["first_byte_ms"] is None:
+                result["first_byte_ms"] = (time.perf_counter() - started) * 1000
+            # Тело не накапливаем, чтобы мерить только память сервера
+            result["size_mb"] += len(message["body"]) / 2**20
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            finished.set()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    result["total_ms"] = (time.perf_counter() - started) * 1000
+    result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result
+
+
+async def run(tasks: int) -> None:
+    async with app_client() as client:
+        headers = await login(client)
+        await seed(client, headers, tasks)
+        print(f"{'request':<20} {'first byte ms':>14} {'total ms':>10} {'peak MB':>9} {'body MB':>9}")
+        for name, url, query in [
+            ("GET /tasks", "/tasks", ""),
+            ("export ndjson", "/tasks/export", "format=ndjson"),
+            ("export csv", "/tasks/export", "format=csv"),
+        ]:
+            row = await measure(url, query, headers)
+            print(f"{name:<20} {row['first_byte_ms']:>14.1f} {row['total_ms']:>10.1f} {row['peak_mb']:>9.1f} {row['size_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=50000)
+    args = parser.parse_args()
+    asyncio.run(run(args.tasks))
+
+
+if __name__ == "__main__":
+    main()
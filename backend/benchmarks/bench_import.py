@@ -0,0 +1,95 @@
+"""
+Бенчмарк импорта задач: сколько занимает импорт N задач через POST /api/tasks/import
+по сравнению с N отдельными POST /api/tasks, и сколько памяти (tracemalloc) занимает импорт.
+Тело импорта генерируется и отдаётся приложению кусками, как при загрузке большого файла.
+
+Приложение запускается в этом же процессе на временной SQLite базе:
+    python benchmarks/bench_import.py --tasks 100000 --single 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from inprocess import app, app_client, login
+
+CHUNK_SIZE = 64 * 1024
+
+
+def generate_body(tasks: int, import_format: str):
+    """Тело файла импорта кусками по CHUNK_SIZE байт."""
+    buffer = "title,description\n" if import_format == "csv" else ""
+    for i in range(tasks):
+        if import_format == "csv":
+            buffer += f"Imported task {i},\"Description of task {i}, imported\"\n"
+        else:
+            buffer += json.dumps({"title": f"Imported task {i}", "description": f"Description of task {i}"}) + "\n"
+        if len(buffer) >= CHUNK_SIZE:
+            yield buffer.encode()
+            buffer = ""
+    yield buffer.encode()
+
+
+async def import_streaming(tasks: int, import_format: str, headers: dict) -> dict:
+    """Вызывает ASGI-приложение напрямую, чтобы тело уходило кусками и не копилось в клиенте."""
+    body = generate_body(tasks, import_format)
+    response = {}
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/tasks/import", "raw_path": b"/api/tasks/import", "root_path": "",
+        "query_string": f"format={import_format}".encode(), "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+
+    async def receive():
+        chunk = next(body, None)
+        return {"type": "http.request", "body": chunk or b"", "more_body": chunk is not None}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] = response.get("body", b"") + message.get("body", b"")
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if response["status"] != 200:
+        raise RuntimeError(f"import returned {response['status']}: {response['body'][:200]}")
+    return {"elapsed": elapsed, "peak_mb": peak / 2**20, "result": json.loads(response["body"])}
+
+
+async def run(tasks: int, single: int) -> None:
+    async with app_client() as client:
+        headers = await login(client)
+
+        started = time.perf_counter()
+        for i in range(single):
+            response = await client.post("/tasks", json={"title": f"Task {i}", "description": "benchmark"}, headers=headers)
+            response.raise_for_status()
+        per_task = (time.perf_counter() - started) / single
+        print(f"POST /tasks x{single}: {per_task * 1000:.2f} ms/task, {tasks} tasks would take ~{per_task * tasks:.1f} s")
+
+        for import_format in ("ndjson", "csv"):
+            row = await import_streaming(tasks, import_format, headers)
+            assert row["result"]["imported"] == tasks, row["result"]
+            print(
+                f"import {import_format:<6} {tasks} tasks: {row['elapsed']:.1f} s "
+                f"({tasks / row['elapsed']:.0f} tasks/s), peak memory {row['peak_mb']:.1f} MB"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--single", type=int, default=2000, help="Сколько задач создать по одной для сравнения")
+    args = parser.parse_args()
+    asyncio.run(run(args.tasks, args.single))
+
+
+if __name__ == "__main__":
+    main()
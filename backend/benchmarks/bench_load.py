@@ -0,0 +1,81 @@
+"""
+Нагрузочный бенчмарк: сколько запросов в секунду выдерживает запущенный backend
+при конкурентных чтениях задач.
+
+Запуск (сервер должен быть уже поднят, например `uvicorn main:app`):
+    python benchmarks/bench_load.py --base-url http://127.0.0.1:8000/api --concurrency 50 --requests 2000
+Смешанную нагрузку (login, create, patch, delete) замеряет bench_api.py.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from results import print_table, save_results, summarize
+
+
+async def prepare(client: httpx.AsyncClient, tasks_count: int) -> dict:
+    """Регистрирует одноразового пользователя, логинится и создаёт ему задачи."""
+    username = f"bench_{uuid.uuid4().hex[:12]}"
+    password = "bench_password"
+    response = await client.post("/auth/register", json={"username": username, "password": password})
+    response.raise_for_status()
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for i in range(tasks_count):
+        response = await client.post(
+            "/tasks", json={"title": f"Task {i}", "description": "benchmark"}, headers=headers
+        )
+        response.raise_for_status()
+    return headers
+
+
+async def run(base_url: str, concurrency: int, requests: int, tasks_count: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        headers = await prepare(client, tasks_count)
+
+        latencies: list[float] = []
+        errors = 0
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get("/tasks", headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"list": summarize(latencies, errors, elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/api")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--tasks", type=int, default=20, help="Сколько задач создать пользователю перед замером")
+    parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.base_url, args.concurrency, args.requests, args.tasks))
+    print_table(results)
+    if args.output:
+        config = {"target": args.base_url, "concurrency": args.concurrency, "requests": args.requests, "tasks": args.tasks}
+        save_results(args.output, "bench_load", config, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Бенчмарк поиска GET /api/tasks/search: как меняется задержка с ростом числа задач.
+Для сравнения замеряется тот же поиск через LIKE по title и description (полный перебор).
+Задачи догружаются порциями через /api/tasks/import; редкое слово есть в каждой тысячной задаче.
+
+Приложение запускается в этом же процессе на временной SQLite базе:
+    python benchmarks/bench_search.py --sizes 1000,10000,100000 --repeat 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from inprocess import app_client, login
+
+from sqlalchemy import or_, select
+
+import database
+from database import Task
+from results import percentile
+
+WORDS = ["report", "meeting", "invoice", "review", "deploy", "design", "backup", "release", "budget", "planning"]
+
+
+def task_line(i: int) -> str:
+    description = " ".join(WORDS[(i * 7 + k) % len(WORDS)] for k in range(8))
+    if i % 1000 == 0:
+        description += " zeppelin"
+    return json.dumps({"title": f"{WORDS[i % len(WORDS)]} task {i}", "description": description}) + "\n"
+
+
+async def grow(client, headers: dict, start: int, stop: int) -> None:
+    body = "".join(task_line(i) for i in range(start, stop))
+    response = await client.post("/tasks/import", content=body.encode(), headers=headers, timeout=None)
+    response.raise_for_status()
+
+
+async def measure(function, repeat: int) -> float:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await function()
+        latencies.append(time.perf_counter() - started)
+    return percentile(sorted(latencies), 50) * 1000
+
+
+async def run(sizes: list[int], repeat: int) -> None:
+    async with app_client() as client:
+        headers = await login(client)
+        print(f"{'tasks':>8} {'search rare':>12} {'search common':>14} {'LIKE rare':>10}")
+        loaded = 0
+        for size in sizes:
+            await grow(client, headers, loaded, size)
+            loaded = size
+
+            async def search(q):
+                response = await client.get("/tasks/search", params={"q": q}, headers=headers)
+                response.raise_for_status()
+
+            async def like(q):
+                async with database.new_session() as db:
+                    pattern = f"%{q}%"
+                    await db.execute(
+                        select(Task.id).where(or_(Task.title.like(pattern), Task.description.like(pattern))).limit(20)
+                    )
+
+            rare = await measure(lambda: search("zeppelin"), repeat)
+            common = await measure(lambda: search("budget review"), repeat)
+            scan = await measure(lambda: like("zeppelin"), repeat)
+            print(f"{size:>8} {rare:>10.2f}ms {common:>12.2f}ms {scan:>8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Размеры через запятую, по возрастанию")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run([int(size) for size in args.sizes.split(",")], args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Бенчмарк холодного старта: каждый замер — новый процесс Python, в котором по очереди
+замеряются импорт main, запуск lifespan (проверка настроек, прогрев пула, broker)
+и первые запросы к приложению. Для сравнения последним замеряется повторный запрос.
+
+База — временная SQLite, схема и пользователь создаются один раз перед замерами:
+    python benchmarks/bench_startup.py --runs 10
+Для Postgres передайте DATABASE_URL, схема должна быть уже создана миграциями.
+Какие модули дольше всего импортируются, покажет `python -X importtime -c "import main"`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from results import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ["process", "import", "startup", "health", "first_list", "second_list"]
+
+
+async def prepare() -> None:
+    import database
+    from routers.auth import get_password_hash
+
+    await database.init_models()
+    async with database.new_session() as db:
+        db.add(database.User(username="bench_startup", hashed_password=get_password_hash("bench_password")))
+        await db.commit()
+    await database.dispose_engines()
+
+
+async def child(started: float) -> dict:
+    import httpx
+
+    timings = {}
+    phase_started = time.perf_counter()
+    import main
+    timings["import"] = time.perf_counter() - phase_started
+
+    from routers.auth import create_access_token
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': '1'})}"}
+    async with main.app.router.lifespan_context(main.app):
+        timings["startup"] = time.perf_counter() - phase_started - timings["import"]
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench/api") as client:
+            for name, url, request_headers in [
+                ("health", "/health/db", {}),
+                ("first_list", "/tasks", headers),
+                ("second_list", "/tasks", headers),
+            ]:
+                request_started = time.perf_counter()
+                response = await client.get(url, headers=request_headers)
+                response.raise_for_status()
+                timings[name] = time.perf_counter() - request_started
+    # Весь путь от запуска интерпретатора до ответа на первый запрос, без замеров повторного запроса
+    timings["process"] = time.perf_counter() - started - timings["second_list"]
+    return timings
+
+
+def run(runs: int, env: dict) -> dict[str, list[float]]:
+    subprocess.run([sys.executable, __file__, "--prepare"], cwd=BACKEND_DIR, env=env, check=True)
+    samples = {phase: [] for phase in PHASES}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", str(time.perf_counter())],
+            cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        for phase, value in json.loads(output.splitlines()[-1]).items():
+            samples[phase].append(value)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    if args.prepare:
+        asyncio.run(prepare())
+        return
+    if args.child is not None:
+        # perf_counter в Linux — монотонные часы системы, общие для родителя и дочернего процесса
+        print(json.dumps(asyncio.run(child(args.child))))
+        return
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    env.setdefault("SECRET_KEY", "benchmark-secret")
+    env.setdefault("BCRYPT_ROUNDS", "4")
+    samples = run(args.runs, env)
+    print(f"{'phase':<12} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for phase in PHASES:
+        latencies = sorted(samples[phase])
+        print(
+            f"{phase:<12} {percentile(latencies, 50) * 1000:>9.1f} "
+            f"{percentile(latencies, 95) * 1000:>9.1f} {latencies[-1] * 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Бенчмарк сериализации большого списка задач (по умолчанию 10 000).
+
+Сравнивает способы превратить строки задач в JSON:
+  orm+pydantic  — ORM-объекты Task, TaskListItem.model_validate(from_attributes), JSONResponse;
+  rows+pydantic — строки с нужными колонками, проверка через response_model, JSONResponse;
+  rows+orjson   — те же строки сразу в ORJSONResponse (так GET /api/tasks сериализует список),
+и отдельно замеряет GET /api/tasks целиком через приложение в этом процессе:
+    python benchmarks/bench_task_list.py --tasks 10000 --repeat 20
+"""
+import argparse
+import asyncio
+import time
+
+from inprocess import app_client, login
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+import database
+from database import Task
+from results import print_table, summarize
+from schemas import TaskListItem
+from utils import TASK_COLUMNS
+
+BATCH_SIZE = 1000
+
+
+async def seed(client, headers: dict, tasks: int) -> None:
+    for start in range(0, tasks, BATCH_SIZE):
+        operations = [
+            {"op": "create", "data": {"title": f"Task {i}", "description": "benchmark task description"}}
+            for i in range(start, min(start + BATCH_SIZE, tasks))
+        ]
+        response = await client.post("/tasks/batch", json={"operations": operations}, headers=headers)
+        response.raise_for_status()
+
+
+def timed(function, repeat: int) -> list[float]:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def run(tasks: int, repeat: int) -> dict[str, dict]:
+    async with app_client() as client:
+        headers = await login(client)
+        await seed(client, headers, tasks)
+
+        async with database.new_session() as db:
+            orm_tasks = list((await db.scalars(select(Task).where(Task.deleted_at.is_(None)).order_by(Task.id))).all())
+            rows = [row._asdict() for row in await db.execute(select(*TASK_COLUMNS).where(Task.deleted_at.is_(None)).order_by(Task.id))]
+
+        adapter = TypeAdapter(list[TaskListItem])
+        results = {}
+        for name, function in [
+            # Так FastAPI обрабатывает response_model: проверка, dump в JSON-совместимые типы, json.dumps
+            ("orm+pydantic", lambda: JSONResponse(adapter.dump_python(
+                adapter.validate_python(orm_tasks, from_attributes=True), mode="json"
+            ))),
+            ("rows+pydantic", lambda: JSONResponse(adapter.dump_python(adapter.validate_python(rows), mode="json"))),
+            ("rows+orjson", lambda: ORJSONResponse(rows)),
+        ]:
+            started = time.perf_counter()
+            latencies = timed(function, repeat)
+            results[name] = summarize(latencies, 0, time.perf_counter() - started)
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            request_started = time.perf_counter()
+            response = await client.get("/tasks", headers=headers)
+            latencies.append(time.perf_counter() - request_started)
+            response.raise_for_status()
+            assert len(response.json()) == tasks
+        results["GET /tasks"] = summarize(latencies, 0, time.perf_counter() - started)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print_table(asyncio.run(run(args.tasks, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
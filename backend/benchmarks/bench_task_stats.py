@@ -0,0 +1,62 @@
+"""
+Бенчмарк статистики задач: GET /api/tasks/stats читает строку счётчиков, а прежний способ —
+два GET /api/tasks/count (всего и выполненных) — считает задачи. Замер идёт для нескольких
+размеров списка, чтобы было видно, от чего растёт время:
+    python benchmarks/bench_task_stats.py --sizes 100,10000,100000 --repeat 50
+"""
+import argparse
+import asyncio
+import time
+
+from inprocess import app_client, login
+
+from results import print_table, summarize
+
+BATCH_SIZE = 1000
+
+
+async def seed(client, headers: dict, tasks: int) -> None:
+    for start in range(0, tasks, BATCH_SIZE):
+        operations = [
+            {"op": "create", "data": {"title": f"Task {i}", "description": "benchmark task description"}}
+            for i in range(start, min(start + BATCH_SIZE, tasks))
+        ]
+        response = await client.post("/tasks/batch", json={"operations": operations}, headers=headers)
+        response.raise_for_status()
+
+
+async def measure(client, headers: dict, urls: list[str], repeat: int) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        request_started = time.perf_counter()
+        for url in urls:
+            response = await client.get(url, headers=headers)
+            response.raise_for_status()
+        latencies.append(time.perf_counter() - request_started)
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+
+async def run(sizes: list[int], repeat: int) -> dict[str, dict]:
+    results = {}
+    async with app_client() as client:
+        for tasks in sizes:
+            headers = await login(client)
+            await seed(client, headers, tasks)
+            results[f"count x2 {tasks}"] = await measure(
+                client, headers, ["/tasks/count", "/tasks/count?is_completed=true"], repeat,
+            )
+            results[f"stats {tasks}"] = await measure(client, headers, ["/tasks/stats"], repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,10000,100000")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print_table(asyncio.run(run([int(size) for size in args.sizes.split(",")], args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Микробенчмарк проверки access-токена: сколько микросекунд на вызов стоит jwt.decode,
+decode_token с попаданием в кеш проверенных токенов и get_current_user целиком (с кешем пользователей).
+Для RS256 и ES256 нужен установленный cryptography, без него замеряется только HS256:
+    python benchmarks/bench_token_cache.py --iterations 20000
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from dataclasses import replace
+
+from inprocess import app_client, login
+
+import jwt
+
+import database
+import tokens
+from routers import auth
+from settings import get_settings
+
+
+def load_asymmetric(algorithm: str):
+    """Ключевой набор со свежим ключом или None, если cryptography не установлен."""
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec, rsa
+    except ImportError:
+        return None
+    if algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    )
+    with tempfile.NamedTemporaryFile("wb", suffix=".pem", delete=False) as file:
+        file.write(pem)
+    return tokens.load_key_set(replace(get_settings(), algorithm=algorithm, jwt_private_key_file=file.name, jwt_key_id="bench"))
+
+
+def per_call_us(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+async def per_call_async_us(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+async def run(iterations: int) -> None:
+    async with app_client() as client:
+        headers = await login(client)
+        token = headers["Authorization"].removeprefix("Bearer ")
+        async with database.new_session() as db:
+            await auth.get_current_user(token, db)
+
+            async def current_user():
+                await auth.get_current_user(token, db)
+
+            print(f"{'algorithm':<10} {'operation':<28} {'us/call':>9}")
+            key_sets = {"HS256": tokens.get_key_set()}
+            for algorithm in ("RS256", "ES256"):
+                key_set = load_asymmetric(algorithm)
+                if key_set is None:
+                    print(f"{algorithm:<10} пропущен: cryptography не установлен")
+                else:
+                    key_sets[algorithm] = key_set
+
+            get_key_set = tokens.get_key_set
+            for algorithm, key_set in key_sets.items():
+                tokens.get_key_set = lambda key_set=key_set: key_set
+                token = tokens.encode_token(jwt.decode(token, options={"verify_signature": False}))
+                key = key_set.verification_key(token)
+                results = {
+                    "jwt.decode": per_call_us(lambda: jwt.decode(token, key, algorithms=[algorithm]), iterations),
+                    "decode_token, no cache": per_call_us(lambda: tokens.decode_token(token, use_cache=False), iterations),
+                    "decode_token, cache hit": per_call_us(lambda: tokens.decode_token(token), iterations),
+                }
+                cache = tokens.verified_tokens
+                tokens.verified_tokens = type(cache)(maxsize=0, ttl=0)
+                results["get_current_user, no cache"] = await per_call_async_us(current_user, iterations)
+                tokens.verified_tokens = cache
+                results["get_current_user, cache"] = await per_call_async_us(current_user, iterations)
+                for operation, value in results.items():
+                    print(f"{algorithm:<10} {operation:<28} {value:>9.1f}")
+            tokens.get_key_set = get_key_set
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
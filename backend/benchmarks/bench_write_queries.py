@@ -0,0 +1,63 @@
+"""
+Сколько SQL-запросов и времени уходит на одну операцию записи в /api/tasks.
+Кеш пользователя прогрет, поэтому считаются только запросы самой операции.
+
+    python benchmarks/bench_write_queries.py --requests 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from inprocess import app_client, login
+
+from sqlalchemy import event
+
+import database
+
+
+async def run(requests: int) -> None:
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.get_engine().sync_engine, "before_cursor_execute", count)
+    async with app_client() as client:
+        headers = await login(client)
+        await client.get("/tasks/count", headers=headers)
+
+        ids = []
+        operations = {
+            "POST /tasks": lambda i: client.post(
+                "/tasks", json={"title": f"Task {i}", "description": "bench"}, headers=headers),
+            "PATCH /tasks/{id}": lambda i: client.patch(
+                f"/tasks/{ids[i]}", json={"is_completed": True}, headers=headers),
+            "PUT /tasks/{id}": lambda i: client.put(
+                f"/tasks/{ids[i]}", json={"title": "Put", "description": "bench", "is_completed": False}, headers=headers),
+            "DELETE /tasks/{id}": lambda i: client.delete(f"/tasks/{ids[i]}", headers=headers),
+        }
+        for name, operation in operations.items():
+            latencies = []
+            statements.clear()
+            for i in range(requests):
+                started = time.perf_counter()
+                response = await operation(i)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+                if name == "POST /tasks":
+                    ids.append(response.json()["id"])
+            queries = len(statements) / requests
+            print(f"{name:<20} {queries:.1f} queries/request   p50 {statistics.median(latencies) * 1000:.2f} ms")
+    event.remove(database.get_engine().sync_engine, "before_cursor_execute", count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Сравнивает результат бенчмарка с эталонным прогоном и завершается с кодом 1,
+если какая-то операция стала заметно медленнее.
+
+    python benchmarks/bench_api.py --output baseline.json      # на старой версии
+    python benchmarks/bench_api.py --output current.json       # на новой
+    python benchmarks/check_thresholds.py baseline.json current.json --max-regression 20
+
+Кроме сравнения можно задать абсолютные пределы: --max-p95-ms 50 --max-error-rate 0.01.
+"""
+import argparse
+import json
+import sys
+
+# Метрики задержки, которые сравниваются по умолчанию. p99 на коротких прогонах слишком шумный
+DEFAULT_METRICS = "p50_ms,p95_ms"
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(baseline: dict, current: dict, max_regression: float, metrics: list[str]) -> list[str]:
+    """Список нарушений: рост задержки или падение RPS больше max_regression процентов."""
+    failures = []
+    for name, row in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for metric in metrics:
+            if base[metric] and row[metric] > base[metric] * (1 + max_regression / 100):
+                failures.append(f"{name}: {metric} {base[metric]:.2f} -> {row[metric]:.2f}")
+        if base["rps"] and row["rps"] < base["rps"] * (1 - max_regression / 100):
+            failures.append(f"{name}: rps {base['rps']:.1f} -> {row['rps']:.1f}")
+    return failures
+
+
+def check_limits(current: dict, max_p95_ms: float | None, max_error_rate: float | None) -> list[str]:
+    failures = []
+    for name, row in current["results"].items():
+        if max_p95_ms is not None and row["p95_ms"] > max_p95_ms:
+            failures.append(f"{name}: p95_ms {row['p95_ms']:.2f} exceeds {max_p95_ms:.2f}")
+        if max_error_rate is not None and row["requests"] and row["errors"] / row["requests"] > max_error_rate:
+            failures.append(f"{name}: error rate {row['errors'] / row['requests']:.2%} exceeds {max_error_rate:.2%}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", help="JSON эталонного прогона")
+    parser.add_argument("current", help="JSON проверяемого прогона")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Допустимое ухудшение в процентах")
+    parser.add_argument("--metrics", default=DEFAULT_METRICS, help=f"Сравниваемые задержки через запятую, по умолчанию {DEFAULT_METRICS}")
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--max-error-rate", type=float, default=None)
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    if baseline.get("config") != current.get("config"):
+        print("warning: runs were made with different settings, comparison may be misleading")
+
+    failures = compare(baseline, current, args.max_regression, args.metrics.split(","))
+    failures += check_limits(current, args.max_p95_ms, args.max_error_rate)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
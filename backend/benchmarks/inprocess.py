@@ -0,0 +1,45 @@
+"""
+Общая обвязка для бенчмарков, которые запускают приложение в своём процессе
+через httpx.ASGITransport на временной SQLite базе.
+Модуль нужно импортировать до main/database: он выставляет переменные окружения.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("REFRESH_TOKEN_EXPIRE_DAYS", "7")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Бенчмарки шлют тысячи запросов от одного пользователя с одного адреса
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+import database
+from main import app
+
+
+@contextlib.asynccontextmanager
+async def app_client():
+    """Клиент к приложению в этом процессе; схема создаётся напрямую, без миграций."""
+    await database.init_models()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench/api") as client:
+        yield client
+    await database.dispose_engines()
+
+
+async def login(client: httpx.AsyncClient) -> dict:
+    """Регистрирует нового пользователя и возвращает заголовки с его access_token."""
+    credentials = {"username": f"bench_{uuid.uuid4().hex[:12]}", "password": "bench_password"}
+    response = await client.post("/auth/register", json=credentials)
+    response.raise_for_status()
+    response = await client.post("/token", data=credentials)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,67 @@
+"""
+Сводка замеров для бенчмарков: перцентили задержки, RPS и сохранение в JSON,
+который потом сравнивает check_thresholds.py.
+"""
+import json
+import math
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+
+def percentile(latencies: list[float], p: float) -> float:
+    """Перцентиль по уже отсортированному списку (метод nearest-rank)."""
+    if not latencies:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(latencies)), 1)
+    return latencies[rank - 1]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    """Задержки в секундах превращает в сводку в миллисекундах."""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if count else 0.0,
+    }
+
+
+def print_table(results: dict[str, dict]) -> None:
+    print(f"{'operation':<14} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in results.items():
+        print(
+            f"{name:<14} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9.1f} "
+            f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+        )
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path: str, benchmark: str, config: dict, results: dict[str, dict]) -> None:
+    """Сохраняет прогон вместе с параметрами и окружением, чтобы прогоны можно было сравнивать."""
+    document = {
+        "benchmark": benchmark,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(document, file, indent=2, ensure_ascii=False)
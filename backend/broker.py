@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+
+from settings import get_settings
+
+settings = get_settings()
+STREAM_QUEUE_SIZE = settings.stream_queue_size
+BROKER_URL = settings.broker_url
+
+BROKER_HEALTHCHECK_SECONDS = settings.broker_healthcheck_seconds
+BROKER_RECONNECT_SECONDS = settings.broker_reconnect_seconds
+BROKER_RECONNECT_MAX_SECONDS = settings.broker_reconnect_max_seconds
+
+RESYNC_EVENT = {"type": "resync"}
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Подписка одного подключения на события пользователя с ограниченной очередью."""
+
+    def __init__(self, broker: "Broker", user_id: int, queue_size: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=queue_size)
+
+    def put(self, event: dict) -> None:
+        if self.queue.full():
+            # Клиент не успевает читать: выбрасываем накопленное, пусть догонит через /api/tasks/changes
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = RESYNC_EVENT
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Broker(ABC):
+    """
+    Раздаёт события задач подключениям пользователя.
+    Локальная раздача общая, реализации отличаются тем, как событие попадает в другие процессы.
+    """
+
+    def __init__(self, queue_size: int = STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._channels: dict[int, set[Subscription]] = {}
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(self, user_id, self.queue_size)
+        self._channels.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        channel = self._channels.get(subscription.user_id)
+        if channel is None:
+            return
+        channel.discard(subscription)
+        if not channel:
+            del self._channels[subscription.user_id]
+
+    def subscribers(self, user_id: int) -> int:
+        return len(self._channels.get(user_id, ()))
+
+    def deliver(self, user_id: int, event: dict) -> None:
+        for subscription in self._channels.get(user_id, ()):
+            subscription.put(event)
+
+    def deliver_all(self, event: dict) -> None:
+        for channel in self._channels.values():
+            for subscription in channel:
+                subscription.put(event)
+
+    @abstractmethod
+    async def publish(self, user_id: int, event: dict) -> None:
+        ...
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class InMemoryBroker(Broker):
+    """События видят только подключения этого процесса. Подходит для одного воркера и тестов."""
+
+    async def publish(self, user_id: int, event: dict) -> None:
+        self.deliver(user_id, event)
+
+
+class PostgresBroker(Broker):
+    """
+    Общий канал для нескольких воркеров через LISTEN/NOTIFY той же базы PostgreSQL.
+    Каждый процесс держит одно слушающее соединение и сам раздаёт события своим подключениям.
+    Оборванное соединение переоткрывается в фоне; события, пропущенные за это время,
+    подключения догоняют по resync.
+    """
+
+    def __init__(self, dsn: str, channel: str = "task_events", queue_size: int = STREAM_QUEUE_SIZE,
+                 healthcheck: float = BROKER_HEALTHCHECK_SECONDS, reconnect_delay: float = BROKER_RECONNECT_SECONDS):
+        super().__init__(queue_size)
+        self.dsn = dsn
+        self.channel = channel
+        self.healthcheck = healthcheck
+        self.reconnect_delay = reconnect_delay
+        self._listener = None
+        self._lost = asyncio.Event()
+        self._supervisor = None
+        self._pool = None
+
+    async def start(self) -> None:
+        import asyncpg
+
+        await self._listen()
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        self._supervisor = asyncio.create_task(self._keep_listening())
+
+    async def stop(self) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+        if self._listener is not None:
+            await self._listener.close()
+        if self._pool is not None:
+            await self._pool.close()
+
+    async def publish(self, user_id: int, event: dict) -> None:
+        # Полезная нагрузка NOTIFY ограничена 8000 байт, поэтому события держим короткими
+        payload = json.dumps({"user_id": user_id, "event": event})
+        await self._pool.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        lost = asyncio.Event()
+        listener = await asyncpg.connect(self.dsn)
+        # Вызывается и при обрыве соединения, и при его закрытии
+        listener.add_termination_listener(lambda connection: lost.set())
+        await listener.add_listener(self.channel, self._on_notify)
+        self._listener, self._lost = listener, lost
+
+    async def _alive(self) -> bool:
+        # Соединение, у которого пропала сеть без разрыва TCP, заметно только по запросу
+        try:
+            await asyncio.wait_for(self._listener.execute("SELECT 1"), timeout=self.healthcheck)
+            return True
+        except Exception:
+            return False
+
+    async def _keep_listening(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), timeout=self.healthcheck)
+            except asyncio.TimeoutError:
+                if await self._alive():
+                    continue
+            logger.warning("Broker LISTEN connection lost, reconnecting")
+            self._listener.terminate()
+            delay = self.reconnect_delay
+            while True:
+                try:
+                    await self._listen()
+                    break
+                except Exception:
+                    logger.warning("Broker reconnect failed, retrying in %.0f s", delay, exc_info=True)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, BROKER_RECONNECT_MAX_SECONDS)
+            # Пока соединения не было, события других процессов до этого процесса не доходили
+            self.deliver_all(RESYNC_EVENT)
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        message = json.loads(payload)
+        self.deliver(message["user_id"], message["event"])
+
+
+def create_broker(url: str) -> Broker:
+    if url == "memory":
+        return InMemoryBroker()
+    if url.startswith(("postgresql://", "postgres://")):
+        return PostgresBroker(url)
+    raise ValueError(f"Unsupported BROKER_URL: {url}")
+
+
+broker = create_broker(BROKER_URL)
@@ -0,0 +1,139 @@
+import zlib
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+from settings import get_settings
+
+settings = get_settings()
+COMPRESSION_ENCODINGS = list(settings.compression_encodings)
+COMPRESSION_MIN_SIZE = settings.compression_min_size
+COMPRESSION_GZIP_LEVEL = settings.compression_gzip_level
+COMPRESSION_BROTLI_QUALITY = settings.compression_brotli_quality
+
+# text/event-stream сюда не входит: сжатый поток событий буферизуется и доходит до клиента с задержкой
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html"}
+
+
+class GzipCompressor:
+    def __init__(self, level: int = COMPRESSION_GZIP_LEVEL):
+        # wbits=31: поток с заголовком gzip, а не «голый» deflate
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int = COMPRESSION_BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+COMPRESSORS = {"br": BrotliCompressor, "gzip": GzipCompressor}
+
+
+def choose_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """Первая из encodings, которую клиент принимает по Accept-Encoding (q=0 означает отказ)."""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip()] = quality
+    for encoding in encodings:
+        if encoding in COMPRESSORS and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    ASGI-middleware: сжимает ответы с текстовыми типами в br или gzip по Accept-Encoding клиента.
+    Ответ целиком сжимается, только если он не меньше minimum_size; потоковые ответы
+    сжимаются по кускам со сбросом буфера после каждого, чтобы клиент получал данные сразу.
+    """
+
+    def __init__(self, app, encodings: list[str] | None = None, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.encodings = COMPRESSION_ENCODINGS if encodings is None else encodings
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", []))
+                headers = MutableHeaders(raw=message["headers"])
+                content_type = headers.get("content-type", "").partition(";")[0].strip()
+                if content_type not in COMPRESSIBLE_TYPES or "content-encoding" in headers or message["status"] in (204, 304):
+                    # Заголовки не задерживаем: поток событий должен открыться у клиента сразу
+                    passthrough = True
+                    await send(message)
+                    return
+                headers.add_vary_header("Accept-Encoding")
+                # Сжимать или нет, решаем по первому куску тела: от его размера зависят заголовки
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = COMPRESSORS[encoding]()
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            data = compressor.compress(body) + (compressor.flush() if more_body else compressor.finish())
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
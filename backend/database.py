@@ -1,30 +1,182 @@
-from sqlalchemy.orm import DeclarativeBase, relationship, sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker, AsyncConnection
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, create_engine
+from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker, AsyncConnection
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, DDL, event, false, func, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import InterfaceError, OperationalError
 from datetime import datetime
-import os
-from typing import Any, AsyncIterator
+import itertools
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
 import contextlib
 import asyncio
+from uuid import uuid4
 
-from dotenv import load_dotenv
+from cache import TTLCache
+from metrics import instrument_engine
+from settings import get_settings
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Fetch variables
-USER = os.getenv("user")
-PASSWORD = os.getenv("password")
-HOST = os.getenv("host")
-PORT = os.getenv("port")
-DBNAME = os.getenv("dbname")
+# Асинхронные драйверы для поддерживаемых СУБД
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
 
-# Construct the SQLAlchemy connection string
-if (all([USER, PASSWORD, HOST, PORT, DBNAME])):
-    DATABASE_URL = f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/{DBNAME}?sslmode=require"
-else:
-    DATABASE_URL = os.getenv("DATABASE_URL")
+def to_async_url(url: str) -> str:
+    """Переводит синхронный URL базы (psycopg2/pysqlite) на асинхронный драйвер."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Unsupported database backend: {backend}")
+    query = dict(url.query)
+    # asyncpg не понимает sslmode, у него свой параметр ssl
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    return url.set(drivername=ASYNC_DRIVERS[backend], query=query).render_as_string(hide_password=False)
 
-engine = create_engine(DATABASE_URL)
+settings = get_settings()
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_TIMEOUT = settings.db_pool_timeout
+DB_POOL_RECYCLE = settings.db_pool_recycle
+DB_POOL_PRE_PING = settings.db_pool_pre_ping
+DB_POOL_WARMUP = settings.db_pool_warmup
+DB_PGBOUNCER = settings.db_pgbouncer
+DB_REPLICA_STICKY_SECONDS = settings.db_replica_sticky_seconds
+DB_REPLICA_RETRY_SECONDS = settings.db_replica_retry_seconds
+
+def get_database_url() -> str:
+    return to_async_url(get_settings().resolved_database_url)
+
+def engine_options(url: str) -> dict[str, Any]:
+    """Параметры create_async_engine для выбранной СУБД."""
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_PGBOUNCER:
+        # Кеши prepared statements asyncpg ломаются, когда соседние транзакции уходят на разные серверные соединения
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return options
+
+def create_engine_for(url: str) -> AsyncEngine:
+    engine = create_async_engine(url, **engine_options(url))
+    # Время и число SQL-запросов попадают в Server-Timing и /metrics
+    instrument_engine(engine)
+    return engine
+
+# Движок основной базы и реплики создаются при первом обращении через get_engine() и get_replicas(),
+# а не при импорте: импорт модуля не читает URL базы и не загружает драйвер
+engine: AsyncEngine | None = None
+# Ошибки, после которых реплику считаем недоступной, а чтение повторяем на основной базе
+REPLICA_ERRORS = (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)
+
+class ReplicaPool:
+    """
+    Движки реплик для чтения. Реплики выдаются по кругу; реплика, на которой чтение упало
+    с ошибкой соединения, пропускается retry_after секунд. Пользователь, который недавно писал,
+    sticky_seconds читает из основной базы и видит свои записи, даже если реплики отстают.
+    Недавние записи помнит процесс: при нескольких воркерах запрос, попавший в другой воркер,
+    может прочитать реплику раньше срока.
+    """
+
+    def __init__(self, engines: list, sticky_seconds: float = DB_REPLICA_STICKY_SECONDS,
+                 retry_after: float = DB_REPLICA_RETRY_SECONDS):
+        self.engines = list(engines)
+        self.retry_after = retry_after
+        self._ejected_until = [0.0] * len(self.engines)
+        self._next = itertools.count()
+        # Записи живут sticky_seconds, размер лишь страхует от роста при всплеске записей
+        self._recent_writers = TTLCache(maxsize=100_000, ttl=sticky_seconds)
+
+    def choose(self, user_id: int | None = None):
+        """Следующая доступная реплика или None, если читать нужно из основной базы."""
+        if not self.engines or (user_id is not None and user_id in self._recent_writers):
+            return None
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = next(self._next) % len(self.engines)
+            if self._ejected_until[index] <= now:
+                return self.engines[index]
+        return None
+
+    def eject(self, replica) -> None:
+        index = self.engines.index(replica)
+        self._ejected_until[index] = time.monotonic() + self.retry_after
+
+    def available(self) -> int:
+        now = time.monotonic()
+        return sum(1 for until in self._ejected_until if until <= now)
+
+    def record_write(self, user_id: int) -> None:
+        """Вызывается при записи данных пользователя, до сброса его кешей."""
+        if self.engines:
+            self._recent_writers.set(user_id, True)
+
+    async def dispose(self) -> None:
+        for replica in self.engines:
+            await replica.dispose()
+
+replicas: ReplicaPool | None = None
+
+def get_engine() -> AsyncEngine:
+    """Движок основной базы. Создание движка не открывает соединений: первые открывает warm_up_pool."""
+    global engine
+    if engine is None:
+        engine = create_engine_for(get_database_url())
+    return engine
+
+def get_replicas() -> ReplicaPool:
+    global replicas
+    if replicas is None:
+        replicas = ReplicaPool([create_engine_for(to_async_url(url)) for url in get_settings().database_replica_urls])
+    return replicas
+
+async def dispose_engines() -> None:
+    """Закрывает соединения движков, которые успели создать."""
+    if engine is not None:
+        await engine.dispose()
+    if replicas is not None:
+        await replicas.dispose()
+
+async def warm_up_pool(connections: int = DB_POOL_WARMUP) -> None:
+    """Открывает несколько соединений при старте и возвращает их в пул."""
+    engine = get_engine()
+    if not hasattr(engine.pool, "size"):
+        # NullPool соединения не хранит, прогревать нечего
+        return
+    connections = min(connections, DB_POOL_SIZE)
+
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+def pool_status() -> dict[str, Any]:
+    """Текущее состояние пула: сколько соединений выдано и сколько простаивает."""
+    pool = get_engine().pool
+    if not hasattr(pool, "size"):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+    }
 
 class Base(DeclarativeBase):
     pass
@@ -36,10 +188,28 @@ class Task(Base):
     title = Column(String)
     description = Column(String)
     is_completed = Column(Boolean, default=False, nullable=False)
+    # Номер изменения в ленте пользователя: каждая запись получает max(version) + 1
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+    # Удалённая задача остаётся надгробием, чтобы попасть в ленту изменений
+    deleted_at = Column(DateTime, nullable=True)
 
     user_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="tasks")
 
+    __table_args__ = (
+        # Списки задач пользователя с keyset-пагинацией по id и поиск задачи по (id, user_id)
+        Index("ix_tasks_user_id_id", "user_id", "id"),
+        # Невыполненные задачи: частичный индекс не растёт вместе с историей выполненных
+        Index(
+            "ix_tasks_user_id_id_pending", "user_id", "id",
+            postgresql_where=(is_completed == false()) & deleted_at.is_(None),
+            sqlite_where=(is_completed == false()) & deleted_at.is_(None),
+        ),
+        # Лента изменений; уникальность не даёт двум параллельным записям получить одну версию
+        Index("ix_tasks_user_id_version", "user_id", "version", unique=True),
+    )
+
 class User(Base):
     __tablename__ = "users"
 
@@ -49,24 +219,164 @@ class User(Base):
     tasks = relationship("Task", back_populates="owner", cascade="all, delete-orphan")
     refresh_tokens = relationship("RefreshToken", back_populates="owner")
 
+class TaskStats(Base):
+    """Счётчики задач пользователя. Их ведут триггеры на tasks (STATS_DDL), приложение сюда не пишет."""
+    __tablename__ = "task_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # Живые задачи, без надгробий; невыполненные — total - completed
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    token = Column(String, unique=True, nullable=False)
+    # Сам токен не храним: ищем по jti из его claims и сверяем SHA-256
+    jti = Column(String(32), unique=True, nullable=False)
+    token_hash = Column(String(64), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
     expires_at = Column(DateTime, nullable=False)
 
     owner = relationship("User", back_populates="refresh_tokens")
 
-Base.metadata.create_all(bind=engine)
+    __table_args__ = (
+        Index("ix_refresh_tokens_user_id", "user_id"),
+        # Для удаления истёкших токенов
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+    )
+
+# Полнотекстовый поиск по title и description. В моделях его нет: в Postgres это вычисляемая
+# колонка tsvector с GIN-индексом, в SQLite — FTS5-таблица над tasks, которую обновляют триггеры.
+# Тот же DDL выполняет миграция 0005, а create_all (тесты, бенчмарки) — через эти события
+SEARCH_DDL = {
+    "postgresql": [
+        "ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+        "(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))) STORED",
+        "CREATE INDEX ix_tasks_search_vector ON tasks USING gin (search_vector)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE tasks_fts USING fts5(title, description, content='tasks', content_rowid='id')",
+        "CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+        "INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+        "CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+        "INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+        "CREATE TRIGGER tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN "
+        "INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    ],
+}
+
+for dialect_name, statements in SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect=dialect_name))
+event.listen(Task.__table__, "before_drop", DDL("DROP TABLE IF EXISTS tasks_fts").execute_if(dialect="sqlite"))
+
+# Счётчики task_stats меняются в той же транзакции, что и задачи, какой бы запрос их ни менял:
+# обработчики, пакетные операции, импорт через COPY. Вклад задачи: 1 в total, если она не удалена,
+# и 1 в completed, если она ещё и выполнена. В Postgres триггеры уровня оператора: импорт пачки задач
+# обновляет строку счётчиков один раз, а не на каждую задачу. Тот же DDL выполняет миграция 0006
+_STATS_UPSERT = (
+    "INSERT INTO task_stats (user_id, total, completed) {rows} "
+    "ON CONFLICT (user_id) DO UPDATE SET "
+    "total = task_stats.total + excluded.total, completed = task_stats.completed + excluded.completed"
+)
+_STATS_CHANGES = {
+    "insert": ("REFERENCING NEW TABLE AS new_rows",
+               "SELECT user_id, 1, is_completed::int FROM new_rows WHERE deleted_at IS NULL"),
+    "update": ("REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+               "SELECT n.user_id, (n.deleted_at IS NULL)::int - (o.deleted_at IS NULL)::int, "
+               "(n.deleted_at IS NULL AND n.is_completed)::int - (o.deleted_at IS NULL AND o.is_completed)::int "
+               "FROM new_rows n JOIN old_rows o ON o.id = n.id"),
+    "delete": ("REFERENCING OLD TABLE AS old_rows",
+               "SELECT user_id, -1, -(is_completed::int) FROM old_rows WHERE deleted_at IS NULL"),
+}
+STATS_DDL = {
+    "postgresql": [
+        statement
+        for operation, (referencing, changes) in _STATS_CHANGES.items()
+        for statement in (
+            f"CREATE OR REPLACE FUNCTION task_stats_{operation}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+            + _STATS_UPSERT.format(rows=(
+                f"SELECT user_id, sum(total), sum(completed) FROM ({changes}) AS changes (user_id, total, completed) "
+                "WHERE user_id IS NOT NULL GROUP BY user_id HAVING sum(total) <> 0 OR sum(completed) <> 0 "
+                "ORDER BY user_id"
+            ))
+            + "; RETURN NULL; END $$",
+            f"CREATE TRIGGER task_stats_{operation} AFTER {operation.upper()} ON tasks {referencing} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION task_stats_{operation}()",
+        )
+    ],
+    "sqlite": [
+        "CREATE TRIGGER task_stats_insert AFTER INSERT ON tasks "
+        "WHEN new.user_id IS NOT NULL AND new.deleted_at IS NULL BEGIN "
+        + _STATS_UPSERT.format(rows="VALUES (new.user_id, 1, new.is_completed)") + "; END",
+        "CREATE TRIGGER task_stats_update AFTER UPDATE OF is_completed, deleted_at ON tasks "
+        "WHEN new.user_id IS NOT NULL BEGIN "
+        + _STATS_UPSERT.format(rows=(
+            "SELECT new.user_id, (new.deleted_at IS NULL) - (old.deleted_at IS NULL), "
+            "(new.deleted_at IS NULL AND new.is_completed) - (old.deleted_at IS NULL AND old.is_completed) "
+            # WHERE обязателен: без него SQLite принимает ON CONFLICT за часть SELECT
+            "WHERE (new.deleted_at IS NULL) != (old.deleted_at IS NULL) OR new.is_completed != old.is_completed"
+        )) + "; END",
+        "CREATE TRIGGER task_stats_delete AFTER DELETE ON tasks "
+        "WHEN old.user_id IS NOT NULL AND old.deleted_at IS NULL BEGIN "
+        + _STATS_UPSERT.format(rows="VALUES (old.user_id, -1, -old.is_completed)") + "; END",
+    ],
+}
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+for dialect_name, statements in STATS_DDL.items():
+    for statement in statements:
+        event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect=dialect_name))
 
-def get_db():
-    db = SessionLocal()
-    try:
+def include_in_migrations(object, name, type_, reflected, compare_to) -> bool:
+    """Фильтр autogenerate: объекты поиска создаются вручную и моделям не соответствуют."""
+    if type_ == "table" and name.startswith("tasks_fts"):
+        return False
+    if name in ("search_vector", "ix_tasks_search_vector"):
+        return False
+    return True
+
+# expire_on_commit=False: после commit атрибуты не перечитываются лениво (в async это запрещено).
+# Движок не привязан: сессии открываются через new_session()
+SessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+def new_session() -> AsyncSession:
+    return SessionLocal(bind=get_engine())
+
+async def init_models():
+    """Создаёт таблицы в обход миграций. Для тестов и бенчмарков, рабочую схему ведёт alembic."""
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+def detached_session(db: AsyncSession) -> AsyncSession:
+    """
+    Новая сессия на том же движке, что и db. Для работы, которая может пережить запрос,
+    открывший db: сессию запроса закрывают, как только запрос отменён.
+    """
+    return AsyncSession(bind=db.bind, autoflush=False, expire_on_commit=False)
+
+T = TypeVar("T")
+
+async def run_read(db: AsyncSession, user_id: int | None, read: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    """
+    Выполняет read в новой сессии на реплике, а если реплик нет или пользователь недавно писал —
+    на движке db (см. detached_session). Если реплика недоступна, чтение повторяется на движке db.
+    """
+    replicas = get_replicas()
+    replica = replicas.choose(user_id)
+    if replica is not None:
+        try:
+            async with AsyncSession(bind=replica, autoflush=False, expire_on_commit=False) as session:
+                return await read(session)
+        except REPLICA_ERRORS:
+            logger.warning("Read replica failed, retrying on primary", exc_info=True)
+            replicas.eject(replica)
+    async with detached_session(db) as session:
+        return await read(session)
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with new_session() as db:
         yield db  # Открываем сессию
-    finally:
-        db.close()
+
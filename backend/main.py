@@ -1,8 +1,54 @@
+import asyncio
+import contextlib
+import logging
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+# Точка входа приложения: .env загружается один раз и до импорта остальных модулей,
+# их настройки берутся из get_settings(). Переменные, уже заданные в окружении, .env не перезаписывает
+load_dotenv()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, tasks
+from settings import get_settings
+from tokens import get_key_set
+from routers import auth, tasks, health, metrics as metrics_router
+import database
+import stats
+from metrics import MetricsMiddleware
+from compression import CompressionMiddleware
+from broker import broker
+
+# Схему базы ведут миграции alembic (`alembic upgrade head`). Импорт модулей ни DDL, ни соединений
+# с базой не выполняет и движок не создаёт: всё, что требует сети, происходит здесь, при старте приложения
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    settings.validate()
+    # Ключи JWT читаются сразу: ошибка в файле ключа должна остановить старт, а не первый вход
+    get_key_set()
+    if settings.db_create_all:
+        # Для локального запуска без alembic: create_all не меняет уже существующие таблицы
+        await database.init_models()
+    try:
+        await database.warm_up_pool()
+    except Exception:
+        # Приложение поднимается и без базы: пул дозаполнится при первых запросах
+        logging.getLogger(__name__).exception("Database pool warm-up failed")
+    await broker.start()
+    background = [asyncio.create_task(auth.run_refresh_token_sweeper())]
+    if stats.TASK_STATS_RECONCILE_INTERVAL_SECONDS > 0:
+        background.append(asyncio.create_task(stats.run_task_stats_reconciler()))
+    yield
+    for task in background:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await broker.stop()
+    await database.dispose_engines()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:80",
@@ -18,8 +64,13 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router, tags=['Authentication'], prefix="/api")
 app.include_router(tasks.router, tags=['Tasks'], prefix="/api")
+app.include_router(health.router, tags=['Health'], prefix="/api")
+app.include_router(metrics_router.router)
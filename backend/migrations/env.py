@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from logging.config import fileConfig
+
+from sqlalchemy import inspect, pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from alembic import context
+from dotenv import load_dotenv
+
+# Точка входа alembic: .env загружается до импорта database, как и в main.py
+load_dotenv()
+
+import database
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = database.Base.metadata
+
+# sqlalchemy.url в alembic.ini не задан: по умолчанию мигрируем базу приложения
+url = config.get_main_option("sqlalchemy.url") or database.get_database_url()
+
+# Ревизия схемы, которую до появления миграций создавал Base.metadata.create_all
+LEGACY_REVISION = "0001"
+
+logger = logging.getLogger("alembic.env")
+
+
+def stamp_legacy_schema(connection: Connection) -> None:
+    """
+    База прежней версии приложения: таблицы есть, а alembic_version нет. Отмечаем её ревизией 0001,
+    иначе первая миграция упадёт на уже существующих таблицах и контейнер не запустится.
+    """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    if "alembic_version" in tables or "users" not in tables:
+        return
+    if "version" in {column["name"] for column in inspector.get_columns("tasks")}:
+        # Схему создал DB_CREATE_ALL уже с новыми моделями: какой ревизии она соответствует, не угадать
+        raise RuntimeError(
+            "Database schema was created by DB_CREATE_ALL and has no alembic_version; "
+            "run `alembic stamp <revision>` for the revision it matches"
+        )
+    logger.warning("Database has no alembic_version table, stamping schema created by create_all as %s", LEGACY_REVISION)
+    context.get_context().stamp(context.script, LEGACY_REVISION)
+
+
+def run_migrations_offline() -> None:
+    """Генерирует SQL без подключения к базе: `alembic upgrade head --sql`."""
+    context.configure(
+        url=url,
+        target_metadata=target_metadata,
+        include_object=database.include_in_migrations,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=database.include_in_migrations,
+        # SQLite не умеет большинство ALTER TABLE, alembic пересоздаёт таблицу целиком
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+
+    with context.begin_transaction():
+        stamp_legacy_schema(connection)
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    connectable = create_async_engine(url, poolclass=pool.NullPool)
+
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
+
+
+def run_migrations_online() -> None:
+    asyncio.run(run_async_migrations())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,36 @@
+"""task and refresh token indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-01-20 12:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tasks_user_id_id', 'tasks', ['user_id', 'id'])
+    op.create_index(
+        'ix_tasks_user_id_id_pending', 'tasks', ['user_id', 'id'],
+        postgresql_where=sa.text('is_completed = false'),
+        sqlite_where=sa.text('is_completed = 0'),
+    )
+    op.create_index('ix_refresh_tokens_user_id', 'refresh_tokens', ['user_id'])
+    op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_refresh_tokens_expires_at', table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_user_id', table_name='refresh_tokens')
+    op.drop_index('ix_tasks_user_id_id_pending', table_name='tasks')
+    op.drop_index('ix_tasks_user_id_id', table_name='tasks')
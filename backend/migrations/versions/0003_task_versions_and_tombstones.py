@@ -0,0 +1,61 @@
+"""task versions and tombstones
+
+Колонки для ленты изменений: version, updated_at и deleted_at (мягкое удаление).
+Существующим задачам версии назначаются по порядку id внутри каждого пользователя.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-01-27 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # batch: SQLite не умеет ADD COLUMN с непостоянным значением по умолчанию
+    with op.batch_alter_table('tasks') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    op.execute(
+        """
+        UPDATE tasks SET version = numbered.rn
+        FROM (SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY id) AS rn FROM tasks) AS numbered
+        WHERE tasks.id = numbered.id
+        """
+    )
+    op.create_index('ix_tasks_user_id_version', 'tasks', ['user_id', 'version'], unique=True)
+
+    op.drop_index('ix_tasks_user_id_id_pending', table_name='tasks')
+    op.create_index(
+        'ix_tasks_user_id_id_pending', 'tasks', ['user_id', 'id'],
+        postgresql_where=sa.text('is_completed = false AND deleted_at IS NULL'),
+        sqlite_where=sa.text('is_completed = 0 AND deleted_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_user_id_id_pending', table_name='tasks')
+    op.create_index(
+        'ix_tasks_user_id_id_pending', 'tasks', ['user_id', 'id'],
+        postgresql_where=sa.text('is_completed = false'),
+        sqlite_where=sa.text('is_completed = 0'),
+    )
+    op.drop_index('ix_tasks_user_id_version', table_name='tasks')
+    # Надгробия без deleted_at стали бы снова видимыми задачами
+    op.execute("DELETE FROM tasks WHERE deleted_at IS NOT NULL")
+    with op.batch_alter_table('tasks') as batch_op:
+        batch_op.drop_column('deleted_at')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
@@ -0,0 +1,51 @@
+"""hashed refresh tokens
+
+refresh_tokens хранит jti и SHA-256 токена вместо самого токена.
+Старые записи восстановить в новом виде нельзя, поэтому таблица пересоздаётся:
+после миграции пользователям нужно войти заново.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-02-03 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_refresh_tokens(*token_columns: sa.Column) -> None:
+    op.create_table(
+        'refresh_tokens',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        *token_columns,
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_refresh_tokens_id', 'refresh_tokens', ['id'])
+    op.create_index('ix_refresh_tokens_user_id', 'refresh_tokens', ['user_id'])
+    op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'])
+
+
+def upgrade() -> None:
+    op.drop_table('refresh_tokens')
+    _create_refresh_tokens(
+        sa.Column('jti', sa.String(length=32), nullable=False, unique=True),
+        sa.Column('token_hash', sa.String(length=64), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('refresh_tokens')
+    _create_refresh_tokens(sa.Column('token', sa.String(), nullable=False, unique=True))
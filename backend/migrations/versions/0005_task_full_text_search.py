@@ -0,0 +1,61 @@
+"""task full-text search
+
+Postgres: вычисляемая колонка tasks.search_vector и GIN-индекс по ней.
+SQLite: FTS5-таблица tasks_fts над tasks и триггеры, которые держат её в актуальном состоянии.
+Пересоздание tasks в batch-режиме SQLite удаляет триггеры: такие миграции должны создавать их заново.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-02-10 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+            "(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))) STORED"
+        )
+        op.execute("CREATE INDEX ix_tasks_search_vector ON tasks USING gin (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE tasks_fts USING fts5(title, description, content='tasks', content_rowid='id')")
+        op.execute(
+            "CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+            "INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+            "INSERT INTO tasks_fts(tasks_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN "
+            "INSERT INTO tasks_fts(tasks_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            "INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+        )
+        # Индексируем уже существующие задачи
+        op.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX ix_tasks_search_vector")
+        op.execute("ALTER TABLE tasks DROP COLUMN search_vector")
+    elif dialect == 'sqlite':
+        for trigger in ('tasks_fts_insert', 'tasks_fts_delete', 'tasks_fts_update'):
+            op.execute(f"DROP TRIGGER {trigger}")
+        op.execute("DROP TABLE tasks_fts")
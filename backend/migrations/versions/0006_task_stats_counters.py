@@ -0,0 +1,105 @@
+"""task stats counters
+
+Таблица task_stats со счётчиками задач пользователя и триггеры на tasks, которые её ведут.
+Счётчики заполняются по уже существующим задачам. Пересоздание tasks в batch-режиме SQLite
+удаляет триггеры: такие миграции должны создавать их заново.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-02-17 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UPSERT = (
+    "INSERT INTO task_stats (user_id, total, completed) {rows} "
+    "ON CONFLICT (user_id) DO UPDATE SET "
+    "total = task_stats.total + excluded.total, completed = task_stats.completed + excluded.completed"
+)
+POSTGRES_CHANGES = {
+    'insert': ("REFERENCING NEW TABLE AS new_rows",
+               "SELECT user_id, 1, is_completed::int FROM new_rows WHERE deleted_at IS NULL"),
+    'update': ("REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+               "SELECT n.user_id, (n.deleted_at IS NULL)::int - (o.deleted_at IS NULL)::int, "
+               "(n.deleted_at IS NULL AND n.is_completed)::int - (o.deleted_at IS NULL AND o.is_completed)::int "
+               "FROM new_rows n JOIN old_rows o ON o.id = n.id"),
+    'delete': ("REFERENCING OLD TABLE AS old_rows",
+               "SELECT user_id, -1, -(is_completed::int) FROM old_rows WHERE deleted_at IS NULL"),
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'task_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('completed', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for operation, (referencing, changes) in POSTGRES_CHANGES.items():
+            op.execute(
+                f"CREATE OR REPLACE FUNCTION task_stats_{operation}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+                + UPSERT.format(rows=(
+                    f"SELECT user_id, sum(total), sum(completed) FROM ({changes}) AS changes (user_id, total, completed) "
+                    "WHERE user_id IS NOT NULL GROUP BY user_id HAVING sum(total) <> 0 OR sum(completed) <> 0 "
+                    "ORDER BY user_id"
+                ))
+                + "; RETURN NULL; END $$"
+            )
+            op.execute(
+                f"CREATE TRIGGER task_stats_{operation} AFTER {operation.upper()} ON tasks {referencing} "
+                f"FOR EACH STATEMENT EXECUTE FUNCTION task_stats_{operation}()"
+            )
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE TRIGGER task_stats_insert AFTER INSERT ON tasks "
+            "WHEN new.user_id IS NOT NULL AND new.deleted_at IS NULL BEGIN "
+            + UPSERT.format(rows="VALUES (new.user_id, 1, new.is_completed)") + "; END"
+        )
+        op.execute(
+            "CREATE TRIGGER task_stats_update AFTER UPDATE OF is_completed, deleted_at ON tasks "
+            "WHEN new.user_id IS NOT NULL BEGIN "
+            + UPSERT.format(rows=(
+                "SELECT new.user_id, (new.deleted_at IS NULL) - (old.deleted_at IS NULL), "
+                "(new.deleted_at IS NULL AND new.is_completed) - (old.deleted_at IS NULL AND old.is_completed) "
+                "WHERE (new.deleted_at IS NULL) != (old.deleted_at IS NULL) OR new.is_completed != old.is_completed"
+            )) + "; END"
+        )
+        op.execute(
+            "CREATE TRIGGER task_stats_delete AFTER DELETE ON tasks "
+            "WHEN old.user_id IS NOT NULL AND old.deleted_at IS NULL BEGIN "
+            + UPSERT.format(rows="VALUES (old.user_id, -1, -old.is_completed)") + "; END"
+        )
+
+    # Триггеры уже созданы: в Postgres они держат блокировку tasks до конца миграции,
+    # и записи, пришедшие во время заполнения, учтутся после него
+    op.execute(
+        "INSERT INTO task_stats (user_id, total, completed) "
+        "SELECT user_id, count(*), sum(CASE WHEN is_completed THEN 1 ELSE 0 END) FROM tasks "
+        "WHERE deleted_at IS NULL AND user_id IS NOT NULL GROUP BY user_id"
+    )
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for operation in POSTGRES_CHANGES:
+        if dialect == 'postgresql':
+            op.execute(f"DROP TRIGGER task_stats_{operation} ON tasks")
+            op.execute(f"DROP FUNCTION task_stats_{operation}()")
+        elif dialect == 'sqlite':
+            op.execute(f"DROP TRIGGER task_stats_{operation}")
+    op.drop_table('task_stats')
@@ -0,0 +1,153 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+
+from settings import get_settings
+
+settings = get_settings()
+RATE_LIMIT_ENABLED = settings.rate_limit_enabled
+RATE_LIMIT_STORE_URL = settings.rate_limit_store_url
+RATE_LIMIT_STORE_SIZE = settings.rate_limit_store_size
+RATE_LIMIT_LOGIN_IP = settings.rate_limit_login_ip
+RATE_LIMIT_LOGIN_USERNAME = settings.rate_limit_login_username
+RATE_LIMIT_REGISTER_IP = settings.rate_limit_register_ip
+RATE_LIMIT_USER = settings.rate_limit_user
+
+
+class RateLimitStore(ABC):
+    """
+    Хранилище token bucket. Бакет с ключом key вмещает capacity токенов
+    и пополняется со скоростью rate токенов в секунду.
+    Общая для воркеров реализация (например, на Redis) должна выполнять каждую операцию атомарно.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1) -> float:
+        """Списывает cost токенов. Возвращает 0, если они были, иначе сколько секунд ждать; тогда ничего не списывается."""
+
+    @abstractmethod
+    async def wait_time(self, key: str, capacity: float, rate: float) -> float:
+        """Сколько секунд ждать, пока в бакете появится токен. Ничего не списывает."""
+
+    @abstractmethod
+    async def refund(self, key: str, capacity: float, rate: float, cost: float = 1) -> None:
+        """Возвращает в бакет cost токенов, списанных take(), но не больше capacity."""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    Бакеты в OrderedDict: поиск, обновление и вытеснение самого давнего бакета за O(1).
+    Операции не ждут ввода-вывода, поэтому в одном event loop атомарны без блокировок.
+    """
+
+    def __init__(self, maxsize: int = RATE_LIMIT_STORE_SIZE):
+        self.maxsize = maxsize
+        # key -> (токенов на момент updated_at, updated_at)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def _tokens(self, key: str, capacity: float, rate: float, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        return min(capacity, tokens + (now - updated_at) * rate)
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        tokens = self._tokens(key, capacity, rate, now)
+        if tokens < cost:
+            return (cost - tokens) / rate
+        self._buckets[key] = (tokens - cost, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            # Вытесняем бакет, который дольше всех не трогали: скорее всего, он уже пополнился
+            self._buckets.popitem(last=False)
+        return 0.0
+
+    async def wait_time(self, key: str, capacity: float, rate: float) -> float:
+        tokens = self._tokens(key, capacity, rate, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+    async def refund(self, key: str, capacity: float, rate: float, cost: float = 1) -> None:
+        if key in self._buckets:
+            now = time.monotonic()
+            self._buckets[key] = (min(capacity, self._tokens(key, capacity, rate, now) + cost), now)
+
+    async def clear(self) -> None:
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def create_store(url: str) -> RateLimitStore:
+    if url == "memory":
+        return InMemoryRateLimitStore()
+    raise ValueError(f"Unsupported RATE_LIMIT_STORE_URL: {url}")
+
+
+store = create_store(RATE_LIMIT_STORE_URL)
+
+
+def parse_rate(spec: str) -> tuple[int, float]:
+    """"10/60" -> (10, 60.0): сколько запросов и за сколько секунд они восстанавливаются."""
+    requests, _, seconds = spec.partition("/")
+    return int(requests), float(seconds or 1)
+
+
+def too_many_requests(wait: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests",
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+
+def client_ip(request: Request) -> str:
+    # За reverse proxy адрес клиента из X-Forwarded-For подставляет uvicorn, но только для прокси
+    # из FORWARDED_ALLOW_IPS (по умолчанию 127.0.0.1). Он берёт первый справа адрес, которого нет в списке:
+    # записи левее добавил сам клиент, и по ним каждый запрос получал бы свежий бакет
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """Именованный лимит: у каждого ключа (id пользователя, IP, username) свой бакет."""
+
+    def __init__(self, name: str, spec: str, store: RateLimitStore = store):
+        self.name = name
+        self.capacity, period = parse_rate(spec)
+        self.rate = self.capacity / period
+        self.store = store
+
+    @property
+    def enabled(self) -> bool:
+        return RATE_LIMIT_ENABLED and self.capacity > 0
+
+    def _key(self, key: str | int) -> str:
+        return f"{self.name}:{key}"
+
+    async def acquire(self, key: str | int) -> None:
+        """Списывает токен, а если его нет — отвечает 429 с Retry-After."""
+        if self.enabled:
+            wait = await self.store.take(self._key(key), self.capacity, self.rate)
+            if wait:
+                raise too_many_requests(wait)
+
+    async def refund(self, key: str | int) -> None:
+        """
+        Возвращает токен, списанный acquire(), если попытка не должна считаться.
+        Токен списывается заранее, а не после неудачи: иначе параллельные запросы
+        успевают пройти проверку, пока бакет ещё полон.
+        """
+        if self.enabled:
+            await self.store.refund(self._key(key), self.capacity, self.rate)
+
+
+login_ip_limit = RateLimit("login_ip", RATE_LIMIT_LOGIN_IP)
+login_username_limit = RateLimit("login_username", RATE_LIMIT_LOGIN_USERNAME)
+register_ip_limit = RateLimit("register_ip", RATE_LIMIT_REGISTER_IP)
+user_limit = RateLimit("user", RATE_LIMIT_USER)
@@ -0,0 +1,132 @@
+import itertools
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+
+from cache import TTLCache
+from metrics import Counter, Gauge, registry
+from settings import get_settings
+
+settings = get_settings()
+TASK_CACHE_URL = settings.task_cache_url
+TASK_CACHE_SIZE = settings.task_cache_size
+TASK_CACHE_TTL_SECONDS = settings.task_cache_ttl_seconds
+TASK_CACHE_GENERATIONS_SIZE = settings.task_cache_generations_size
+TASK_CACHE_MAX_ENTRY_BYTES = settings.task_cache_max_entry_bytes
+
+cache_requests = registry.register(Counter(
+    "task_cache_requests_total", "Обращения к кешу ответов задач", ("route", "result"),
+))
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+class ResponseCacheBackend(ABC):
+    """
+    Хранилище ответов и поколений пользователей. Поколение входит в ключ ответа:
+    запись задач переводит пользователя на новое поколение, и старые ответы больше не находятся.
+    Общая для воркеров реализация должна хранить в общем месте и ответы, и поколения.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> CachedResponse | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: CachedResponse) -> None:
+        ...
+
+    @abstractmethod
+    async def generation(self, user_id: int) -> int:
+        ...
+
+    @abstractmethod
+    async def bump(self, user_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+
+class InMemoryResponseCacheBackend(ResponseCacheBackend):
+    def __init__(self, maxsize: int = TASK_CACHE_SIZE, ttl: float = TASK_CACHE_TTL_SECONDS,
+                 generations_size: int = TASK_CACHE_GENERATIONS_SIZE):
+        self.responses = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Поколения тоже вытесняются, поэтому номер берётся из общего для процесса счётчика:
+        # пользователь, чьё поколение вытеснено, получает номер, которого ещё не было ни у кого.
+        # Размер свой, а не maxsize: с отключённым кешем поколения всё равно нужны
+        self._generations = TTLCache(maxsize=max(generations_size, 1), ttl=float("inf"))
+        self._counter = itertools.count(1)
+
+    async def get(self, key: str) -> CachedResponse | None:
+        return self.responses.get(key)
+
+    async def set(self, key: str, value: CachedResponse) -> None:
+        self.responses.set(key, value)
+
+    async def generation(self, user_id: int) -> int:
+        generation = self._generations.get(user_id)
+        if generation is None:
+            generation = next(self._counter)
+            self._generations.set(user_id, generation)
+        return generation
+
+    async def bump(self, user_id: int) -> None:
+        self._generations.set(user_id, next(self._counter))
+
+    async def clear(self) -> None:
+        self.responses.clear()
+        self._generations.clear()
+
+
+def create_backend(url: str) -> ResponseCacheBackend:
+    if url == "memory":
+        return InMemoryResponseCacheBackend()
+    raise ValueError(f"Unsupported TASK_CACHE_URL: {url}")
+
+
+class ResponseCache:
+    """
+    Read-through кеш готовых ответов чтения задач. Ключ — пользователь, его поколение,
+    маршрут и параметры запроса; обработчики записи сбрасывают кеш пользователя через invalidate.
+    """
+
+    def __init__(self, backend: ResponseCacheBackend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+
+    async def key(self, user_id: int, route: str, *parts) -> str:
+        generation = await self.backend.generation(user_id)
+        return ":".join(str(part) for part in (user_id, generation, route, *parts))
+
+    async def get(self, key: str, route: str) -> CachedResponse | None:
+        if not self.enabled:
+            return None
+        cached = await self.backend.get(key)
+        cache_requests.inc(route, "miss" if cached is None else "hit")
+        return cached
+
+    async def set(self, key: str, value: CachedResponse) -> None:
+        if self.enabled and len(value.body) <= TASK_CACHE_MAX_ENTRY_BYTES:
+            await self.backend.set(key, value)
+
+    async def invalidate(self, user_id: int) -> None:
+        """
+        Вызывается после коммита записи: ответ, прочитанный до коммита, останется в старом поколении.
+        Поколение меняется и при выключенном кеше: чтение, начатое после записи, не должно
+        присоединиться к объединённому чтению, начатому до неё.
+        """
+        await self.backend.bump(user_id)
+
+
+task_cache = ResponseCache(create_backend(TASK_CACHE_URL), enabled=TASK_CACHE_SIZE > 0)
+
+if isinstance(task_cache.backend, InMemoryResponseCacheBackend):
+    registry.register(Gauge(
+        "task_cache_entries", "Ответов задач в кеше процесса", lambda: len(task_cache.backend.responses),
+    ))
@@ -1,22 +1,38 @@
-from operator import ge
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+from functools import partial
 from typing import Annotated
-from fastapi import Depends, HTTPException, APIRouter, status
+from fastapi import Depends, HTTPException, APIRouter, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import database
-from sqlalchemy.orm import Session
+from cache import SingleFlight, TTLCache
+from ratelimit import client_ip, login_ip_limit, login_username_limit, register_ip_limit, user_limit
+from sqlalchemy import select, insert, delete, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, constr, Field
 from datetime import datetime, timedelta, timezone
 
 import jwt
 from jwt.exceptions import InvalidTokenError
-from utils import get_password_hash, verify_password
+from settings import get_settings
+from tokens import decode_token, encode_token
+from utils import get_password_hash, get_password_hash_async, verify_password_async, password_needs_rehash
 
-import os
+settings = get_settings()
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+REFRESH_TOKEN_EXPIRE_DAYS = settings.refresh_token_expire_days
+USER_CACHE_SIZE = settings.user_cache_size
+USER_CACHE_TTL_SECONDS = settings.user_cache_ttl_seconds
+AUTH_TRUST_TOKEN_CLAIMS = settings.auth_trust_token_claims
+REVOKED_TOKEN_CACHE_SIZE = settings.revoked_token_cache_size
+REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS = settings.refresh_token_sweep_interval_seconds
+REFRESH_TOKEN_SWEEP_BATCH_SIZE = settings.refresh_token_sweep_batch_size
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
-REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"))
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -26,6 +42,20 @@ class UserInDB(BaseModel):
     id: int
     hashed_password: str
 
+class CurrentUser(BaseModel):
+    """Аутентифицированный пользователь запроса. Не привязан к сессии, поэтому его можно кешировать."""
+    id: int
+    username: str | None = None
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+user_lookups = SingleFlight()
+revoked_tokens = TTLCache(maxsize=REVOKED_TOKEN_CACHE_SIZE, ttl=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+
+@event.listens_for(database.User, "after_update")
+@event.listens_for(database.User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.pop(target.id)
+
 class UserIn(BaseModel):
     username: str
     password: constr(min_length=8) = Field(
@@ -33,25 +63,30 @@ class UserIn(BaseModel):
         min_length=8
     )
     
-def get_user_from_db_by_username(db: Session, username: str):
-    user_db = db.query(database.User).filter(database.User.username == username).first()
+async def get_user_from_db_by_username(db: AsyncSession, username: str):
+    user_db = await db.scalar(select(database.User).where(database.User.username == username))
     if user_db:
         return user_db
 
     return None
 
-def get_user_from_db_by_user_id(db: Session, user_id: int):
-    user_db = db.query(database.User).filter(database.User.id == user_id).first()
+async def get_user_from_db_by_user_id(db: AsyncSession, user_id: int):
+    user_db = await db.scalar(select(database.User).where(database.User.id == user_id))
     if user_db:
         return user_db
 
     return None
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_from_db_by_username(db, username)
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user_from_db_by_username(db, username)
+    if not user or not await verify_password_async(password, user.hashed_password):
         return False
 
+    # Хеш со старой стоимостью bcrypt прозрачно пересчитываем, пока знаем пароль
+    if password_needs_rehash(user.hashed_password):
+        user.hashed_password = await get_password_hash_async(password)
+        await db.commit()
+
     return user
 
 class AccessToken(BaseModel):
@@ -71,23 +106,80 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return encode_token(to_encode)
 
 def create_refresh_token(user_id: int):
     expire = datetime.now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    payload = {"sub": str(user_id), "exp": expire}
-    token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
-    return token, expire
+    jti = secrets.token_hex(16)
+    payload = {"sub": str(user_id), "exp": expire, "jti": jti}
+    token = encode_token(payload)
+    return token, jti, expire
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def issue_refresh_token(db: AsyncSession, user_id: int) -> str:
+    """Создаёт refresh_token и сохраняет его дайджест. jti случайный, проверять уникальность заранее не нужно."""
+    # Вход — первая запись нового пользователя: следующие запросы не должны искать его на отстающей реплике
+    database.get_replicas().record_write(user_id)
+    refresh_token, jti, refresh_exp = create_refresh_token(user_id=user_id)
+    await db.execute(insert(database.RefreshToken).values(
+        user_id=user_id, jti=jti, token_hash=hash_refresh_token(refresh_token), expires_at=refresh_exp
+    ))
+    return refresh_token
+
+def revoke_in_cache(jti: str, exp: int) -> None:
+    # Помнить отзыв дольше жизни самого токена незачем: истёкший отклонит decode_token
+    remaining = exp - datetime.now(timezone.utc).timestamp()
+    if remaining > 0:
+        revoked_tokens.set(jti, True, ttl=remaining)
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(database.get_db)):
+async def delete_expired_refresh_tokens(db: AsyncSession, batch_size: int = REFRESH_TOKEN_SWEEP_BATCH_SIZE) -> int:
+    """Удаляет истёкшие токены пачками, чтобы не держать долгую блокировку на большой таблице."""
+    deleted = 0
+    while True:
+        expired_ids = (
+            select(database.RefreshToken.id)
+            .where(database.RefreshToken.expires_at <= datetime.now())
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        result = await db.execute(delete(database.RefreshToken).where(database.RefreshToken.id.in_(expired_ids)))
+        await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+async def run_refresh_token_sweeper(interval: float = REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS):
+    """Фоновая задача приложения: периодически чистит таблицу refresh_tokens."""
+    while True:
+        try:
+            async with database.new_session() as db:
+                await delete_expired_refresh_tokens(db)
+        except Exception:
+            logger.exception("Refresh token sweep failed")
+        await asyncio.sleep(interval)
+
+async def load_current_user(db: AsyncSession, user_id: int) -> CurrentUser | None:
+    user = await database.run_read(db, user_id, partial(get_user_from_db_by_user_id, user_id=user_id))
+    if user is None:
+        return None
+    current_user = CurrentUser(id=user.id, username=user.username)
+    user_cache.set(user.id, current_user)
+    return current_user
+
+async def get_current_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: AsyncSession = Depends(database.get_db)
+) -> CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Подпись проверяется при первом предъявлении токена, дальше claims берутся из кеша
+        payload = decode_token(token)
         # Закладываем не username, а id пользователя
         user_id: int = int(payload.get("sub"))
         if user_id is None:
@@ -95,9 +187,23 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Se
         token_data = TokenData(user_id=user_id)
     except InvalidTokenError:
         raise credentials_exception
-    user = get_user_from_db_by_user_id(db, user_id=token_data.user_id)
-    if user is None:
+
+    if AUTH_TRUST_TOKEN_CLAIMS:
+        return CurrentUser(id=token_data.user_id)
+
+    current_user = user_cache.get(token_data.user_id)
+    if current_user is not None:
+        return current_user
+
+    # Одновременные запросы одного пользователя с пустым кешем ждут один запрос в users
+    current_user = await user_lookups.do(token_data.user_id, partial(load_current_user, db, token_data.user_id))
+    if current_user is None:
         raise credentials_exception
+    return current_user
+
+async def get_rate_limited_user(user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    """get_current_user с ограничением числа запросов на пользователя."""
+    await user_limit.acquire(user.id)
     return user
 
 
@@ -108,17 +214,23 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Se
         description="Регистрируется новый пользователь с использованием username и password",
         response_description="В качестве доказательства регистрации запрос возвращает username пользователя"
     )
-async def register_user(user: UserIn, db: Session = Depends(database.get_db)):
-    existing_user = db.query(database.User).filter(database.User.username == user.username).first()
-    if existing_user:
+async def register_user(request: Request, user: UserIn, db: AsyncSession = Depends(database.get_db)):
+    # Лимит проверяем до bcrypt: хеширование — самая дорогая часть запроса
+    await register_ip_limit.acquire(client_ip(request))
+    hashed_password = await get_password_hash_async(user.password)
+    # Уникальность username проверяет сама база: без отдельного SELECT и без гонки между ним и INSERT
+    try:
+        username = await db.scalar(
+            insert(database.User)
+            .values(username=user.username, hashed_password=hashed_password)
+            .returning(database.User.username)
+        )
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Username already exists")
-    
-    user_db = database.User(username=user.username, hashed_password=get_password_hash(user.password))
-    db.add(user_db)
-    db.commit()
-    db.refresh(user_db)
 
-    return {"username": user_db.username}
+    return {"username": username}
 
 @router.post(
         "/token",
@@ -127,27 +239,37 @@ async def register_user(user: UserIn, db: Session = Depends(database.get_db)):
         response_model=RefreshToken,
     )
 async def login_for_access_token(
+    request: Request,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ) -> RefreshToken:
-    user = authenticate_user(db, form_data.username, form_data.password)
+    # Перебор паролей отсекаем до bcrypt: и частые попытки с одного адреса,
+    # и исчерпанный лимит неудачных попыток для username. Попытку под username списываем
+    # до проверки пароля, чтобы параллельные запросы не прошли её все разом, а удачный вход возвращаем
+    await login_ip_limit.acquire(client_ip(request))
+    await login_username_limit.acquire(form_data.username)
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except Exception:
+        # Пароль не проверен (например, очередь bcrypt переполнена): попытка не считается
+        await login_username_limit.refund(form_data.username)
+        raise
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    await login_username_limit.refund(form_data.username)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     # Закладываем не username, а id пользователя
     access_token = create_access_token(
         data={"sub": str(user.id)}, expires_delta=access_token_expires
     )
-    refresh_token, refresh_exp = create_refresh_token(user_id=user.id)
 
-    # Сохраняем refresh_token в базе
-    if not db.query(database.RefreshToken).filter(database.RefreshToken.token == refresh_token).first():
-        db.add(database.RefreshToken(user_id=user.id, token=refresh_token, expires_at=refresh_exp))
-        db.commit()
+    # Сохраняем дайджест refresh_token в базе
+    refresh_token = await issue_refresh_token(db, user.id)
+    await db.commit()
 
     return RefreshToken(refresh_token=refresh_token, access_token=access_token, token_type="bearer")
 
@@ -157,29 +279,46 @@ class RefreshTokenRequest(BaseModel):
 @router.post(
         "/auth/refresh",
         summary="Обновление access_token",
-        description="Отправляя действующий refresh_token, вы получаете новый access_token",
-        response_model=AccessToken,
+        description="Отправляя действующий refresh_token, вы получаете новый access_token и новый refresh_token. "
+                    "Использованный refresh_token больше недействителен.",
+        response_model=RefreshToken,
     )
-async def refresh_access_token(refresh_token: RefreshTokenRequest, db: Session = Depends(database.get_db)):
+async def refresh_access_token(refresh_token: RefreshTokenRequest, db: AsyncSession = Depends(database.get_db)):
     try:
-        payload = jwt.decode(refresh_token.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+        # refresh_token одноразовый: кешировать его проверку незачем
+        payload = decode_token(refresh_token.refresh_token, use_cache=False)
         user_id = int(payload.get("sub"))
-        if not user_id:
+        jti = payload.get("jti")
+        if not user_id or not jti:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-        # Проверяем, есть ли такой refresh_token в базе данных
-        refresh_token_record = db.query(database.RefreshToken).filter(
-            database.RefreshToken.token == refresh_token.refresh_token,
-            database.RefreshToken.expires_at > datetime.now()
-        ).first()
-        if not refresh_token_record:
+        # Уже отозванный токен отклоняем, не обращаясь к базе
+        if jti in revoked_tokens:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token")
+
+        # Ротация: старый токен удаляется тем же запросом, которым проверяется.
+        # Из двух одновременных обновлений одним токеном пройдёт только одно
+        record = (await db.execute(
+            delete(database.RefreshToken)
+            .where(database.RefreshToken.jti == jti, database.RefreshToken.expires_at > datetime.now())
+            .returning(database.RefreshToken.token_hash, database.RefreshToken.user_id)
+        )).one_or_none()
+        if (
+            not record
+            or record.user_id != user_id
+            or not hmac.compare_digest(record.token_hash, hash_refresh_token(refresh_token.refresh_token))
+        ):
+            await db.rollback()
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token")
 
-        # Генерируем новый access_token
+        # Генерируем новую пару токенов
+        new_refresh_token = await issue_refresh_token(db, user_id)
+        await db.commit()
+        revoke_in_cache(jti, payload["exp"])
+
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(data={"sub": str(user_id)}, expires_delta=access_token_expires)
-        print(f"New access token: {access_token}")
-        return AccessToken(access_token=access_token, token_type="bearer")
+        return RefreshToken(refresh_token=new_refresh_token, access_token=access_token, token_type="bearer")
 
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired")
@@ -193,10 +332,17 @@ async def refresh_access_token(refresh_token: RefreshTokenRequest, db: Session =
     )
 async def logout(
     refresh_token: RefreshTokenRequest,
-    db: Session = Depends(database.get_db),
+    db: AsyncSession = Depends(database.get_db),
 ):
-    token_record = db.query(database.RefreshToken).filter(database.RefreshToken.token == refresh_token.refresh_token).first()
-    if token_record:
-        db.delete(token_record)
-        db.commit()
+    try:
+        payload = decode_token(refresh_token.refresh_token, use_cache=False)
+    except InvalidTokenError:
+        # Истёкший или чужой токен и так не даст войти
+        return {"detail": "Successfully logged out"}
+
+    jti = payload.get("jti")
+    if jti:
+        await db.execute(delete(database.RefreshToken).where(database.RefreshToken.jti == jti))
+        await db.commit()
+        revoke_in_cache(jti, payload["exp"])
     return {"detail": "Successfully logged out"}
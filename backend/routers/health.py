@@ -0,0 +1,41 @@
+import logging
+import time
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+import database
+from schemas import DatabaseHealth
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get(
+        "/health/db",
+        response_model=DatabaseHealth,
+        response_model_exclude_none=True,
+        summary="Состояние базы данных",
+        description="Загрузка пула соединений и время получения соединения и SELECT 1. "
+                    "Если база недоступна, возвращает 503.",
+        responses={503: {"model": DatabaseHealth}},
+    )
+async def database_health():
+    started = time.perf_counter()
+    try:
+        async with database.get_engine().connect() as conn:
+            acquired = time.perf_counter()
+            await conn.execute(text("SELECT 1"))
+            finished = time.perf_counter()
+    except Exception:
+        logger.exception("Database health check failed")
+        health = DatabaseHealth(status="unavailable", **database.pool_status())
+        return JSONResponse(status_code=503, content=health.model_dump(exclude_none=True))
+
+    # Состояние пула снимаем после возврата соединения, чтобы не учитывать сам проверочный запрос
+    return DatabaseHealth(
+        status="ok",
+        acquire_ms=round((acquired - started) * 1000, 3),
+        query_ms=round((finished - acquired) * 1000, 3),
+        **database.pool_status(),
+    )
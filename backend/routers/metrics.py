@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+import database
+from metrics import Gauge, registry
+from settings import get_settings
+
+# /metrics отдаёт внутреннее устройство сервиса; закройте его на прокси или отключите
+METRICS_ENABLED = get_settings().metrics_enabled
+
+registry.register(Gauge(
+    "db_pool_checked_out", "Соединений пула выдано запросам",
+    lambda: database.pool_status().get("checked_out"),
+))
+registry.register(Gauge(
+    "db_pool_idle", "Соединений простаивает в пуле",
+    lambda: database.pool_status().get("idle"),
+))
+registry.register(Gauge(
+    "db_replicas_available", "Реплик для чтения, не исключённых после ошибок",
+    lambda: database.get_replicas().available(),
+))
+
+router = APIRouter()
+
+@router.get(
+        "/metrics",
+        response_class=PlainTextResponse,
+        summary="Метрики Prometheus",
+        description="Гистограммы времени запросов по маршрутам, числа SQL-запросов и загрузка пула соединений "
+                    "в текстовом формате Prometheus.",
+        include_in_schema=False,
+    )
+async def prometheus_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,60 +1,670 @@
-from fastapi import Depends, APIRouter, Query
-from utils import get_task_or_404
-from schemas import TaskCreate, TaskResponse, TaskUpdate, TaskPut
-from database import get_db, User, Task
-from sqlalchemy.orm import Session
-from routers.auth import get_current_user
+import asyncio
+import codecs
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from functools import partial
+from typing import Literal
+import orjson
+from fastapi import Depends, APIRouter, Query, Request, Response, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from broker import broker, Subscription, RESYNC_EVENT
+from utils import (
+    get_task_or_404, update_task_or_404, encode_cursor, decode_cursor,
+    TASK_COLUMNS, next_task_version, execute_versioned, is_version_conflict, make_etag, etag_matches, query_digest,
+)
+from schemas import (
+    TaskCreate, TaskResponse, TaskUpdate, TaskPut, TaskListItem, TaskCount,
+    TaskBatchRequest, TaskBatchResponse, TaskBatchResult, TaskChanges, TaskImportResult, TaskImportError,
+    TaskSearchResults, TaskStatsResponse,
+)
+import database
+from database import get_db, run_read, Task
+from search import search_tasks, search_terms
+from stats import read_task_stats
+from response_cache import CachedResponse, task_cache
+from cache import SingleFlight
+from sqlalchemy import select, func, insert, update, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from routers.auth import get_current_user, get_rate_limited_user, CurrentUser
+from settings import get_settings
 
-router = APIRouter()
+settings = get_settings()
+STREAM_HEARTBEAT_SECONDS = settings.stream_heartbeat_seconds
+STREAM_MAX_CONNECTIONS_PER_USER = settings.stream_max_connections_per_user
+EXPORT_BATCH_SIZE = settings.export_batch_size
+IMPORT_BATCH_SIZE = settings.import_batch_size
+IMPORT_MAX_LINE_BYTES = settings.import_max_line_bytes
+IMPORT_MAX_ERRORS = 100
+BATCH_MAX_EVENTS = settings.batch_max_events
+CACHE_CONTROL_TASK_LIST = settings.cache_control_task_list
+CACHE_CONTROL_TASK = settings.cache_control_task
+
+logger = logging.getLogger(__name__)
+
+# Чтения задач, которые сейчас выполняются, по ключу кеша ответа
+read_flights = SingleFlight()
+
+# Все запросы к задачам считаются в лимит пользователя; get_current_user вызывается один раз за запрос
+router = APIRouter(dependencies=[Depends(get_rate_limited_user)])
+
+async def publish_task_event(user_id: int, event_type: str, task_id: int, version: int):
+    """
+    Сообщает подключениям пользователя об изменении задачи. Событие короткое:
+    данные клиент забирает сам через /api/tasks/changes или /api/tasks/{id}.
+    """
+    try:
+        await broker.publish(user_id, {"type": event_type, "id": task_id, "version": version})
+    except Exception:
+        # Запись уже зафиксирована, потеря уведомления не должна превращаться в ошибку запроса
+        logger.exception("Failed to publish task event")
+
+async def publish_resync(user_id: int):
+    """Просит подключения пользователя перечитать ленту изменений вместо отдельных событий."""
+    try:
+        await broker.publish(user_id, RESYNC_EVENT)
+    except Exception:
+        logger.exception("Failed to publish task event")
+
+async def tasks_written(user_id: int) -> None:
+    """Вызывается после коммита записи задач пользователя."""
+    # Пока реплики догоняют запись, пользователь читает свои задачи из основной базы
+    database.get_replicas().record_write(user_id)
+    await task_cache.invalidate(user_id)
+
+def cache_headers(etag: str, cache_control: str) -> dict:
+    """Заголовки кеширования ответа чтения; 304 должен нести те же, что и 200."""
+    # Ответ зависит от токена: кеш браузера не должен отдать его другому пользователю
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+
+# Колонки, которые можно запросить через fields=
+TASK_FIELDS = {column.key: column for column in TASK_COLUMNS}
+
+def parse_fields(fields: str | None) -> list:
+    if fields is None:
+        return list(TASK_FIELDS.values())
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - TASK_FIELDS.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    # id нужен всегда: по нему строится курсор
+    names.add("id")
+    return [column for name, column in TASK_FIELDS.items() if name in names]
 
 @router.get(
         "/tasks",
-        response_model=list[TaskResponse],
+        response_model=list[TaskListItem],
+        response_model_exclude_unset=True,
         summary="Получение всех задач",
-        description="Возвращает список всех задач, доступных пользователю."
+        description="Возвращает список задач пользователя, упорядоченный по id. "
+                    "При указании limit отдаёт страницу, а курсор следующей страницы — в заголовке X-Next-Cursor. "
+                    "Ответ снабжён ETag: с If-None-Match неизменившийся список вернётся как 304."
     )
 async def get_tasks(
+    request: Request,
     is_completed: bool | None = Query(
         None,
         description="Фильтр задач по статусу выполнения (True - выполненные, False - невыполненные)"
     ),
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int | None = Query(None, ge=1, le=1000, description="Размер страницы. Без него возвращаются все задачи"),
+    cursor: str | None = Query(None, description="Значение X-Next-Cursor из предыдущего ответа"),
+    order: Literal["asc", "desc"] = Query("asc", description="Порядок сортировки по id"),
+    fields: str | None = Query(None, description="Список полей через запятую, например id,title,is_completed"),
+    if_none_match: str | None = Header(None),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(Task).filter(Task.user_id == user.id)
+    digest = query_digest(request.url.query)
+    query = select(*parse_fields(fields)).where(Task.user_id == user.id, Task.deleted_at.is_(None))
     if is_completed is not None:
-        query = query.filter(Task.is_completed == is_completed)
-    
-    return query.all()
+        query = query.where(Task.is_completed == is_completed)
+    if cursor is not None:
+        last_id = decode_cursor(cursor)
+        query = query.where(Task.id > last_id if order == "asc" else Task.id < last_id)
+    query = query.order_by(Task.id.asc() if order == "asc" else Task.id.desc())
+    if limit is not None:
+        # Лишняя строка показывает, есть ли следующая страница
+        query = query.limit(limit + 1)
+
+    async def read(session: AsyncSession) -> tuple[str, list[dict] | None]:
+        # Любая запись (включая удаление) поднимает max(version), поэтому он годится как версия всего списка.
+        # Запрос читает только индекс (user_id, version)
+        max_version = await session.scalar(select(func.max(Task.version)).where(Task.user_id == user.id))
+        etag = make_etag(max_version or 0, digest)
+        if etag_matches(if_none_match, etag):
+            # Клиенту хватит 304: сам список не читаем
+            return etag, None
+
+        # Выполняем через соединение, минуя ORM-загрузку строк: объекты Task здесь не нужны
+        result = await (await session.connection()).execute(query)
+        keys = list(result.keys())
+        return etag, [dict(zip(keys, row)) for row in result.all()]
+
+    async def load() -> tuple[str, CachedResponse | None]:
+        etag, rows = await run_read(db, user.id, read)
+        if rows is None:
+            return etag, None
+        extra_headers = {}
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            extra_headers["X-Next-Cursor"] = encode_cursor(rows[-1]["id"])
+        # Строки уже содержат только поля TaskListItem нужных типов: сериализуем их сразу через orjson,
+        # без проверки каждой строки через pydantic. response_model остаётся для документации
+        loaded = CachedResponse(orjson.dumps(rows), etag, extra_headers)
+        await task_cache.set(cache_key, loaded)
+        return etag, loaded
+
+    cache_key = await task_cache.key(user.id, "list", digest)
+    cached = await task_cache.get(cache_key, "list")
+    if cached is None:
+        # Одновременные одинаковые запросы (в ключе есть поколение кеша) ждут одно чтение из базы
+        etag, cached = await read_flights.do((cache_key, if_none_match), load)
+        if cached is None:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag, CACHE_CONTROL_TASK_LIST))
+
+    headers = cache_headers(cached.etag, CACHE_CONTROL_TASK_LIST)
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(cached.body, media_type="application/json", headers={**headers, **cached.headers})
+
+@router.get(
+        "/tasks/count",
+        response_model=TaskCount,
+        summary="Количество задач",
+        description="Возвращает количество задач пользователя без загрузки самих задач."
+    )
+async def count_tasks(
+    is_completed: bool | None = Query(
+        None,
+        description="Фильтр задач по статусу выполнения (True - выполненные, False - невыполненные)"
+    ),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    query = select(func.count()).select_from(Task).where(Task.user_id == user.id, Task.deleted_at.is_(None))
+    if is_completed is not None:
+        query = query.where(Task.is_completed == is_completed)
+
+    return TaskCount(count=await db.scalar(query))
+
+@router.get(
+        "/tasks/stats",
+        response_model=TaskStatsResponse,
+        summary="Статистика задач",
+        description="Возвращает количество всех, выполненных и невыполненных задач пользователя. "
+                    "Счётчики обновляются вместе с задачами, поэтому ответ не зависит от числа задач."
+    )
+async def get_task_stats(user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    total, completed = await run_read(db, user.id, partial(read_task_stats, user_id=user.id))
+    return TaskStatsResponse(total=total, completed=completed, pending=total - completed)
 
 @router.post(
         "/tasks",
         status_code=201,
+        response_model=TaskResponse,
         summary="Создание новой задачи",
         description="Создаёт новую задачу и добавляет её в базу данных."
     )
-async def add_task(task: TaskCreate, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    new_task = Task(
-        title=task.title,
-        description=task.description,
-        user_id=user.id  # Привязываем задачу к пользователю
+async def add_task(task: TaskCreate, user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # INSERT ... RETURNING: созданная строка возвращается тем же запросом, без refresh
+    result = await execute_versioned(
+        insert(Task)
+        .values(
+            title=task.title,
+            description=task.description,
+            is_completed=False,
+            version=next_task_version(user.id),
+            user_id=user.id  # Привязываем задачу к пользователю
+        )
+        .returning(*TASK_COLUMNS),
+        db
     )
-    db.add(new_task)
-    db.commit()
-    db.refresh(new_task)
+    new_task = result.mappings().one()
+    await db.commit()
+    await tasks_written(user.id)
+    await publish_task_event(user.id, "created", new_task["id"], new_task["version"])
     
     return new_task
 
+@router.post(
+        "/tasks/batch",
+        response_model=TaskBatchResponse,
+        summary="Пакетное изменение задач",
+        description="Создаёт, обновляет, завершает и удаляет задачи одним запросом в одной транзакции. "
+                    "Для каждой операции возвращается свой статус; id задачи может встречаться в пакете только один раз."
+    )
+async def batch_tasks(
+    batch: TaskBatchRequest,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    results: list[TaskBatchResult | None] = [None] * len(batch.operations)
+    creates, updates, deletes = [], {}, {}
+    for index, operation in enumerate(batch.operations):
+        if operation.op == "create":
+            creates.append(index)
+        elif operation.op == "update":
+            updates[operation.id] = (index, operation.data.model_dump(exclude_unset=True))
+        elif operation.op == "complete":
+            updates[operation.id] = (index, {"is_completed": operation.is_completed})
+        else:
+            deletes[operation.id] = index
+
+    deleted_versions = {}
+    # Версии для всего пакета выделяем одним запросом, дальше каждая строка получает свою
+    version = await db.scalar(select(func.coalesce(func.max(Task.version), 0)).where(Task.user_id == user.id))
+    versions = iter(range(version + 1, version + len(batch.operations) + 1))
+    live = (Task.user_id == user.id, Task.deleted_at.is_(None))
+
+    # Кроме этого, не больше трёх запросов на весь пакет: INSERT, UPDATE и UPDATE-надгробие с RETURNING
+    try:
+        if creates:
+            rows = await db.execute(
+                insert(Task).returning(*TASK_COLUMNS, sort_by_parameter_order=True),
+                [
+                    {
+                        **batch.operations[index].data.model_dump(),
+                        "is_completed": False,
+                        "version": next(versions),
+                        "user_id": user.id,
+                    }
+                    for index in creates
+                ]
+            )
+            for index, row in zip(creates, rows.mappings()):
+                results[index] = TaskBatchResult(index=index, op="create", status=201, task=TaskResponse(**row))
+
+        if updates:
+            # У каждой задачи свой набор полей, поэтому значения подставляются через CASE по id
+            values = {"version": case({task_id: next(versions) for task_id in updates}, value=Task.id)}
+            for name in ("title", "description", "is_completed"):
+                whens = {task_id: data[name] for task_id, (_, data) in updates.items() if name in data}
+                if whens:
+                    values[name] = case(whens, value=Task.id, else_=TASK_FIELDS[name])
+            rows = await db.execute(
+                update(Task).where(Task.id.in_(updates), *live).values(values).returning(*TASK_COLUMNS)
+            )
+            for row in rows.mappings():
+                index, _ = updates[row["id"]]
+                results[index] = TaskBatchResult(
+                    index=index, op=batch.operations[index].op, status=200, task=TaskResponse(**row)
+                )
+
+        if deletes:
+            rows = await db.execute(
+                update(Task)
+                .where(Task.id.in_(deletes), *live)
+                .values(
+                    deleted_at=func.now(),
+                    version=case({task_id: next(versions) for task_id in deletes}, value=Task.id),
+                )
+                .returning(Task.id, Task.version)
+            )
+            for task_id, version in rows:
+                index = deletes[task_id]
+                results[index] = TaskBatchResult(index=index, op="delete", status=204)
+                deleted_versions[task_id] = version
+
+        await db.commit()
+    except IntegrityError as error:
+        await db.rollback()
+        if not is_version_conflict(error):
+            raise
+        # Параллельная запись того же пользователя заняла одну из версий пакета
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Concurrent modification, please retry")
+    await tasks_written(user.id)
+
+    # Операции, которых не коснулся ни один запрос, ссылались на чужую или несуществующую задачу
+    events = []
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = TaskBatchResult(
+                index=index, op=batch.operations[index].op, status=404, detail="Task not found"
+            )
+        elif result.task is not None:
+            event_type = "created" if result.status == 201 else "updated"
+            events.append((event_type, result.task.id, result.task.version))
+        else:
+            task_id = batch.operations[index].id
+            events.append(("deleted", task_id, deleted_versions[task_id]))
+
+    if len(events) > BATCH_MAX_EVENTS:
+        # Каждое событие — отдельный NOTIFY; вместо сотен подряд просим подписчиков перечитать ленту
+        await publish_resync(user.id)
+    else:
+        for event_type, task_id, version in events:
+            await publish_task_event(user.id, event_type, task_id, version)
+    return TaskBatchResponse(results=results)
+
+async def task_event_stream(subscription: Subscription, heartbeat: float):
+    """Server-Sent Events из подписки. Подписка закрывается, когда клиент отключается."""
+    with subscription:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@router.get(
+        "/tasks/stream",
+        summary="Поток изменений задач",
+        description="Server-Sent Events об изменениях задач пользователя: created, updated, deleted с id и version. "
+                    "Событие resync означает, что часть событий потеряна и нужно дочитать /api/tasks/changes.",
+        response_class=StreamingResponse,
+    )
+async def stream_tasks(user: CurrentUser = Depends(get_current_user)):
+    if broker.subscribers(user.id) >= STREAM_MAX_CONNECTIONS_PER_USER:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many open streams")
+
+    return StreamingResponse(
+        task_event_stream(broker.subscribe(user.id), STREAM_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def format_csv_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+async def task_export_stream(db: AsyncSession, user_id: int, export_format: str, batch_size: int):
+    """
+    Выгрузка задач порциями по batch_size строк через серверный курсор: в памяти
+    одновременно не больше одной порции, сколько бы задач ни было.
+    """
+    keys = [column.key for column in TASK_COLUMNS]
+    if export_format == "csv":
+        # Заголовок уходит клиенту ещё до выполнения запроса
+        yield ",".join(keys) + "\r\n"
+
+    query = (
+        select(*TASK_COLUMNS)
+        .where(Task.user_id == user_id, Task.deleted_at.is_(None))
+        .order_by(Task.id)
+        .execution_options(yield_per=batch_size)
+    )
+    try:
+        result = await (await db.connection()).stream(query)
+        async for partition in result.partitions():
+            if export_format == "ndjson":
+                yield b"".join(orjson.dumps(dict(zip(keys, row))) + b"\n" for row in partition)
+            else:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows([format_csv_value(value) for value in row] for row in partition)
+                yield buffer.getvalue()
+    finally:
+        # Сессия из get_db закрывается до отправки тела ответа; поток открыл её заново и закрывает сам
+        await db.close()
+
+@router.get(
+        "/tasks/export",
+        summary="Выгрузка задач",
+        description="Потоково отдаёт все задачи пользователя в формате NDJSON (по объекту на строку) или CSV. "
+                    "Объём памяти на сервере не зависит от количества задач.",
+        response_class=StreamingResponse,
+        responses={200: {"content": {media_type: {} for media_type in EXPORT_FORMATS.values()}}},
+    )
+async def export_tasks(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="Формат выгрузки"),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    return StreamingResponse(
+        task_export_stream(db, user.id, export_format, EXPORT_BATCH_SIZE),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="tasks.{export_format}"'},
+    )
+
+async def iter_body_lines(chunks, max_line_bytes: int):
+    """
+    Режет тело запроса на строки по мере получения, не читая его целиком.
+    Отдаёт пары (строка, её размер в байтах): ограничения импорта считаются в байтах, а не в символах.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = b""
+    try:
+        async for chunk in chunks:
+            buffer += chunk
+            # Байт \n не встречается внутри многобайтных символов UTF-8, поэтому резать можно до декодирования
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield decoder.decode(line + b"\n"), len(line) + 1
+            # Незаконченная строка копится в памяти, поэтому её размер ограничиваем
+            if len(buffer) > max_line_bytes:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Line is too long")
+        line = decoder.decode(buffer, final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be UTF-8 encoded")
+    if line:
+        yield line, len(buffer)
+
+async def iter_import_records(lines, import_format: str, max_record_bytes: int):
+    """Записи файла импорта: (номер первой строки записи, словарь полей или None, текст ошибки или None)."""
+    line_number = 0
+    if import_format == "ndjson":
+        async for line, _ in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                yield line_number, None, "Invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Expected a JSON object"
+                continue
+            yield line_number, record, None
+        return
+
+    # В CSV значение в кавычках может содержать перевод строки: копим строки, пока кавычки не закроются
+    header = None
+    pending, pending_size, quotes, start = [], 0, 0, 0
+    async for line, size in lines:
+        line_number += 1
+        if not pending:
+            if not line.strip():
+                continue
+            start = line_number
+        pending.append(line)
+        pending_size += size
+        quotes += line.count('"')
+        if quotes % 2:
+            if pending_size > max_record_bytes:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unterminated quoted field at line {start}")
+            continue
+        values = next(csv.reader(pending))
+        pending, pending_size, quotes = [], 0, 0
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        yield start, dict(zip(header, values)), None
+    if pending:
+        yield start, None, "Unterminated quoted field"
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" if item["loc"] else item["msg"]
+        for item in error.errors()
+    )
+
+async def copy_task_rows(conn, rows: list[dict]) -> None:
+    """COPY строк в tasks через asyncpg. Нарушение уникальности отдаём как IntegrityError, как при INSERT."""
+    # asyncpg импортируем здесь, как и в broker: с SQLite он не нужен, а импорт удлиняет старт
+    import asyncpg
+
+    raw = await conn.get_raw_connection()
+    try:
+        await raw.driver_connection.copy_records_to_table(
+            Task.__tablename__, columns=list(rows[0]), records=[tuple(row.values()) for row in rows]
+        )
+    except asyncpg.UniqueViolationError as error:
+        raise IntegrityError("COPY tasks", None, error) from error
+
+async def insert_task_chunk(db: AsyncSession, user_id: int, tasks: list[TaskCreate], attempts: int = 3) -> int:
+    """
+    Вставляет порцию задач в отдельной транзакции: в Postgres через COPY, в остальных СУБД
+    через executemany. Версии выделяются на всю порцию, при гонке за версию порция повторяется.
+    """
+    for attempt in range(attempts):
+        version = await db.scalar(select(func.coalesce(func.max(Task.version), 0)).where(Task.user_id == user_id))
+        rows = [
+            {"user_id": user_id, "title": task.title, "description": task.description,
+             "is_completed": False, "version": version + offset}
+            for offset, task in enumerate(tasks, start=1)
+        ]
+        try:
+            conn = await db.connection()
+            if conn.dialect.name == "postgresql":
+                await copy_task_rows(conn, rows)
+            else:
+                await db.execute(insert(Task), rows)
+            await db.commit()
+            await tasks_written(user_id)
+            return len(rows)
+        except IntegrityError as error:
+            await db.rollback()
+            if not is_version_conflict(error):
+                raise
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Concurrent modification, please retry")
+
+@router.post(
+        "/tasks/import",
+        response_model=TaskImportResult,
+        summary="Импорт задач",
+        description="Создаёт задачи из тела запроса в формате NDJSON (объект с title и description на строку) "
+                    "или CSV с заголовком title,description. Тело читается потоково, задачи вставляются порциями, "
+                    "каждая порция фиксируется сразу. Ошибочные записи пропускаются и перечисляются в ответе.",
+        openapi_extra={"requestBody": {"required": True, "content": {
+            media_type: {"schema": {"type": "string"}} for media_type in EXPORT_FORMATS.values()
+        }}},
+    )
+async def import_tasks(
+    request: Request,
+    import_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="Формат файла"),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    result = TaskImportResult(imported=0, failed=0, errors=[])
+    chunk: list[TaskCreate] = []
+    lines = iter_body_lines(request.stream(), IMPORT_MAX_LINE_BYTES)
+    async for line, record, error in iter_import_records(lines, import_format, IMPORT_MAX_LINE_BYTES):
+        if error is None:
+            try:
+                chunk.append(TaskCreate.model_validate(record))
+            except ValidationError as validation_error:
+                error = format_validation_error(validation_error)
+        if error is not None:
+            result.failed += 1
+            if len(result.errors) < IMPORT_MAX_ERRORS:
+                result.errors.append(TaskImportError(line=line, detail=error))
+            continue
+        if len(chunk) >= IMPORT_BATCH_SIZE:
+            result.imported += await insert_task_chunk(db, user.id, chunk)
+            chunk = []
+    if chunk:
+        result.imported += await insert_task_chunk(db, user.id, chunk)
+
+    if result.imported:
+        # Событие на каждую задачу завалило бы подписчиков: просим их перечитать ленту изменений
+        await publish_resync(user.id)
+    return result
+
+@router.get(
+        "/tasks/search",
+        response_model=TaskSearchResults,
+        summary="Поиск задач",
+        description="Полнотекстовый поиск по названию и описанию задач пользователя. Находит задачи, "
+                    "содержащие все слова запроса, и возвращает их по убыванию релевантности с фрагментом текста."
+    )
+async def search_user_tasks(
+    q: str = Query(..., min_length=1, max_length=200, description="Слова для поиска"),
+    limit: int = Query(20, ge=1, le=100, description="Размер страницы"),
+    cursor: str | None = Query(None, description="next_cursor из предыдущего ответа"),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    terms = search_terms(q)
+    if not terms:
+        return TaskSearchResults(results=[])
+    offset = decode_cursor(cursor, kind="s") if cursor is not None else 0
+    # Лишняя строка показывает, есть ли следующая страница
+    rows = await search_tasks(db, user.id, terms, limit + 1, offset)
+    next_cursor = encode_cursor(offset + limit, kind="s") if len(rows) > limit else None
+    return TaskSearchResults(results=rows[:limit], next_cursor=next_cursor)
+
+@router.get(
+        "/tasks/changes",
+        response_model=TaskChanges,
+        summary="Лента изменений задач",
+        description="Возвращает задачи, созданные, изменённые или удалённые после since, в порядке изменения. "
+                    "Без since отдаёт изменения с самого начала."
+    )
+async def get_task_changes(
+    since: str | None = Query(None, description="next_since из предыдущего ответа"),
+    limit: int = Query(500, ge=1, le=1000, description="Максимальное количество изменений в ответе"),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    since_version = decode_cursor(since, kind="v") if since is not None else 0
+    result = await db.execute(
+        select(*TASK_COLUMNS, Task.deleted_at.is_not(None).label("deleted"))
+        .where(Task.user_id == user.id, Task.version > since_version)
+        .order_by(Task.version)
+        .limit(limit + 1)
+    )
+    changes = [dict(row) for row in result.mappings()]
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    last_version = changes[-1]["version"] if changes else since_version
+    return TaskChanges(changes=changes, next_since=encode_cursor(last_version, kind="v"), has_more=has_more)
+
 @router.get(
         "/tasks/{task_id}",
         response_model=TaskResponse,
         summary="Получение задачи по ID",
-        description="Возвращает данные задачи по её уникальному идентификатору."
+        description="Возвращает данные задачи по её уникальному идентификатору. "
+                    "Ответ снабжён ETag: с If-None-Match неизменившаяся задача вернётся как 304."
     )
-async def get_one_task(task_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    task = get_task_or_404(task_id, user.id, db)
-    
-    return task
+async def get_one_task(
+    task_id: int,
+    if_none_match: str | None = Header(None),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    async def load() -> CachedResponse:
+        task = await run_read(db, user.id, partial(get_task_or_404, task_id, user.id))
+        loaded = CachedResponse(TaskResponse.model_validate(task).model_dump_json().encode(), make_etag(task.version))
+        await task_cache.set(cache_key, loaded)
+        return loaded
+
+    cache_key = await task_cache.key(user.id, "task", task_id)
+    cached = await task_cache.get(cache_key, "task")
+    if cached is None:
+        cached = await read_flights.do(cache_key, load)
+
+    headers = cache_headers(cached.etag, CACHE_CONTROL_TASK)
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
 
 @router.patch(
         "/tasks/{task_id}",
@@ -65,18 +675,18 @@ async def get_one_task(task_id: int, user: User = Depends(get_current_user), db:
 async def update_task(
     task_id: int,
     task_update: TaskUpdate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    task = get_task_or_404(task_id, user.id, db)
-
     # Обновляем только переданные поля
     update_data = task_update.model_dump(exclude_unset=True)  # Игнорируем не переданные поля
-    for key, value in update_data.items():
-        setattr(task, key, value)
+    if not update_data:
+        return await get_task_or_404(task_id, user.id, db)
 
-    db.commit()
-    db.refresh(task)
+    task = await update_task_or_404(task_id, user.id, update_data, db)
+    await db.commit()
+    await tasks_written(user.id)
+    await publish_task_event(user.id, "updated", task["id"], task["version"])
     return task
 
 @router.put(
@@ -88,18 +698,14 @@ async def update_task(
 async def put_task(
     task_id: int,
     task_data: TaskPut,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    task = get_task_or_404(task_id, user.id, db)
-
     # Полное обновление всех полей
-    task.title = task_data.title
-    task.description = task_data.description
-    task.is_completed = task_data.is_completed
-
-    db.commit()
-    db.refresh(task)
+    task = await update_task_or_404(task_id, user.id, task_data.model_dump(), db)
+    await db.commit()
+    await tasks_written(user.id)
+    await publish_task_event(user.id, "updated", task["id"], task["version"])
     return task
 
 @router.delete(
@@ -108,9 +714,20 @@ async def put_task(
         summary="Удаление задачи",
         description="Удаляет задачу поеё уникальному идентификатору."
     )
-async def delete_task(task_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    task = get_task_or_404(task_id, user.id, db)
+async def delete_task(task_id: int, user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # Мягкое удаление: надгробие с новой версией попадёт в ленту изменений
+    result = await execute_versioned(
+        update(Task)
+        .where(Task.id == task_id, Task.user_id == user.id, Task.deleted_at.is_(None))
+        .values(deleted_at=func.now(), version=next_task_version(user.id))
+        .returning(Task.id, Task.version),
+        db
+    )
+    deleted = result.one_or_none()
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Task not found")
     
-    db.delete(task)
-    db.commit()
+    await db.commit()
+    await tasks_written(user.id)
+    await publish_task_event(user.id, "deleted", deleted.id, deleted.version)
     return
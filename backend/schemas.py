@@ -1,4 +1,6 @@
-from pydantic import BaseModel, Field, ConfigDict
+from datetime import datetime
+from typing import Annotated, Literal
+from pydantic import BaseModel, Field, ConfigDict, field_validator, model_validator
 
 class TaskBase(BaseModel):
     title: str = Field(..., description="Название задачи")
@@ -12,6 +14,14 @@ class TaskUpdate(BaseModel):
     description: None | str = Field(None, description="Описание задачи")
     is_completed: None | bool = Field(None, description="Выполнена ли задача")
 
+    @field_validator("title", "description", "is_completed")
+    @classmethod
+    def reject_null(cls, value):
+        # Поле можно не передавать, но null в нём означал бы запись NULL в задачу
+        if value is None:
+            raise ValueError("Field may be omitted but not null")
+        return value
+
 class TaskPut(TaskUpdate):
     title: str
     description: str
@@ -20,7 +30,106 @@ class TaskPut(TaskUpdate):
 class TaskResponse(TaskBase):
     id: int
     is_completed: bool
+    version: int = Field(..., description="Версия задачи, растёт при каждом изменении")
+    updated_at: datetime
 
     model_config = ConfigDict(
         from_attributes = True
-    )
\ No newline at end of file
+    )
+
+class TaskListItem(BaseModel):
+    """Элемент списка задач: при проекции через fields= присутствуют только запрошенные поля."""
+    id: int
+    title: None | str = None
+    description: None | str = None
+    is_completed: None | bool = None
+    version: None | int = None
+    updated_at: None | datetime = None
+
+class TaskCount(BaseModel):
+    count: int
+
+class TaskStatsResponse(BaseModel):
+    total: int
+    completed: int
+    pending: int
+
+class TaskBatchCreate(BaseModel):
+    op: Literal["create"]
+    data: TaskCreate
+
+class TaskBatchUpdate(BaseModel):
+    op: Literal["update"]
+    id: int
+    data: TaskUpdate
+
+class TaskBatchComplete(BaseModel):
+    op: Literal["complete"]
+    id: int
+    is_completed: bool = Field(True, description="Новый статус задачи")
+
+class TaskBatchDelete(BaseModel):
+    op: Literal["delete"]
+    id: int
+
+TaskBatchOperation = Annotated[
+    TaskBatchCreate | TaskBatchUpdate | TaskBatchComplete | TaskBatchDelete,
+    Field(discriminator="op")
+]
+
+class TaskBatchRequest(BaseModel):
+    operations: list[TaskBatchOperation] = Field(..., min_length=1, max_length=1000)
+
+    @model_validator(mode="after")
+    def check_unique_ids(self):
+        # Операции над разными задачами не зависят от порядка, поэтому их можно выполнять пачками
+        ids = [operation.id for operation in self.operations if operation.op != "create"]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Each task id may appear only once per batch")
+        return self
+
+class TaskBatchResult(BaseModel):
+    index: int = Field(..., description="Номер операции в запросе")
+    op: str
+    status: int = Field(..., description="HTTP-статус, который вернул бы одиночный запрос")
+    task: None | TaskResponse = None
+    detail: None | str = None
+
+class TaskBatchResponse(BaseModel):
+    results: list[TaskBatchResult]
+
+class TaskChange(TaskResponse):
+    deleted: bool = Field(..., description="Задача удалена, клиенту нужно убрать её у себя")
+
+class TaskChanges(BaseModel):
+    changes: list[TaskChange]
+    next_since: str = Field(..., description="Передайте в since при следующем запросе")
+    has_more: bool = Field(..., description="Изменений больше, чем limit: запросите следующую порцию сразу")
+
+class TaskSearchHit(TaskResponse):
+    rank: float = Field(..., description="Релевантность, больше — лучше. Сравнима только внутри одного запроса")
+    snippet: str = Field(..., description="Фрагмент текста, найденные слова обёрнуты в <mark>; HTML экранирован")
+
+class TaskSearchResults(BaseModel):
+    results: list[TaskSearchHit]
+    next_cursor: None | str = Field(None, description="Передайте в cursor, чтобы получить следующую страницу")
+
+class TaskImportError(BaseModel):
+    line: int = Field(..., description="Номер строки файла, с которой начинается запись")
+    detail: str
+
+class TaskImportResult(BaseModel):
+    imported: int = Field(..., description="Сколько задач создано")
+    failed: int = Field(..., description="Сколько записей отклонено")
+    errors: list[TaskImportError] = Field(..., description="Ошибки по записям, не больше первых 100")
+
+class DatabaseHealth(BaseModel):
+    status: Literal["ok", "unavailable"]
+    pool: str = Field(..., description="Класс пула соединений")
+    size: None | int = Field(None, description="Постоянных соединений в пуле")
+    checked_out: None | int = Field(None, description="Соединений выдано запросам")
+    idle: None | int = Field(None, description="Открытых соединений простаивает в пуле")
+    overflow: None | int = Field(None, description="Открыто сверх size")
+    max_overflow: None | int = None
+    acquire_ms: None | float = Field(None, description="Сколько проверочный запрос ждал соединение из пула")
+    query_ms: None | float = Field(None, description="Время SELECT 1")
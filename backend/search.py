@@ -0,0 +1,91 @@
+import html
+import re
+
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import column, table
+
+from database import Task
+from utils import TASK_COLUMNS
+
+# Сколько слов вокруг совпадения попадает во фрагмент
+SNIPPET_WORDS = 12
+
+# Совпадения размечаем символами из области частного использования, потом экранируем текст
+# и заменяем их на <mark>: так фрагмент безопасно вставлять в HTML
+_MARK_START, _MARK_END = "\ue000", "\ue001"
+
+tasks_fts = table("tasks_fts", column("rowid"))
+# Конфигурация без стемминга: в задачах вперемешку русский и английский.
+# Та же конфигурация зашита в колонку tasks.search_vector (миграция 0005)
+_TS_CONFIG = literal_column("'simple'::regconfig")
+
+
+def search_terms(query: str) -> list[str]:
+    """Слова запроса. Операторы языков запросов СУБД не поддерживаем: все слова должны найтись."""
+    return re.findall(r"\w+", query.lower())
+
+
+def highlight(snippet: str | None) -> str:
+    if not snippet:
+        return ""
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _postgres_query(user_id: int, terms: list[str], limit: int, offset: int):
+    query = func.plainto_tsquery(_TS_CONFIG, " ".join(terms))
+    search_vector = literal_column("tasks.search_vector")
+    rank = func.ts_rank_cd(search_vector, query)
+    # Сначала выбираем страницу по GIN-индексу, ts_headline считаем только для неё: он перечитывает текст
+    page = (
+        select(Task.id, rank.label("rank"))
+        .where(Task.user_id == user_id, Task.deleted_at.is_(None), search_vector.op("@@")(query))
+        .order_by(rank.desc(), Task.id)
+        .limit(limit)
+        .offset(offset)
+        .subquery()
+    )
+    document = func.coalesce(Task.title, "") + " " + func.coalesce(Task.description, "")
+    snippet = func.ts_headline(
+        _TS_CONFIG, document, query,
+        f"StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=3",
+    )
+    return (
+        select(*TASK_COLUMNS, page.c.rank, snippet.label("snippet"))
+        .join(page, page.c.id == Task.id)
+        .order_by(page.c.rank.desc(), Task.id)
+    )
+
+
+def _sqlite_query(user_id: int, terms: list[str], limit: int, offset: int):
+    fts = literal_column("tasks_fts")
+    # Каждое слово в кавычках: FTS5 не станет разбирать его как оператор
+    match = " ".join(f'"{term}"' for term in terms)
+    # bm25 тем меньше, чем лучше совпадение; наружу отдаём ранг, где больше — лучше
+    rank = -func.bm25(fts)
+    # Фрагменты названия и описания склеиваем, как в Postgres, где фрагмент берётся из title || description
+    snippet = func.snippet(fts, 0, _MARK_START, _MARK_END, "…", SNIPPET_WORDS).concat(" ").concat(
+        func.snippet(fts, 1, _MARK_START, _MARK_END, "…", SNIPPET_WORDS)
+    )
+    return (
+        select(*TASK_COLUMNS, rank.label("rank"), snippet.label("snippet"))
+        .select_from(tasks_fts)
+        .join(Task, Task.id == tasks_fts.c.rowid)
+        .where(fts.op("MATCH")(match), Task.user_id == user_id, Task.deleted_at.is_(None))
+        .order_by(rank.desc(), Task.id)
+        .limit(limit)
+        .offset(offset)
+    )
+
+
+async def search_tasks(db: AsyncSession, user_id: int, terms: list[str], limit: int, offset: int) -> list[dict]:
+    """Задачи пользователя, содержащие все слова, от лучшего совпадения к худшему."""
+    conn = await db.connection()
+    build = _postgres_query if conn.dialect.name == "postgresql" else _sqlite_query
+    result = await conn.execute(build(user_id, terms, limit, offset))
+    rows = []
+    for row in result.mappings():
+        row = dict(row)
+        row["snippet"] = highlight(row["snippet"])
+        rows.append(row)
+    return rows
@@ -0,0 +1,210 @@
+import logging
+import os
+from dataclasses import dataclass, fields
+from functools import lru_cache
+
+# База для локального запуска без .env. Только с DEV_MODE=true: на хостинге этот файл
+# живёт в эфемерной файловой системе и пропадает при каждом деплое
+DEFAULT_DATABASE_URL = "sqlite:///./db/todo.db"
+
+logger = logging.getLogger(__name__)
+
+
+def parse_env_value(type_, raw: str):
+    """Значение переменной окружения в типе поля Settings. None — оставить значение по умолчанию."""
+    if type_ == tuple[str, ...]:
+        # Списки через запятую; пустая строка — пустой список
+        return tuple(item.strip() for item in raw.split(",") if item.strip())
+    if not raw:
+        return None
+    if type_ is bool:
+        return raw.lower() in ("1", "true", "yes")
+    if type_ in (int, float):
+        return type_(raw)
+    return raw
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Все настройки приложения. Каждое поле читается из переменной окружения с тем же именем
+    в верхнем регистре; .env загружает точка входа (main.py, migrations/env.py) до первого get_settings().
+    Чтение окружения не падает на отсутствующих переменных: обязательные проверяет validate()
+    при старте приложения, с понятным сообщением.
+    """
+
+    # None — ни DATABASE_URL, ни переменные Supabase не заданы
+    database_url: str | None
+    secret_key: str | None = None
+    # Реплики только для чтения; пустой список — все запросы идут в основную базу
+    database_replica_urls: tuple[str, ...] = ()
+    algorithm: str = "HS256"
+    access_token_expire_minutes: int = 30
+    refresh_token_expire_days: int = 7
+    # Создавать таблицы через create_all при старте вместо миграций alembic
+    db_create_all: bool = False
+    # Локальная разработка: без DATABASE_URL приложение запускается на DEFAULT_DATABASE_URL
+    dev_mode: bool = False
+    # kid в заголовке выдаваемых токенов; по нему проверяющая сторона выбирает ключ
+    jwt_key_id: str | None = None
+    # Закрытый ключ PEM для асимметричных алгоритмов (RS256, ES256, EdDSA)
+    jwt_private_key_file: str | None = None
+    # Дополнительные ключи проверки "kid=путь,kid=путь", например прежние ключи при ротации
+    jwt_verify_keys: str = ""
+    # Прокси, которым uvicorn доверяет X-Forwarded-For (его собственная переменная окружения)
+    forwarded_allow_ips: str = "127.0.0.1"
+
+    # Стоимость bcrypt (log2 числа раундов). Повышение делает хеши надёжнее, но дороже по CPU
+    bcrypt_rounds: int = 12
+    # Сколько хешей считается параллельно и сколько запросов может ждать в очереди
+    password_hash_workers: int = 2
+    password_hash_queue_limit: int = 32
+
+    # Кеш пользователей для get_current_user, чтобы не ходить в users на каждый запрос
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: float = 60
+    # Доверять claims access_token без запроса в базу до истечения токена.
+    # Удалённый пользователь сохранит доступ, пока не истечёт его access_token
+    auth_trust_token_claims: bool = False
+    # Отозванные refresh-токены (jti) помним в процессе, чтобы отклонять их без запроса в базу
+    revoked_token_cache_size: int = 10000
+    # Фоновая очистка истёкших refresh-токенов
+    refresh_token_sweep_interval_seconds: float = 3600
+    refresh_token_sweep_batch_size: int = 1000
+    # Проверенные access-токены: дайджест токена -> claims. Повторно предъявленный токен
+    # не проходит заново разбор и проверку подписи. Запись живёт не дольше самого токена
+    jwt_cache_size: int = 10000
+    jwt_cache_ttl_seconds: float = 300
+
+    # Настройки пула соединений. Для SQLite (NullPool) не применяются
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    # Удалённый Postgres и pgbouncer закрывают простаивающие соединения, пересоздаём их заранее
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Сколько соединений открыть при старте, чтобы первые запросы не ждали TLS-рукопожатия
+    db_pool_warmup: int = 2
+    # pgbouncer в режиме transaction pooling не поддерживает именованные prepared statements
+    db_pgbouncer: bool = False
+    # Сколько секунд после записи пользователь читает из основной базы: дольше, чем обычно отстают реплики
+    db_replica_sticky_seconds: float = 5
+    # На сколько секунд реплика с ошибкой соединения исключается из выдачи
+    db_replica_retry_seconds: float = 30
+
+    rate_limit_enabled: bool = True
+    # Где хранить бакеты: memory — в процессе, при нескольких воркерах у каждого свои лимиты
+    rate_limit_store_url: str = "memory"
+    # Сколько бакетов помнит процесс. Давно не использованные вытесняются и начинаются заново полными
+    rate_limit_store_size: int = 100000
+    # Лимиты в виде "запросов/секунд": столько запросов можно сделать подряд,
+    # после чего они восстанавливаются равномерно за указанное число секунд
+    rate_limit_login_ip: str = "20/60"
+    # Неудачные попытки входа под одним username, с любых адресов
+    rate_limit_login_username: str = "5/300"
+    rate_limit_register_ip: str = "10/3600"
+    # Запросы к задачам одного пользователя
+    rate_limit_user: str = "300/60"
+
+    # Где хранить ответы: memory — в процессе. При нескольких воркерах запись в одном воркере
+    # не сбрасывает кеш другого, и тот может отдавать старый список до истечения TTL
+    task_cache_url: str = "memory"
+    # Сколько ответов помнит процесс. 0 отключает кеш
+    task_cache_size: int = 10000
+    task_cache_ttl_seconds: float = 60
+    # Сколько поколений пользователей помнит процесс. Поколения нужны не только кешу: по ним
+    # различаются ключи объединения одновременных чтений, поэтому они ведутся и при TASK_CACHE_SIZE=0
+    task_cache_generations_size: int = 100000
+    # Большие списки не кешируем: десяток таких ответов занял бы больше памяти, чем весь остальной кеш
+    task_cache_max_entry_bytes: int = 256 * 1024
+    # Cache-Control ответов чтения, отдельно для списка и для одной задачи.
+    # private запрещает хранить ответ общим кешам (прокси, CDN), no-cache — отдавать без сверки ETag
+    cache_control_task_list: str = "private, no-cache"
+    cache_control_task: str = "private, no-cache"
+
+    # Поддерживаемые кодировки в порядке предпочтения сервера. Пустая строка отключает сжатие
+    compression_encodings: tuple[str, ...] = ("br", "gzip")
+    # Ответы меньше этого размера отдаются как есть: заголовки gzip и время на сжатие их не окупают
+    compression_min_size: int = 500
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+
+    # /metrics отдаёт внутреннее устройство сервиса; закройте его на прокси или отключите
+    metrics_enabled: bool = True
+    # Запросы к базе дольше этого порога попадают в лог вместе с текстом SQL. 0 — не логировать
+    slow_query_ms: float = 0
+
+    # Откуда брать события: memory — только этот процесс, postgresql://... — общий канал через LISTEN/NOTIFY
+    broker_url: str = "memory"
+    # Сколько событий может ждать отправки одному подключению. При переполнении клиент получает resync
+    stream_queue_size: int = 100
+    # Раз в сколько секунд слать комментарий в простаивающий поток, чтобы прокси не закрывали соединение
+    stream_heartbeat_seconds: float = 15
+    stream_max_connections_per_user: int = 5
+    # Слушающее соединение PostgresBroker: как часто проверять, живо ли оно, и с какой паузы
+    # начинать переподключение (пауза удваивается до BROKER_RECONNECT_MAX_SECONDS)
+    broker_healthcheck_seconds: float = 30
+    broker_reconnect_seconds: float = 1
+    broker_reconnect_max_seconds: float = 30
+    # Пакет, изменивший больше задач, публикует одно событие resync вместо события на каждую задачу
+    batch_max_events: int = 20
+
+    # Сколько строк выгрузки читать из курсора за раз
+    export_batch_size: int = 1000
+    # Импорт: сколько задач вставлять за раз и предельная длина одной записи файла
+    import_batch_size: int = 1000
+    import_max_line_bytes: int = 1024 * 1024
+
+    # Как часто сверять счётчики task_stats с самими задачами. 0 отключает сверку
+    task_stats_reconcile_interval_seconds: float = 86400
+    # Сколько пользователей сверять в одной транзакции
+    task_stats_reconcile_batch_size: int = 1000
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        values = {}
+        for field in fields(cls):
+            raw = os.getenv(field.name.upper())
+            if field.name != "database_url" and raw is not None:
+                value = parse_env_value(field.type, raw)
+                if value is not None:
+                    values[field.name] = value
+        return cls(database_url=database_url_from_env(), **values)
+
+    @property
+    def resolved_database_url(self) -> str:
+        """URL, к которому подключается приложение. Без DATABASE_URL старт остановит validate(), если не DEV_MODE."""
+        return self.database_url or DEFAULT_DATABASE_URL
+
+    @property
+    def jwt_symmetric(self) -> bool:
+        return self.algorithm.startswith("HS")
+
+    def validate(self) -> None:
+        """Отказывается запускать приложение без настроек, без которых оно не может работать."""
+        if self.jwt_symmetric and not self.secret_key:
+            raise RuntimeError("SECRET_KEY is not set: tokens cannot be signed")
+        if not self.jwt_symmetric and not self.jwt_private_key_file:
+            raise RuntimeError(f"JWT_PRIVATE_KEY_FILE is required for {self.algorithm}")
+        if self.database_url is None:
+            if not self.dev_mode:
+                raise RuntimeError("DATABASE_URL is not set; set DEV_MODE=true to run on the local SQLite file")
+            logger.warning("DATABASE_URL is not set, using %s (DEV_MODE)", DEFAULT_DATABASE_URL)
+        if "*" in (host.strip() for host in self.forwarded_allow_ips.split(",")) and not self.dev_mode:
+            # С * uvicorn берёт самый левый адрес X-Forwarded-For, который задаёт сам клиент
+            raise RuntimeError("FORWARDED_ALLOW_IPS=* lets clients pick their own IP for rate limits; list the proxy addresses")
+        if self.access_token_expire_minutes <= 0 or self.refresh_token_expire_days <= 0:
+            raise RuntimeError("ACCESS_TOKEN_EXPIRE_MINUTES and REFRESH_TOKEN_EXPIRE_DAYS must be positive")
+
+
+def database_url_from_env() -> str | None:
+    # Подключение к Supabase задаётся отдельными переменными, остальные базы — через DATABASE_URL
+    user, password, host, port, dbname = (os.getenv(name) for name in ("user", "password", "host", "port", "dbname"))
+    if all([user, password, host, port, dbname]):
+        return f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{dbname}?ssl=require"
+    return os.getenv("DATABASE_URL") or None
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings.from_env()
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+from database import Task, TaskStats, User
+from settings import get_settings
+
+# Сверка счётчиков task_stats с задачами, см. Settings
+TASK_STATS_RECONCILE_INTERVAL_SECONDS = get_settings().task_stats_reconcile_interval_seconds
+TASK_STATS_RECONCILE_BATCH_SIZE = get_settings().task_stats_reconcile_batch_size
+# Сколько раз повторять пачку, строку счётчиков которой успела вставить параллельная запись
+TASK_STATS_RECONCILE_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+async def read_task_stats(db: AsyncSession, user_id: int) -> tuple[int, int]:
+    """Всего задач и выполненных: одна строка по первичному ключу, сколько бы задач ни было."""
+    row = (await db.execute(
+        select(TaskStats.total, TaskStats.completed).where(TaskStats.user_id == user_id)
+    )).first()
+    # Строки нет, пока у пользователя не было ни одной задачи
+    return (row.total, row.completed) if row else (0, 0)
+
+
+async def _reconcile_batch(db: AsyncSession, user_ids: list[int]) -> int:
+    # Блокируем счётчики пачки: записи задач этих пользователей ждут конца транзакции,
+    # и пересчитанные ниже значения не устареют до обновления
+    stored = {
+        row.user_id: (row.total, row.completed)
+        for row in await db.execute(
+            select(TaskStats.user_id, TaskStats.total, TaskStats.completed)
+            .where(TaskStats.user_id.in_(user_ids))
+            .with_for_update()
+        )
+    }
+    actual = {
+        row.user_id: (row.total, row.completed)
+        for row in await db.execute(
+            select(
+                Task.user_id,
+                func.count().label("total"),
+                func.sum(case((Task.is_completed, 1), else_=0)).label("completed"),
+            )
+            .where(Task.user_id.in_(user_ids), Task.deleted_at.is_(None))
+            .group_by(Task.user_id)
+        )
+    }
+    repaired = 0
+    for user_id in user_ids:
+        total, completed = actual.get(user_id, (0, 0))
+        if stored.get(user_id, (0, 0)) == (total, completed):
+            continue
+        if user_id in stored:
+            await db.execute(
+                update(TaskStats).where(TaskStats.user_id == user_id).values(total=total, completed=completed)
+            )
+        else:
+            # Незаблокированную строку может вставить триггер параллельной записи: тогда IntegrityError
+            await db.execute(insert(TaskStats).values(user_id=user_id, total=total, completed=completed))
+        repaired += 1
+    await db.commit()
+    return repaired
+
+
+async def reconcile_task_stats(db: AsyncSession, batch_size: int = TASK_STATS_RECONCILE_BATCH_SIZE) -> int:
+    """
+    Пересчитывает счётчики по задачам пачками пользователей и исправляет расхождения
+    (например, после ручных правок в базе или восстановления без триггеров). Возвращает число исправленных.
+    """
+    repaired = 0
+    last_id = 0
+    while True:
+        user_ids = list(await db.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ))
+        if not user_ids:
+            return repaired
+        last_id = user_ids[-1]
+
+        for attempt in range(1, TASK_STATS_RECONCILE_ATTEMPTS + 1):
+            try:
+                repaired += await _reconcile_batch(db, user_ids)
+                break
+            except IntegrityError:
+                # Строку счётчиков вставила параллельная запись: при повторе она уже будет заблокирована
+                await db.rollback()
+                if attempt == TASK_STATS_RECONCILE_ATTEMPTS:
+                    logger.warning("Skipped task stats of users %d..%d after concurrent inserts", user_ids[0], last_id)
+
+
+async def run_task_stats_reconciler(interval: float = TASK_STATS_RECONCILE_INTERVAL_SECONDS):
+    """Фоновая задача приложения: периодически сверяет счётчики task_stats с задачами."""
+    while True:
+        # Сначала ждём: иначе каждый перезапуск каждого воркера начинался бы с полного пересчёта
+        await asyncio.sleep(interval)
+        try:
+            async with database.new_session() as db:
+                repaired = await reconcile_task_stats(db)
+            if repaired:
+                logger.warning("Repaired task stats of %d users", repaired)
+        except Exception:
+            logger.exception("Task stats reconciliation failed")
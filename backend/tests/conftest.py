@@ -1,16 +1,36 @@
+import asyncio
+import os
+import re
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+# Минимальная стоимость bcrypt, чтобы тесты не тратили время на хеширование
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
 from main import app
 from database import Base, get_db, User
-from routers.auth import get_password_hash
+from routers.auth import get_password_hash, user_cache, revoked_tokens
+from metrics import instrument_engine
+import ratelimit
+from response_cache import task_cache
+from tokens import verified_tokens
 
 # Настройка тестовой базы данных
 SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///./db/test_todo.db"
 engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Приложение работает через async-сессии, поэтому к той же базе подключаемся через aiosqlite.
+# NullPool: TestClient запускает каждый запрос в своём event loop, соединения не переиспользуем
+async_engine = create_async_engine("sqlite+aiosqlite:///./db/test_todo.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+# Считаем SQL-запросы тестовой базы так же, как в приложении: они попадают в Server-Timing
+instrument_engine(async_engine)
+
 class APIClient:
     def __init__(self, client: TestClient, prefix: str = "/api"):
         self.client = client
@@ -53,12 +73,10 @@ def db_session():
 # Переопределяем get_db для использования тестовой базы
 @pytest.fixture(scope="function", autouse=True)
 def override_get_db(db_session):
-    """Переопределяет зависимость get_db для использования фикстуры db_session."""
-    def _override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+    """Переопределяет зависимость get_db для использования тестовой базы."""
+    async def _override_get_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
     app.dependency_overrides[get_db] = _override_get_db
 
 # Автоматическая очистка базы данных
@@ -70,6 +88,13 @@ def clean_database(db_session):
     for table in reversed(Base.metadata.sorted_tables):
         db_session.execute(table.delete())
     db_session.commit()
+    # Кеш пользователей переживает тесты, а id в чистой базе переиспользуются
+    user_cache.clear()
+    revoked_tokens.clear()
+    verified_tokens.clear()
+    # Все запросы TestClient приходят с одного адреса: лимиты не должны копиться между тестами
+    asyncio.run(ratelimit.store.clear())
+    asyncio.run(task_cache.backend.clear())
 
 @pytest.fixture
 def create_test_user():
@@ -97,3 +122,23 @@ def auth_token(client, create_test_user):
 @pytest.fixture
 def access_token(auth_token):
     return auth_token['access_token']
+
+@pytest.fixture
+def sql_statements():
+    """Собирает SQL-запросы, которые приложение отправило в тестовую базу."""
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    yield statements
+    event.remove(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+
+@pytest.fixture
+def query_count():
+    """Количество SQL-запросов, которое приложение сообщило в заголовке Server-Timing."""
+    def _query_count(response) -> int:
+        match = re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response.headers["Server-Timing"])
+        return int(match.group(1))
+    return _query_count
@@ -1,4 +1,7 @@
 from fastapi.testclient import TestClient
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
 import jwt
 import os
 
@@ -128,3 +131,207 @@ def test_logout(client, auth_token):
     response = client.post("/auth/logout", json={"refresh_token": refresh_token})
     assert response.status_code == 200
     assert response.json()["detail"] == "Successfully logged out"
+
+def test_refresh_rotates_refresh_token(client, auth_token):
+    old_token = auth_token["refresh_token"]
+    response = client.post("/auth/refresh", json={"refresh_token": old_token})
+    assert response.status_code == 200
+    new_token = response.json()["refresh_token"]
+    assert new_token != old_token
+
+    # Использованный токен повторно не принимается, новый работает
+    assert client.post("/auth/refresh", json={"refresh_token": old_token}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": new_token}).status_code == 200
+
+def test_reused_refresh_token_rejected_after_cache_reset(client, auth_token):
+    import routers.auth
+    old_token = auth_token["refresh_token"]
+    assert client.post("/auth/refresh", json={"refresh_token": old_token}).status_code == 200
+    # Другой процесс не знает об отзыве: отказ должен прийти из базы
+    routers.auth.revoked_tokens.clear()
+    assert client.post("/auth/refresh", json={"refresh_token": old_token}).status_code == 401
+
+def test_refresh_after_logout_rejected(client, auth_token):
+    refresh_token = auth_token["refresh_token"]
+    client.post("/auth/logout", json={"refresh_token": refresh_token})
+    response = client.post("/auth/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == 401
+
+def test_refresh_token_stored_as_hash(client, auth_token, db_session):
+    from database import RefreshToken
+    refresh_token = auth_token["refresh_token"]
+    record = db_session.query(RefreshToken).one()
+    payload = jwt.decode(refresh_token, os.getenv("SECRET_KEY"), algorithms=[os.getenv("ALGORITHM")])
+    assert record.jti == payload["jti"]
+    assert record.token_hash == hashlib.sha256(refresh_token.encode()).hexdigest()
+    assert refresh_token not in (record.jti, record.token_hash)
+
+def test_expired_refresh_tokens_are_swept(client, auth_token, db_session):
+    from database import RefreshToken
+    from routers.auth import delete_expired_refresh_tokens
+    from tests.conftest import TestingAsyncSessionLocal
+    user_id = db_session.query(RefreshToken).one().user_id
+    expired = datetime.now() - timedelta(days=1)
+    for i in range(5):
+        db_session.add(RefreshToken(user_id=user_id, jti=f"expired{i}", token_hash="0" * 64, expires_at=expired))
+    db_session.commit()
+
+    async def sweep():
+        async with TestingAsyncSessionLocal() as db:
+            return await delete_expired_refresh_tokens(db, batch_size=2)
+
+    assert asyncio.run(sweep()) == 5
+    assert db_session.query(RefreshToken).count() == 1
+
+def test_login_rehashes_outdated_password_hash(client, create_test_user, monkeypatch, db_session):
+    import utils
+    from database import User
+    create_test_user(username="testuser", password="testpassword")
+
+    # Повышаем стоимость: старый хеш должен пересчитаться при успешном входе
+    monkeypatch.setattr(utils, "BCRYPT_ROUNDS", 5)
+    response = client.post("/token", data={"username": "testuser", "password": "testpassword"})
+    assert response.status_code == 200
+
+    db_session.expire_all()
+    user = db_session.query(User).filter(User.username == "testuser").first()
+    assert user.hashed_password.startswith("$2b$05$")
+    assert utils.verify_password("testpassword", user.hashed_password)
+
+def test_login_returns_503_when_hash_pool_is_full(client, create_test_user, monkeypatch):
+    import utils
+    create_test_user(username="testuser", password="testpassword")
+
+    monkeypatch.setattr(utils, "_pending_hashes", utils.PASSWORD_HASH_WORKERS + utils.PASSWORD_HASH_QUEUE_LIMIT)
+    response = client.post("/token", data={"username": "testuser", "password": "testpassword"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_current_user_is_cached(client, access_token, monkeypatch):
+    import routers.auth
+    calls = []
+    original = routers.auth.get_user_from_db_by_user_id
+
+    async def counting_lookup(db, user_id):
+        calls.append(user_id)
+        return await original(db, user_id)
+
+    monkeypatch.setattr(routers.auth, "get_user_from_db_by_user_id", counting_lookup)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for _ in range(3):
+        assert client.get("/tasks", headers=headers).status_code == 200
+    assert len(calls) == 1
+
+def test_deleted_user_is_evicted_from_cache(client, access_token, db_session):
+    from database import User, RefreshToken
+    headers = {"Authorization": f"Bearer {access_token}"}
+    assert client.get("/tasks", headers=headers).status_code == 200
+
+    user = db_session.query(User).filter(User.username == "testuser").first()
+    db_session.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
+    db_session.delete(user)
+    db_session.commit()
+
+    response = client.get("/tasks", headers=headers)
+    assert response.status_code == 401
+
+def test_trusted_token_claims_skip_user_lookup(client, access_token, monkeypatch):
+    import routers.auth
+
+    async def failing_lookup(db, user_id):
+        raise AssertionError("users table must not be queried")
+
+    monkeypatch.setattr(routers.auth, "AUTH_TRUST_TOKEN_CLAIMS", True)
+    monkeypatch.setattr(routers.auth, "get_user_from_db_by_user_id", failing_lookup)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    assert client.get("/tasks", headers=headers).status_code == 200
+
+def test_login_throttled_per_username_before_bcrypt(client, create_test_user, monkeypatch):
+    import ratelimit
+    import utils
+    create_test_user(username="testuser", password="testpassword")
+    capacity, _ = ratelimit.parse_rate(ratelimit.RATE_LIMIT_LOGIN_USERNAME)
+    for _ in range(capacity):
+        response = client.post("/token", data={"username": "testuser", "password": "wrong"})
+        assert response.status_code == 401
+
+    async def failing_verify(password, hashed_password):
+        raise AssertionError("bcrypt must not run for throttled logins")
+
+    monkeypatch.setattr(utils, "verify_password_async", failing_verify)
+    monkeypatch.setattr("routers.auth.verify_password_async", failing_verify)
+    # Даже верный пароль не проверяется, пока лимит неудачных попыток не восстановится
+    response = client.post("/token", data={"username": "testuser", "password": "testpassword"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+def test_concurrent_wrong_passwords_are_throttled_per_username(client, create_test_user):
+    import httpx
+    import ratelimit
+    from main import app
+    create_test_user(username="testuser", password="testpassword")
+    capacity, _ = ratelimit.parse_rate(ratelimit.RATE_LIMIT_LOGIN_USERNAME)
+
+    async def fire(requests: int):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test/api") as async_client:
+            return await asyncio.gather(*(
+                async_client.post("/token", data={"username": "testuser", "password": f"wrong{i}"})
+                for i in range(requests)
+            ))
+
+    # Все попытки приходят, пока бакет ещё полон: до bcrypt доходят только capacity из них
+    statuses = sorted(response.status_code for response in asyncio.run(fire(capacity * 3)))
+    assert statuses == [401] * capacity + [429] * capacity * 2
+
+def test_successful_logins_do_not_use_username_limit(client, create_test_user):
+    import ratelimit
+    create_test_user(username="testuser", password="testpassword")
+    capacity, _ = ratelimit.parse_rate(ratelimit.RATE_LIMIT_LOGIN_USERNAME)
+    for _ in range(capacity + 1):
+        response = client.post("/token", data={"username": "testuser", "password": "testpassword"})
+        assert response.status_code == 200
+
+def test_register_throttled_per_ip(client, monkeypatch):
+    import ratelimit
+    monkeypatch.setattr(ratelimit.register_ip_limit, "capacity", 2)
+    for i in range(2):
+        response = client.post("/auth/register", json={"username": f"user{i}", "password": "password123"})
+        assert response.status_code == 201
+    response = client.post("/auth/register", json={"username": "user3", "password": "password123"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+def test_register_throttled_per_forwarded_ip(monkeypatch):
+    import ratelimit
+    from main import app
+    from tests.conftest import APIClient
+    from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+    # Так uvicorn с FORWARDED_ALLOW_IPS подставляет адрес клиента из X-Forwarded-For доверенного прокси;
+    # TestClient подключается с адреса testclient
+    client = APIClient(TestClient(ProxyHeadersMiddleware(app, trusted_hosts="testclient,10.0.0.1")))
+    monkeypatch.setattr(ratelimit.register_ip_limit, "capacity", 1)
+
+    def register(username: str, ip: str):
+        return client.post(
+            "/auth/register", json={"username": username, "password": "password123"},
+            headers={"X-Forwarded-For": ip},
+        )
+
+    assert register("user1", "203.0.113.1").status_code == 201
+    assert register("user2", "203.0.113.1").status_code == 429
+    # У другого клиента за тем же прокси свой бакет
+    assert register("user3", "203.0.113.2").status_code == 201
+    # Записи левее добавил клиент: подменой первого адреса новый бакет не получить
+    assert register("user4", "198.51.100.7, 203.0.113.1").status_code == 429
+    assert register("user5", "198.51.100.8, 203.0.113.1, 10.0.0.1").status_code == 429
+
+def test_task_requests_limited_per_user(client, access_token, monkeypatch):
+    import ratelimit
+    monkeypatch.setattr(ratelimit.user_limit, "capacity", 3)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for _ in range(3):
+        assert client.get("/tasks", headers=headers).status_code == 200
+    response = client.get("/tasks", headers=headers)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
@@ -0,0 +1,149 @@
+import asyncio
+
+from broker import InMemoryBroker, RESYNC_EVENT
+from routers.tasks import task_event_stream
+
+
+def test_broker_fans_out_to_user_subscribers():
+    async def scenario():
+        broker = InMemoryBroker(queue_size=10)
+        first, second, other = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2)
+
+        await broker.publish(1, {"type": "created", "id": 1, "version": 1})
+        assert await first.get() == {"type": "created", "id": 1, "version": 1}
+        assert await second.get() == {"type": "created", "id": 1, "version": 1}
+        assert other.queue.empty()
+
+        for subscription in (first, second, other):
+            subscription.close()
+        assert broker.subscribers(1) == 0
+        assert broker._channels == {}
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_gets_resync_instead_of_growing_queue():
+    async def scenario():
+        broker = InMemoryBroker(queue_size=3)
+        subscription = broker.subscribe(1)
+        for version in range(10):
+            await broker.publish(1, {"type": "updated", "id": 1, "version": version})
+
+        assert subscription.queue.qsize() <= 3
+        assert await subscription.get() == RESYNC_EVENT
+
+    asyncio.run(scenario())
+
+
+def test_task_event_stream_formats_sse_and_unsubscribes():
+    async def scenario():
+        broker = InMemoryBroker()
+        stream = task_event_stream(broker.subscribe(1), heartbeat=0.01)
+
+        assert await anext(stream) == "retry: 3000\n\n"
+        assert await anext(stream) == ": keep-alive\n\n"
+        await broker.publish(1, {"type": "deleted", "id": 5, "version": 7})
+        assert await anext(stream) == 'event: deleted\ndata: {"type": "deleted", "id": 5, "version": 7}\n\n'
+
+        await stream.aclose()
+        assert broker.subscribers(1) == 0
+
+    asyncio.run(scenario())
+
+
+class FakeConnection:
+    """Соединение asyncpg, которое тест может «оборвать»."""
+
+    def __init__(self):
+        self.termination_listeners = []
+        self.listeners = {}
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    async def execute(self, query, *args):
+        if self.closed:
+            raise ConnectionError("connection is closed")
+
+    def drop(self):
+        self.closed = True
+        for callback in self.termination_listeners:
+            callback(self)
+
+    def terminate(self):
+        self.closed = True
+
+    async def close(self):
+        self.closed = True
+
+
+def test_postgres_broker_reconnects_and_resyncs(monkeypatch):
+    import sys
+    import types
+    from broker import PostgresBroker
+
+    connections = []
+    failures = [1]
+
+    async def connect(dsn):
+        if len(connections) == 1 and failures[0]:
+            # Первая попытка переподключения не удаётся: база ещё недоступна
+            failures[0] -= 1
+            raise OSError("connection refused")
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    async def create_pool(dsn, **kwargs):
+        return FakeConnection()
+
+    monkeypatch.setitem(sys.modules, "asyncpg", types.SimpleNamespace(connect=connect, create_pool=create_pool))
+
+    async def scenario():
+        broker = PostgresBroker("postgresql://test", queue_size=10, healthcheck=60, reconnect_delay=0.01)
+        await broker.start()
+        subscription = broker.subscribe(1)
+
+        connections[0].drop()
+        assert await asyncio.wait_for(subscription.get(), timeout=2) == RESYNC_EVENT
+        assert len(connections) == 2
+
+        # Новое соединение слушает канал и раздаёт события
+        connections[1].listeners["task_events"](connections[1], 1, "task_events",
+                                                '{"user_id": 1, "event": {"type": "created", "id": 5, "version": 1}}')
+        assert await subscription.get() == {"type": "created", "id": 5, "version": 1}
+        await broker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_postgres_broker_reconnects_after_failed_healthcheck(monkeypatch):
+    import sys
+    import types
+    from broker import PostgresBroker
+
+    connections = []
+
+    async def connect(dsn):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    async def create_pool(dsn, **kwargs):
+        return FakeConnection()
+
+    monkeypatch.setitem(sys.modules, "asyncpg", types.SimpleNamespace(connect=connect, create_pool=create_pool))
+
+    async def scenario():
+        broker = PostgresBroker("postgresql://test", healthcheck=0.01, reconnect_delay=0.01)
+        await broker.start()
+        subscription = broker.subscribe(1)
+        # Соединение «зависло» без уведомления об обрыве: его находит проверка SELECT 1
+        connections[0].closed = True
+        assert await asyncio.wait_for(subscription.get(), timeout=2) == RESYNC_EVENT
+        assert len(connections) == 2 and not connections[1].closed
+        await broker.stop()
+
+    asyncio.run(scenario())
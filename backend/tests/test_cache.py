@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from cache import SingleFlight
+
+
+def test_single_flight_shares_one_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("key", load) for _ in range(10)))
+        assert results == ["result"] * 10
+        assert len(calls) == 1
+        assert len(flights) == 0
+        # Завершённый вызов не кешируется: следующий выполняется заново
+        await flights.do("key", load)
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_survives_cancelled_waiter():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def load():
+            started.set()
+            await asyncio.sleep(0.01)
+            return "result"
+
+        leader = asyncio.create_task(flights.do("key", load))
+        await started.wait()
+        follower = asyncio.create_task(flights.do("key", load))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "result"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_propagates_errors_and_retries():
+    async def scenario():
+        flights = SingleFlight()
+        attempts = []
+
+        async def load():
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            if len(attempts) == 1:
+                raise RuntimeError("database is down")
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("key", load) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert await flights.do("key", load) == "result"
+        assert len(attempts) == 2
+
+    asyncio.run(scenario())
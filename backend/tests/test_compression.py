@@ -0,0 +1,70 @@
+import asyncio
+import gzip
+
+import brotli
+
+from compression import CompressionMiddleware, choose_encoding
+
+
+def test_choose_encoding_respects_quality_and_server_order():
+    assert choose_encoding("gzip, deflate", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("gzip;q=0, deflate", ["gzip"]) is None
+    assert choose_encoding("*", ["gzip"]) == "gzip"
+    assert choose_encoding("*, gzip;q=0", ["gzip"]) is None
+    assert choose_encoding("", ["gzip"]) is None
+    assert choose_encoding("gzip", []) is None
+
+
+def run_app(app, accept_encoding: str = "gzip", encodings: list[str] = ["gzip"]) -> list[dict]:
+    messages = []
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, encodings=encodings, minimum_size=10)(scope, receive, send))
+    return messages
+
+
+def streaming_app(content_type: bytes, chunks: list[bytes]):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def test_event_stream_is_not_compressed_or_delayed():
+    messages = run_app(streaming_app(b"text/event-stream", [b"data: 1\n\n", b"data: 2\n\n"]))
+    assert messages[0]["type"] == "http.response.start"
+    assert all(name != b"content-encoding" for name, _ in messages[0]["headers"])
+    assert [message["body"] for message in messages[1:]] == [b"data: 1\n\n", b"data: 2\n\n"]
+
+
+def test_streaming_chunks_are_flushed():
+    chunks = [b'{"id": %d}\n' % i * 20 for i in range(3)]
+    messages = run_app(streaming_app(b"application/x-ndjson", chunks))
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    bodies = [message["body"] for message in messages[1:]]
+    # После каждого куска данные уже можно разжать, не дожидаясь конца потока
+    assert all(bodies[:-1])
+    assert gzip.decompress(b"".join(bodies)) == b"".join(chunks)
+
+
+def test_brotli_is_preferred_and_round_trips():
+    body = b'[{"id": 1, "title": "Task"}]' * 50
+    messages = run_app(streaming_app(b"application/json", [body]), "gzip, br", ["br", "gzip"])
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-encoding"] == b"br"
+    assert int(headers[b"content-length"]) == len(messages[1]["body"]) < len(body)
+    assert brotli.decompress(messages[1]["body"]) == body
+
+    chunks = [b'{"id": %d}\n' % i * 20 for i in range(3)]
+    messages = run_app(streaming_app(b"application/x-ndjson", chunks), "br", ["br", "gzip"])
+    assert dict(messages[0]["headers"])[b"content-encoding"] == b"br"
+    assert brotli.decompress(b"".join(message["body"] for message in messages[1:])) == b"".join(chunks)
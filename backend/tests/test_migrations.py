@@ -0,0 +1,57 @@
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+import pytest
+from sqlalchemy import create_engine, text
+
+from database import Base, include_in_migrations
+
+
+def test_migrations_match_models(tmp_path):
+    """Миграции alembic приводят пустую базу ровно к схеме моделей."""
+    db_path = tmp_path / "migrations.db"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", f"sqlite+aiosqlite:///{db_path}")
+    command.upgrade(config, "head")
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        context = MigrationContext.configure(conn, opts={"include_object": include_in_migrations})
+        diff = compare_metadata(context, Base.metadata)
+    engine.dispose()
+    assert diff == []
+
+    command.downgrade(config, "base")
+
+
+def test_upgrade_stamps_schema_created_before_migrations(tmp_path):
+    """База, созданная create_all до миграций, обновляется без ручного alembic stamp."""
+    db_path = tmp_path / "legacy.db"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", f"sqlite+aiosqlite:///{db_path}")
+    # Схема 0001 без таблицы версий — то, что оставила прежняя версия приложения
+    command.upgrade(config, "0001")
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE alembic_version"))
+        conn.execute(text("INSERT INTO users (username, hashed_password) VALUES ('alice', 'hash')"))
+        conn.execute(text("INSERT INTO tasks (title, description, is_completed, user_id) VALUES ('Task', '', 0, 1)"))
+
+    command.upgrade(config, "head")
+    with engine.connect() as conn:
+        assert conn.scalar(text("SELECT version FROM tasks WHERE title = 'Task'")) == 1
+        assert conn.scalar(text("SELECT version_num FROM alembic_version")) == ScriptDirectory.from_config(config).get_current_head()
+    engine.dispose()
+
+
+def test_upgrade_refuses_unversioned_create_all_schema(tmp_path):
+    db_path = tmp_path / "create_all.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", f"sqlite+aiosqlite:///{db_path}")
+    with pytest.raises(RuntimeError, match="alembic stamp"):
+        command.upgrade(config, "head")
@@ -0,0 +1,55 @@
+import asyncio
+
+from ratelimit import InMemoryRateLimitStore
+
+
+def test_bucket_allows_burst_then_reports_wait():
+    async def scenario():
+        store = InMemoryRateLimitStore(maxsize=10)
+        for _ in range(3):
+            assert await store.take("login:alice", capacity=3, rate=1 / 60) == 0
+        wait = await store.take("login:alice", capacity=3, rate=1 / 60)
+        assert 0 < wait <= 60
+        assert await store.wait_time("login:alice", capacity=3, rate=1 / 60) > 0
+        # У другого ключа свой бакет
+        assert await store.take("login:bob", capacity=3, rate=1 / 60) == 0
+
+    asyncio.run(scenario())
+
+
+def test_refund_returns_token_up_to_capacity():
+    async def scenario():
+        store = InMemoryRateLimitStore(maxsize=10)
+        assert await store.take("key", capacity=1, rate=1 / 60) == 0
+        await store.refund("key", capacity=1, rate=1 / 60)
+        await store.refund("key", capacity=1, rate=1 / 60)
+        assert await store.take("key", capacity=1, rate=1 / 60) == 0
+        assert await store.take("key", capacity=1, rate=1 / 60) > 0
+
+    asyncio.run(scenario())
+
+
+def test_bucket_refills_over_time(monkeypatch):
+    import ratelimit
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+
+    async def scenario():
+        store = InMemoryRateLimitStore(maxsize=10)
+        assert await store.take("key", capacity=1, rate=0.5) == 0
+        assert await store.take("key", capacity=1, rate=0.5) == 2
+        now[0] += 2
+        assert await store.take("key", capacity=1, rate=0.5) == 0
+
+    asyncio.run(scenario())
+
+
+def test_store_evicts_least_recently_used_bucket():
+    async def scenario():
+        store = InMemoryRateLimitStore(maxsize=2)
+        for key in ("a", "b", "a", "c"):
+            await store.take(key, capacity=5, rate=1)
+        assert len(store) == 2
+        assert set(store._buckets) == {"a", "c"}
+
+    asyncio.run(scenario())
@@ -0,0 +1,89 @@
+import shutil
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import database
+from database import ReplicaPool
+from metrics import instrument_engine
+
+PRIMARY_PATH = "./db/test_todo.db"
+
+
+def make_replica(path) -> AsyncEngine:
+    replica = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    instrument_engine(replica)
+    return replica
+
+
+@pytest.fixture
+def replica_of_primary(monkeypatch, tmp_path, access_token):
+    """Реплика — снимок основной базы после входа пользователя; дальше она не обновляется."""
+    def _replica_of_primary(**options) -> ReplicaPool:
+        path = tmp_path / "replica.db"
+        shutil.copy(PRIMARY_PATH, path)
+        pool = ReplicaPool([make_replica(path)], **options)
+        monkeypatch.setattr(database, "replicas", pool)
+        return pool
+    return _replica_of_primary
+
+
+def auth_headers(access_token: str) -> dict:
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+def test_reads_go_to_replica(client, access_token, replica_of_primary):
+    replica_of_primary(sticky_seconds=0)
+    headers = auth_headers(access_token)
+    created = client.post("/tasks", json={"title": "Task", "description": "Text"}, headers=headers).json()
+
+    # Задача есть только в основной базе, отстающая реплика её ещё не видит
+    assert client.get("/tasks", headers=headers).json() == []
+    assert client.get(f"/tasks/{created['id']}", headers=headers).status_code == 404
+
+
+def test_user_reads_own_writes_from_primary(client, access_token, replica_of_primary):
+    replica_of_primary(sticky_seconds=60)
+    headers = auth_headers(access_token)
+    created = client.post("/tasks", json={"title": "Task", "description": "Text"}, headers=headers).json()
+
+    assert [task["id"] for task in client.get("/tasks", headers=headers).json()] == [created["id"]]
+    assert client.get(f"/tasks/{created['id']}", headers=headers).json()["title"] == "Task"
+
+
+def test_failed_replica_is_ejected(client, access_token, monkeypatch, tmp_path):
+    # В пустой базе нет таблиц: чтение с реплики падает с OperationalError
+    pool = ReplicaPool([make_replica(tmp_path / "empty.db")], sticky_seconds=0)
+    monkeypatch.setattr(database, "replicas", pool)
+    headers = auth_headers(access_token)
+    client.post("/tasks", json={"title": "Task", "description": "Text"}, headers=headers)
+
+    response = client.get("/tasks", headers=headers)
+    assert response.status_code == 200
+    assert [task["title"] for task in response.json()] == ["Task"]
+    assert pool.choose() is None
+    assert pool.available() == 0
+
+
+def test_replicas_round_robin_and_ejection():
+    pool = ReplicaPool(["a", "b"], sticky_seconds=60, retry_after=60)
+    assert [pool.choose() for _ in range(4)] == ["a", "b", "a", "b"]
+
+    pool.eject("a")
+    assert [pool.choose() for _ in range(3)] == ["b", "b", "b"]
+    pool.record_write(1)
+    assert pool.choose(user_id=1) is None
+    assert pool.choose(user_id=2) == "b"
+
+    pool.retry_after = 0
+    pool.eject("b")
+    # Срок исключения истёк: реплика снова выдаётся
+    assert pool.choose() in ("a", "b")
+
+
+def test_without_replicas_everything_reads_primary():
+    pool = ReplicaPool([])
+    pool.record_write(1)
+    assert pool.choose() is None
+    assert pool.choose(user_id=1) is None
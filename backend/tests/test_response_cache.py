@@ -0,0 +1,56 @@
+import asyncio
+
+from response_cache import CachedResponse, InMemoryResponseCacheBackend, ResponseCache
+
+
+def test_invalidate_moves_user_to_new_generation():
+    async def scenario():
+        cache = ResponseCache(InMemoryResponseCacheBackend(maxsize=10, ttl=60))
+        key = await cache.key(1, "list", "digest")
+        await cache.set(key, CachedResponse(b"[]", 'W/"1"'))
+        assert await cache.get(await cache.key(1, "list", "digest"), "list") is not None
+
+        await cache.invalidate(1)
+        assert await cache.get(await cache.key(1, "list", "digest"), "list") is None
+        # Другого пользователя сброс не касается
+        other = await cache.key(2, "list", "digest")
+        await cache.set(other, CachedResponse(b"[]", 'W/"1"'))
+        await cache.invalidate(1)
+        assert await cache.get(await cache.key(2, "list", "digest"), "list") is not None
+
+    asyncio.run(scenario())
+
+
+def test_evicted_generation_never_reuses_old_number():
+    async def scenario():
+        backend = InMemoryResponseCacheBackend(maxsize=10, ttl=60, generations_size=1)
+        first = await backend.generation(1)
+        await backend.generation(2)  # вытесняет поколение пользователя 1
+        assert await backend.generation(1) != first
+
+    asyncio.run(scenario())
+
+
+def test_large_responses_are_not_cached(monkeypatch):
+    import response_cache
+    monkeypatch.setattr(response_cache, "TASK_CACHE_MAX_ENTRY_BYTES", 4)
+
+    async def scenario():
+        cache = ResponseCache(InMemoryResponseCacheBackend(maxsize=10, ttl=60))
+        key = await cache.key(1, "list")
+        await cache.set(key, CachedResponse(b"[1, 2, 3]", 'W/"1"'))
+        assert await cache.get(key, "list") is None
+
+    asyncio.run(scenario())
+
+
+def test_generations_survive_disabled_cache():
+    async def scenario():
+        cache = ResponseCache(InMemoryResponseCacheBackend(maxsize=0, ttl=60), enabled=False)
+        key = await cache.key(1, "list", "digest")
+        # Ключ стабилен, пока пользователь не писал: по нему объединяются одновременные чтения
+        assert await cache.key(1, "list", "digest") == key
+        await cache.invalidate(1)
+        assert await cache.key(1, "list", "digest") != key
+
+    asyncio.run(scenario())
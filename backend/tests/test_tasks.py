@@ -1,3 +1,8 @@
+import asyncio
+import csv
+import io
+import json
+import pytest
 from fastapi.testclient import TestClient
 
 def test_create_task(client, clean_database, access_token):
@@ -208,3 +213,701 @@ def test_get_tasks_invalid_token(client):
     response = client.get("/tasks", headers=headers)
     assert response.status_code == 401
     assert response.json()["detail"] == "Could not validate credentials"
+
+def test_get_tasks_cursor_pagination(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for i in range(5):
+        client.post("/tasks", json={"title": f"Task {i}", "description": "Description"}, headers=headers)
+
+    titles = []
+    params = {"limit": 2}
+    pages = 0
+    while True:
+        response = client.get("/tasks", params=params, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        titles += [task["title"] for task in response.json()]
+        pages += 1
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert pages == 3
+    assert titles == [f"Task {i}" for i in range(5)]
+
+    response = client.get("/tasks", params={"limit": 2, "order": "desc"}, headers=headers)
+    assert [task["title"] for task in response.json()] == ["Task 4", "Task 3"]
+
+    response = client.get("/tasks", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+
+def test_get_tasks_fields_projection(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    client.post("/tasks", json={"title": "Task 1", "description": "Description 1"}, headers=headers)
+
+    response = client.get("/tasks", params={"fields": "title,is_completed"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [{"id": response.json()[0]["id"], "title": "Task 1", "is_completed": False}]
+
+    response = client.get("/tasks", params={"fields": "title,password"}, headers=headers)
+    assert response.status_code == 400
+
+def test_task_list_matches_single_task_serialization(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    created = client.post("/tasks", json={"title": "Task 1", "description": "Description 1"}, headers=headers).json()
+
+    # Список сериализуется напрямую через orjson, а одна задача — через pydantic: формат должен совпадать
+    assert client.get("/tasks", headers=headers).json() == [created]
+    assert client.get(f"/tasks/{created['id']}", headers=headers).json() == created
+
+def test_count_tasks(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for i in range(3):
+        response = client.post("/tasks", json={"title": f"Task {i}", "description": "Description"}, headers=headers)
+    client.patch(f"/tasks/{response.json()['id']}", json={"is_completed": True}, headers=headers)
+
+    assert client.get("/tasks/count", headers=headers).json() == {"count": 3}
+    assert client.get("/tasks/count", params={"is_completed": True}, headers=headers).json() == {"count": 1}
+
+def test_batch_tasks(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    ids = [
+        client.post("/tasks", json={"title": f"Task {i}", "description": "Description"}, headers=headers).json()["id"]
+        for i in range(3)
+    ]
+
+    response = client.post("/tasks/batch", json={"operations": [
+        {"op": "create", "data": {"title": "New Task", "description": "Created in batch"}},
+        {"op": "update", "id": ids[0], "data": {"title": "Renamed"}},
+        {"op": "complete", "id": ids[1]},
+        {"op": "delete", "id": ids[2]},
+        {"op": "delete", "id": -1},
+        {"op": "create", "data": {"title": "Second New Task", "description": "Created in batch"}},
+    ]}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == [201, 200, 200, 204, 404, 201]
+    assert results[0]["task"]["title"] == "New Task"
+    assert results[5]["task"]["title"] == "Second New Task"
+    assert results[1]["task"]["id"] == ids[0]
+    assert results[1]["task"]["title"] == "Renamed"
+    assert results[1]["task"]["description"] == "Description"
+    assert results[1]["task"]["is_completed"] is False
+    assert results[2]["task"]["is_completed"] is True
+
+    tasks = client.get("/tasks", headers=headers).json()
+    assert [task["title"] for task in tasks] == ["Renamed", "Task 1", "New Task", "Second New Task"]
+
+def test_batch_tasks_rejects_duplicate_ids(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = client.post("/tasks/batch", json={"operations": [
+        {"op": "complete", "id": 1},
+        {"op": "delete", "id": 1},
+    ]}, headers=headers)
+    assert response.status_code == 422
+
+def test_null_fields_are_rejected(client, clean_database, access_token, sql_statements):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    task_id = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()["id"]
+    sql_statements.clear()
+
+    # Поле можно не передавать, но null сразу отклоняется, не доходя до базы
+    for body in ({"is_completed": None}, {"title": None}, {"description": None}):
+        assert client.patch(f"/tasks/{task_id}", json=body, headers=headers).status_code == 422
+        response = client.post("/tasks/batch", json={"operations": [{"op": "update", "id": task_id, "data": body}]}, headers=headers)
+        assert response.status_code == 422
+    assert not any(statement.startswith("UPDATE") for statement in sql_statements)
+
+def test_execute_versioned_retries_only_version_conflicts(clean_database, create_test_user, sql_statements):
+    from fastapi import HTTPException
+    from sqlalchemy import insert
+    from sqlalchemy.exc import IntegrityError
+    from database import Task
+    from tests.conftest import TestingAsyncSessionLocal
+    from utils import execute_versioned
+    user = create_test_user(username="testuser", password="testpassword")
+
+    def insert_task(**values):
+        return insert(Task).values(user_id=user.id, title="Task", description="Description", **values)
+
+    async def scenario():
+        async with TestingAsyncSessionLocal() as db:
+            # NOT NULL не исправится повтором: ошибка выходит сразу, а не 409 после трёх попыток
+            with pytest.raises(IntegrityError):
+                await execute_versioned(insert_task(is_completed=None, version=1), db)
+            await db.execute(insert_task(is_completed=False, version=1))
+            await db.commit()
+            with pytest.raises(HTTPException) as error:
+                await execute_versioned(insert_task(is_completed=False, version=1), db)
+            assert error.value.status_code == 409
+
+    asyncio.run(scenario())
+    assert sum(statement.startswith("INSERT") for statement in sql_statements) == 1 + 1 + 3
+
+def test_task_writes_use_single_query(client, clean_database, access_token, sql_statements):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    # Прогреваем кеш пользователя, чтобы считать только запросы самой операции
+    client.get("/tasks/count", headers=headers)
+    task_id = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()["id"]
+
+    for method, url, body in [
+        ("post", "/tasks", {"title": "Task", "description": "Description"}),
+        ("patch", f"/tasks/{task_id}", {"is_completed": True}),
+        ("put", f"/tasks/{task_id}", {"title": "New", "description": "New", "is_completed": False}),
+        ("delete", f"/tasks/{task_id}", None),
+    ]:
+        sql_statements.clear()
+        kwargs = {"json": body} if body is not None else {}
+        response = getattr(client, method)(url, headers=headers, **kwargs)
+        assert response.status_code < 300
+        assert len(sql_statements) == 1, (method, sql_statements)
+
+    assert client.patch(f"/tasks/{task_id}", json={"title": "Gone"}, headers=headers).status_code == 404
+    assert client.put(
+        f"/tasks/{task_id}", json={"title": "Gone", "description": "Gone", "is_completed": True}, headers=headers
+    ).status_code == 404
+    assert client.delete(f"/tasks/{task_id}", headers=headers).status_code == 404
+
+def test_task_reads_do_not_scale_queries_with_task_count(client, clean_database, access_token, query_count):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers)
+    reads = [("/tasks", {}), ("/tasks", {"limit": 100}), ("/tasks/changes", {}), ("/tasks/count", {})]
+    few = [query_count(client.get(url, params=params, headers=headers)) for url, params in reads]
+
+    client.post("/tasks/batch", json={"operations": [
+        {"op": "create", "data": {"title": f"Task {i}", "description": "Description"}} for i in range(50)
+    ]}, headers=headers)
+    many = [query_count(client.get(url, params=params, headers=headers)) for url, params in reads]
+    assert many == few
+
+def test_task_reads_are_served_from_cache(client, clean_database, access_token, query_count):
+    from response_cache import cache_requests
+    headers = {"Authorization": f"Bearer {access_token}"}
+    task_id = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()["id"]
+    hits_before = cache_requests.value("list", "hit")
+
+    for url in ["/tasks", f"/tasks/{task_id}"]:
+        first = client.get(url, headers=headers)
+        second = client.get(url, headers=headers)
+        assert query_count(first) > 0
+        # Повторное чтение не обращается к базе (пользователь уже в кеше get_current_user)
+        assert query_count(second) == 0
+        assert second.json() == first.json()
+        assert second.headers["ETag"] == first.headers["ETag"]
+        response = client.get(url, headers={**headers, "If-None-Match": first.headers["ETag"]})
+        assert response.status_code == 304
+        assert query_count(response) == 0
+    assert cache_requests.value("list", "hit") == hits_before + 2
+
+    # Фильтр входит в ключ: другой is_completed не получает чужой ответ
+    assert client.get("/tasks", params={"is_completed": True}, headers=headers).json() == []
+
+@pytest.mark.parametrize("cache_size", [10000, 0])
+def test_concurrent_identical_reads_share_one_query(
+    client, clean_database, access_token, sql_statements, monkeypatch, cache_size,
+):
+    import httpx
+    from main import app
+    from routers import tasks
+    from routers.auth import user_cache
+    from response_cache import InMemoryResponseCacheBackend, ResponseCache
+    # Объединение чтений не зависит от того, включён ли кеш ответов (TASK_CACHE_SIZE=0)
+    monkeypatch.setattr(tasks, "task_cache", ResponseCache(
+        InMemoryResponseCacheBackend(maxsize=cache_size, ttl=60), enabled=cache_size > 0,
+    ))
+    headers = {"Authorization": f"Bearer {access_token}"}
+    client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers)
+    user_cache.clear()
+    sql_statements.clear()
+
+    async def fire(requests: int):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test/api") as async_client:
+            return await asyncio.gather(*(
+                async_client.get("/tasks", params={"is_completed": False}, headers=headers) for _ in range(requests)
+            ))
+
+    responses = asyncio.run(fire(10))
+    assert [response.status_code for response in responses] == [200] * 10
+    assert all(response.json() == responses[0].json() for response in responses)
+    # Один запрос пользователя, один max(version) и одно чтение списка на все десять запросов
+    assert sum("FROM users" in statement for statement in sql_statements) == 1
+    assert sum("max(tasks.version)" in statement for statement in sql_statements) == 1
+    assert sum("tasks.deleted_at IS NULL" in statement for statement in sql_statements) == 1
+
+def test_task_writes_invalidate_cached_reads(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    task_id = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()["id"]
+
+    def titles():
+        return [task["title"] for task in client.get("/tasks", headers=headers).json()]
+
+    assert titles() == ["Task"]
+    client.patch(f"/tasks/{task_id}", json={"title": "Patched"}, headers=headers)
+    assert titles() == ["Patched"]
+    assert client.get(f"/tasks/{task_id}", headers=headers).json()["title"] == "Patched"
+    client.put(f"/tasks/{task_id}", json={"title": "Put", "description": "D", "is_completed": True}, headers=headers)
+    assert client.get(f"/tasks/{task_id}", headers=headers).json()["title"] == "Put"
+    assert titles() == ["Put"]
+    client.post("/tasks/batch", json={"operations": [{"op": "create", "data": {"title": "Batch", "description": "D"}}]}, headers=headers)
+    assert titles() == ["Put", "Batch"]
+    client.post("/tasks/import", content=json.dumps({"title": "Imported", "description": "D"}), headers=headers)
+    assert titles() == ["Put", "Batch", "Imported"]
+    client.delete(f"/tasks/{task_id}", headers=headers)
+    assert titles() == ["Batch", "Imported"]
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
+
+def test_task_cache_is_per_user(client, clean_database, access_token, create_test_user):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    task_id = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()["id"]
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 200
+
+    create_test_user(username="other", password="otherpassword")
+    other_token = client.post("/token", data={"username": "other", "password": "otherpassword"}).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {other_token}"}
+    assert client.get("/tasks", headers=other_headers).json() == []
+    assert client.get(f"/tasks/{task_id}", headers=other_headers).status_code == 404
+
+def test_batch_queries_do_not_scale_with_operations(client, clean_database, access_token, query_count):
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    def batch(size):
+        created = client.post("/tasks/batch", json={"operations": [
+            {"op": "create", "data": {"title": f"Task {i}", "description": "Description"}} for i in range(size)
+        ]}, headers=headers).json()["results"]
+        ids = [result["task"]["id"] for result in created]
+        response = client.post("/tasks/batch", json={"operations": [
+            {"op": "update", "id": ids[0], "data": {"title": "Renamed"}},
+            *({"op": "complete", "id": task_id} for task_id in ids[1:size // 2]),
+            *({"op": "delete", "id": task_id} for task_id in ids[size // 2:]),
+        ]}, headers=headers)
+        assert response.status_code == 200
+        return query_count(response)
+
+    assert batch(4) == batch(40)
+
+def test_export_tasks(client, clean_database, access_token, monkeypatch):
+    import routers.tasks
+    # Маленькая порция, чтобы выгрузка прошла через несколько чтений курсора
+    monkeypatch.setattr(routers.tasks, "EXPORT_BATCH_SIZE", 2)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    created = [
+        client.post("/tasks", json={"title": f"Task {i}", "description": "Description, with comma"}, headers=headers).json()
+        for i in range(5)
+    ]
+    client.delete(f"/tasks/{created[4]['id']}", headers=headers)
+    created = created[:4]
+
+    response = client.get("/tasks/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == created
+
+    response = client.get("/tasks/export", params={"format": "csv"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == 'attachment; filename="tasks.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["title"] for row in rows] == [task["title"] for task in created]
+    assert rows[0]["description"] == "Description, with comma"
+    assert rows[0]["is_completed"] == "false"
+
+    assert client.get("/tasks/export", params={"format": "xml"}, headers=headers).status_code == 422
+
+def test_import_tasks_ndjson(client, clean_database, access_token, monkeypatch):
+    import routers.tasks
+    monkeypatch.setattr(routers.tasks, "IMPORT_BATCH_SIZE", 2)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    body = "\n".join([
+        json.dumps({"title": "Task 1", "description": "First"}),
+        "",
+        json.dumps({"title": "Task 2"}),
+        "not json",
+        json.dumps({"title": "Task 3", "description": "Third"}),
+        json.dumps(["Task 4"]),
+        json.dumps({"title": "Задача 5", "description": "Пятая"}),
+    ])
+
+    response = client.post("/tasks/import", content=body.encode(), headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"imported": 3, "failed": 3, "errors": [
+        {"line": 3, "detail": "description: Field required"},
+        {"line": 4, "detail": "Invalid JSON"},
+        {"line": 6, "detail": "Expected a JSON object"},
+    ]}
+
+    tasks = client.get("/tasks", headers=headers).json()
+    assert [task["title"] for task in tasks] == ["Task 1", "Task 3", "Задача 5"]
+    assert len({task["version"] for task in tasks}) == 3
+
+def test_import_line_limit_counts_bytes(client, clean_database, access_token, monkeypatch):
+    import routers.tasks
+    monkeypatch.setattr(routers.tasks, "IMPORT_MAX_LINE_BYTES", 100)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    line = json.dumps({"title": "Задача" * 10, "description": "D"}, ensure_ascii=False)
+    # Символов меньше лимита, байт в UTF-8 больше
+    assert len(line) < 100 < len(line.encode())
+
+    response = client.post("/tasks/import", content=line.encode(), headers=headers)
+    assert response.status_code == 413
+    response = client.post("/tasks/import", params={"format": "csv"}, headers=headers,
+                           content=f'title,description\n"{"Задача" * 5}\n{"Задача" * 5}'.encode())
+    assert response.status_code == 400
+
+    # BOM в начале файла по-прежнему пропускается
+    short = json.dumps({"title": "Задача", "description": "D"}, ensure_ascii=False)
+    response = client.post("/tasks/import", content=b"\xef\xbb\xbf" + short.encode() + b"\n", headers=headers)
+    assert response.json()["imported"] == 1
+    assert [task["title"] for task in client.get("/tasks", headers=headers).json()] == ["Задача"]
+
+def test_import_tasks_csv(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    body = 'title,description,is_completed\r\nTask 1,"Multi\nline, with comma",true\r\nTask 2\r\n\r\n"Task ""3""",Third,false\r\n'
+
+    response = client.post("/tasks/import", params={"format": "csv"}, content=body.encode(), headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"imported": 2, "failed": 1, "errors": [
+        {"line": 4, "detail": "description: Field required"},
+    ]}
+
+    tasks = client.get("/tasks", headers=headers).json()
+    assert [(task["title"], task["description"]) for task in tasks] == [
+        ("Task 1", "Multi\nline, with comma"), ('Task "3"', "Third"),
+    ]
+
+def test_import_round_trips_export(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for i in range(3):
+        client.post("/tasks", json={"title": f"Task {i}", "description": "Description"}, headers=headers)
+    exported = client.get("/tasks/export", params={"format": "csv"}, headers=headers).content
+
+    response = client.post("/tasks/import", params={"format": "csv"}, content=exported, headers=headers)
+    assert response.json()["imported"] == 3
+    assert client.get("/tasks/count", headers=headers).json() == {"count": 6}
+
+def test_search_tasks(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    def create(title, description):
+        return client.post("/tasks", json={"title": title, "description": description}, headers=headers).json()["id"]
+
+    milk = create("Buy milk", "From the <b>store</b> near home")
+    report = create("Write report", "Quarterly report about milk sales, milk prices and milk demand")
+    create("Позвонить маме", "Обсудить выходные")
+    deleted = create("Old milk", "Expired")
+    client.delete(f"/tasks/{deleted}", headers=headers)
+
+    response = client.get("/tasks/search", params={"q": "milk"}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    # Задача, где слово встречается чаще, выше; удалённые не находятся
+    assert [hit["id"] for hit in results] == [report, milk]
+    assert "<mark>milk</mark>" in results[0]["snippet"]
+
+    results = client.get("/tasks/search", params={"q": "MILK store"}, headers=headers).json()["results"]
+    assert [hit["id"] for hit in results] == [milk]
+    # Текст задачи экранируется, размечены только совпадения
+    assert "&lt;b&gt;<mark>store</mark>&lt;/b&gt;" in results[0]["snippet"]
+
+    results = client.get("/tasks/search", params={"q": "выходные"}, headers=headers).json()["results"]
+    assert [hit["title"] for hit in results] == ["Позвонить маме"]
+
+    # Изменённый текст переиндексируется
+    client.patch(f"/tasks/{milk}", json={"title": "Buy bread"}, headers=headers)
+    results = client.get("/tasks/search", params={"q": "bread"}, headers=headers).json()["results"]
+    assert [hit["id"] for hit in results] == [milk]
+
+    assert client.get("/tasks/search", params={"q": '"*) OR'}, headers=headers).json()["results"] == []
+
+def test_search_tasks_pagination_and_isolation(client, clean_database, access_token, create_test_user):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    client.post("/tasks/batch", json={"operations": [
+        {"op": "create", "data": {"title": f"Shared word {i}", "description": "Description"}} for i in range(5)
+    ]}, headers=headers)
+    create_test_user(username="other", password="password")
+    other_token = client.post("/token", data={"username": "other", "password": "password"}).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {other_token}"}
+    client.post("/tasks", json={"title": "Shared word", "description": "Other user"}, headers=other_headers)
+
+    seen, cursor = [], None
+    while True:
+        params = {"q": "shared", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/tasks/search", params=params, headers=headers).json()
+        seen += [hit["id"] for hit in body["results"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 5
+
+    results = client.get("/tasks/search", params={"q": "shared"}, headers=other_headers).json()["results"]
+    assert [hit["description"] for hit in results] == ["Other user"]
+
+def test_task_changes_feed(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    first = client.post("/tasks", json={"title": "Task 1", "description": "Description"}, headers=headers).json()
+    second = client.post("/tasks", json={"title": "Task 2", "description": "Description"}, headers=headers).json()
+
+    response = client.get("/tasks/changes", headers=headers)
+    assert response.status_code == 200
+    feed = response.json()
+    assert [change["id"] for change in feed["changes"]] == [first["id"], second["id"]]
+    assert feed["has_more"] is False
+
+    # Дальше приходят только новые изменения, включая удаление
+    client.patch(f"/tasks/{first['id']}", json={"is_completed": True}, headers=headers)
+    client.delete(f"/tasks/{second['id']}", headers=headers)
+    response = client.get("/tasks/changes", params={"since": feed["next_since"]}, headers=headers)
+    changes = response.json()["changes"]
+    assert [(change["id"], change["deleted"]) for change in changes] == [(first["id"], False), (second["id"], True)]
+    assert changes[0]["is_completed"] is True
+
+    response = client.get("/tasks/changes", params={"since": response.json()["next_since"]}, headers=headers)
+    assert response.json()["changes"] == []
+
+    response = client.get("/tasks/changes", params={"limit": 1}, headers=headers)
+    assert len(response.json()["changes"]) == 1
+    assert response.json()["has_more"] is True
+
+def test_tasks_etag_not_modified(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    task_id = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()["id"]
+
+    for url in ["/tasks", f"/tasks/{task_id}"]:
+        response = client.get(url, headers=headers)
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/"')
+
+        response = client.get(url, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    list_etag = client.get("/tasks", headers=headers).headers["ETag"]
+    task_etag = client.get(f"/tasks/{task_id}", headers=headers).headers["ETag"]
+    # Другой фильтр — другой ETag
+    assert client.get("/tasks", params={"is_completed": True}, headers=headers).headers["ETag"] != list_etag
+
+    client.patch(f"/tasks/{task_id}", json={"title": "Changed"}, headers=headers)
+    assert client.get("/tasks", headers={**headers, "If-None-Match": list_etag}).status_code == 200
+    response = client.get(f"/tasks/{task_id}", headers={**headers, "If-None-Match": task_etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Changed"
+
+def test_read_responses_have_cache_control(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    task_id = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()["id"]
+
+    for url in ["/tasks", f"/tasks/{task_id}"]:
+        response = client.get(url, headers=headers)
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        assert "Authorization" in response.headers["Vary"]
+        # 304 несёт те же заголовки кеширования, что и 200
+        response = client.get(url, headers={**headers, "If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+        assert response.headers["Cache-Control"] == "private, no-cache"
+
+def test_cache_control_configurable_per_route(client, clean_database, access_token, monkeypatch):
+    import routers.tasks
+    monkeypatch.setattr(routers.tasks, "CACHE_CONTROL_TASK", "private, max-age=60")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    task_id = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()["id"]
+    assert client.get(f"/tasks/{task_id}", headers=headers).headers["Cache-Control"] == "private, max-age=60"
+    assert client.get("/tasks", headers=headers).headers["Cache-Control"] == "private, no-cache"
+
+def test_task_list_is_gzip_compressed(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    operations = [{"op": "create", "data": {"title": f"Task {i}", "description": "Description"}} for i in range(50)]
+    client.post("/tasks/batch", json={"operations": operations}, headers=headers)
+
+    response = client.get("/tasks", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert len(response.json()) == 50
+    # По сети ушло в несколько раз меньше байт, чем в разжатом JSON
+    assert response.num_bytes_downloaded * 4 < len(response.content)
+
+    response = client.get("/tasks", headers={**headers, "Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.num_bytes_downloaded == len(response.content)
+
+    # br сервер предпочитает gzip; тело разжимается обратно в тот же список
+    identity = response.content
+    response = client.get("/tasks", headers={**headers, "Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.content == identity
+    assert response.num_bytes_downloaded * 4 < len(identity)
+
+    # 304 после сжатого ответа: слабый ETag не зависит от сжатия
+    etag = client.get("/tasks", headers={**headers, "Accept-Encoding": "gzip"}).headers["ETag"]
+    response = client.get("/tasks", headers={**headers, "Accept-Encoding": "identity", "If-None-Match": etag})
+    assert response.status_code == 304
+
+def test_small_and_streaming_responses_compression(client, clean_database, access_token, monkeypatch):
+    import routers.tasks
+    monkeypatch.setattr(routers.tasks, "EXPORT_BATCH_SIZE", 2)
+    headers = {"Authorization": f"Bearer {access_token}", "Accept-Encoding": "gzip"}
+    task_ids = [client.post("/tasks", json={"title": f"Task {i}", "description": "Description"}, headers=headers).json()["id"] for i in range(20)]
+
+    # Ответ меньше COMPRESSION_MIN_SIZE уходит как есть
+    response = client.get(f"/tasks/{task_ids[0]}", headers=headers)
+    assert "Content-Encoding" not in response.headers
+
+    # Потоковая выгрузка сжимается по кускам и целиком разжимается клиентом
+    response = client.get("/tasks/export", headers=headers)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == task_ids
+
+def test_task_writes_publish_events(client, clean_database, access_token):
+    import jwt
+    from broker import broker
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = int(jwt.decode(access_token, options={"verify_signature": False})["sub"])
+    subscription = broker.subscribe(user_id)
+    try:
+        task = client.post("/tasks", json={"title": "Task", "description": "Description"}, headers=headers).json()
+        client.patch(f"/tasks/{task['id']}", json={"is_completed": True}, headers=headers)
+        client.delete(f"/tasks/{task['id']}", headers=headers)
+
+        events = [subscription.queue.get_nowait() for _ in range(3)]
+        assert [event["type"] for event in events] == ["created", "updated", "deleted"]
+        assert all(event["id"] == task["id"] for event in events)
+        assert [event["version"] for event in events] == sorted(event["version"] for event in events)
+    finally:
+        subscription.close()
+
+def test_large_batch_publishes_single_resync(client, clean_database, access_token, monkeypatch):
+    import jwt
+    from broker import broker, RESYNC_EVENT
+    from routers import tasks
+    monkeypatch.setattr(tasks, "BATCH_MAX_EVENTS", 3)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = int(jwt.decode(access_token, options={"verify_signature": False})["sub"])
+
+    def batch(count: int):
+        operations = [{"op": "create", "data": {"title": f"Task {i}", "description": "D"}} for i in range(count)]
+        client.post("/tasks/batch", json={"operations": operations}, headers=headers)
+
+    subscription = broker.subscribe(user_id)
+    try:
+        batch(3)
+        assert [subscription.queue.get_nowait()["type"] for _ in range(3)] == ["created"] * 3
+        batch(4)
+        assert subscription.queue.get_nowait() == RESYNC_EVENT
+        assert subscription.queue.empty()
+    finally:
+        subscription.close()
+
+def test_stream_tasks_requires_auth(client):
+    response = client.get("/tasks/stream")
+    assert response.status_code == 401
+
+def test_task_stats_follow_writes(client, clean_database, access_token):
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    def stats():
+        response = client.get("/tasks/stats", headers=headers)
+        assert response.status_code == 200
+        result = response.json()
+        # Счётчики совпадают с подсчётом по самим задачам
+        assert result["total"] == client.get("/tasks/count", headers=headers).json()["count"]
+        assert result["completed"] == client.get("/tasks/count?is_completed=true", headers=headers).json()["count"]
+        return result
+
+    assert stats() == {"total": 0, "completed": 0, "pending": 0}
+    ids = [
+        client.post("/tasks", json={"title": f"Task {i}", "description": "Text"}, headers=headers).json()["id"]
+        for i in range(3)
+    ]
+    client.patch(f"/tasks/{ids[0]}", json={"is_completed": True}, headers=headers)
+    client.patch(f"/tasks/{ids[0]}", json={"title": "Renamed"}, headers=headers)
+    assert stats() == {"total": 3, "completed": 1, "pending": 2}
+
+    client.post("/tasks/batch", json={"operations": [
+        {"op": "create", "data": {"title": "Batch", "description": "Text"}},
+        {"op": "complete", "id": ids[1], "is_completed": True},
+        {"op": "delete", "id": ids[0]},
+    ]}, headers=headers)
+    assert stats() == {"total": 3, "completed": 1, "pending": 2}
+
+    client.delete(f"/tasks/{ids[1]}", headers=headers)
+    # Повторное удаление надгробия счётчики не трогает
+    client.delete(f"/tasks/{ids[1]}", headers=headers)
+    lines = "\n".join(json.dumps({"title": f"Imported {i}", "description": "D"}) for i in range(2))
+    client.post("/tasks/import", content=lines, headers=headers)
+    assert stats() == {"total": 4, "completed": 0, "pending": 4}
+
+def test_task_stats_read_counters_not_tasks(client, clean_database, access_token, create_test_user, sql_statements):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for i in range(5):
+        client.post("/tasks", json={"title": f"Task {i}", "description": "Text"}, headers=headers)
+    create_test_user(username="other", password="password")
+    other_token = client.post("/token", data={"username": "other", "password": "password"}).json()["access_token"]
+
+    sql_statements.clear()
+    assert client.get("/tasks/stats", headers=headers).json()["total"] == 5
+    assert any("FROM task_stats" in statement for statement in sql_statements)
+    assert not any("FROM tasks" in statement for statement in sql_statements)
+    assert client.get("/tasks/stats", headers={"Authorization": f"Bearer {other_token}"}).json() == {
+        "total": 0, "completed": 0, "pending": 0,
+    }
+
+def test_reconcile_task_stats_repairs_drift(client, clean_database, access_token, create_test_user, db_session):
+    from database import TaskStats
+    from stats import reconcile_task_stats
+    from tests.conftest import TestingAsyncSessionLocal
+    headers = {"Authorization": f"Bearer {access_token}"}
+    for i in range(3):
+        client.post("/tasks", json={"title": f"Task {i}", "description": "Text"}, headers=headers)
+    other = create_test_user(username="other", password="password")
+    other_token = client.post("/token", data={"username": "other", "password": "password"}).json()["access_token"]
+    client.post("/tasks", json={"title": "Other", "description": "Text"}, headers={"Authorization": f"Bearer {other_token}"})
+
+    # Расхождения: счётчики первого пользователя испорчены, у второго строки нет вовсе
+    db_session.query(TaskStats).filter(TaskStats.user_id != other.id).update({"total": 100, "completed": 7})
+    db_session.query(TaskStats).filter(TaskStats.user_id == other.id).delete()
+    db_session.commit()
+
+    async def reconcile():
+        async with TestingAsyncSessionLocal() as db:
+            return await reconcile_task_stats(db, batch_size=1)
+
+    assert asyncio.run(reconcile()) == 2
+    assert client.get("/tasks/stats", headers=headers).json() == {"total": 3, "completed": 0, "pending": 3}
+    assert client.get("/tasks/stats", headers={"Authorization": f"Bearer {other_token}"}).json()["total"] == 1
+    assert asyncio.run(reconcile()) == 0
+
+def test_reconcile_task_stats_survives_concurrent_insert(client, clean_database, access_token, create_test_user, db_session):
+    from sqlalchemy import Insert, insert
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from database import TaskStats, User
+    from stats import reconcile_task_stats
+    from tests.conftest import async_engine
+    headers = {"Authorization": f"Bearer {access_token}"}
+    client.post("/tasks", json={"title": "Task", "description": "Text"}, headers=headers)
+    other = create_test_user(username="other", password="password")
+    other_token = client.post("/token", data={"username": "other", "password": "password"}).json()["access_token"]
+    client.post("/tasks", json={"title": "Other", "description": "Text"}, headers={"Authorization": f"Bearer {other_token}"})
+    db_session.query(TaskStats).delete()
+    db_session.commit()
+    first_user = db_session.query(User).filter(User.id != other.id).one().id
+
+    class RacingSession(AsyncSession):
+        """Перед первой вставкой счётчиков «параллельная запись» успевает вставить и зафиксировать строку."""
+        raced = False
+
+        async def execute(self, statement, *args, **kwargs):
+            if isinstance(statement, Insert) and statement.table.name == "task_stats" and not self.raced:
+                self.raced = True
+                await super().execute(insert(TaskStats).values(user_id=first_user, total=5, completed=5))
+                await self.commit()
+            return await super().execute(statement, *args, **kwargs)
+
+    async def reconcile():
+        async with RacingSession(bind=async_engine, expire_on_commit=False) as db:
+            repaired = await reconcile_task_stats(db, batch_size=1)
+            return repaired, db.raced
+
+    repaired, raced = asyncio.run(reconcile())
+    assert raced
+    # Пачка с гонкой повторена и исправлена, следующая пачка не пропущена
+    assert repaired == 2
+    assert client.get("/tasks/stats", headers=headers).json() == {"total": 1, "completed": 0, "pending": 1}
+    assert client.get("/tasks/stats", headers={"Authorization": f"Bearer {other_token}"}).json()["total"] == 1
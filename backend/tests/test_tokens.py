@@ -0,0 +1,100 @@
+import time
+from dataclasses import replace
+
+import jwt
+import pytest
+
+import tokens
+from settings import get_settings
+from tokens import decode_token, encode_token, load_key_set, verified_tokens
+
+
+def test_verified_token_is_cached(monkeypatch):
+    token = encode_token({"sub": "1", "exp": int(time.time()) + 600})
+    calls = []
+    original = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(1)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(tokens.jwt, "decode", counting_decode)
+    assert decode_token(token)["sub"] == "1"
+    assert decode_token(token)["sub"] == "1"
+    assert len(calls) == 1
+    # Одноразовые токены проверяются каждый раз
+    decode_token(token, use_cache=False)
+    assert len(calls) == 2
+
+
+def test_cache_entry_does_not_outlive_token():
+    token = encode_token({"sub": "1", "exp": int(time.time()) + 2})
+    decode_token(token)
+    (expires_at, _), = verified_tokens._data.values()
+    assert expires_at - time.monotonic() <= 2
+
+    expired = encode_token({"sub": "1", "exp": int(time.time()) - 1})
+    with pytest.raises(jwt.ExpiredSignatureError):
+        decode_token(expired)
+    assert len(verified_tokens) == 1
+
+
+def test_tampered_token_is_not_served_from_cache():
+    token = encode_token({"sub": "1", "exp": int(time.time()) + 600})
+    decode_token(token)
+    header, payload, signature = token.split(".")
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_token(f"{header}.{payload}.{signature[:-2]}AA")
+
+
+def test_key_lookup_by_kid(monkeypatch, tmp_path):
+    (tmp_path / "old.key").write_text("previous-secret")
+    settings = replace(get_settings(), jwt_key_id="current", jwt_verify_keys=f"old={tmp_path / 'old.key'}")
+    monkeypatch.setattr(tokens, "get_key_set", lambda: load_key_set(settings))
+    exp = int(time.time()) + 600
+
+    token = encode_token({"sub": "1", "exp": exp})
+    assert jwt.get_unverified_header(token)["kid"] == "current"
+    assert decode_token(token, use_cache=False)["sub"] == "1"
+    # Токен, подписанный прежним ключом, проверяется по своему kid
+    old = jwt.encode({"sub": "2", "exp": exp}, "previous-secret", algorithm="HS256", headers={"kid": "old"})
+    assert decode_token(old, use_cache=False)["sub"] == "2"
+    # Токены без kid проверяются текущим ключом
+    assert decode_token(jwt.encode({"sub": "3", "exp": exp}, settings.secret_key, algorithm="HS256"), use_cache=False)
+    unknown = jwt.encode({"sub": "4", "exp": exp}, "previous-secret", algorithm="HS256", headers={"kid": "unknown"})
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_token(unknown, use_cache=False)
+
+
+def test_asymmetric_keys(monkeypatch, tmp_path):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key, previous_key, foreign_key = (ec.generate_private_key(ec.SECP256R1()) for _ in range(3))
+    key_file = tmp_path / "private.pem"
+    key_file.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ))
+    # После ротации прежний ключ остаётся только для проверки: в JWT_VERIFY_KEYS лежит его открытая часть
+    previous_file = tmp_path / "previous.pem"
+    previous_file.write_bytes(previous_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+    ))
+    settings = replace(
+        get_settings(), algorithm="ES256", jwt_key_id="es-2", jwt_private_key_file=str(key_file),
+        jwt_verify_keys=f"es-1={previous_file}",
+    )
+    settings.validate()
+    monkeypatch.setattr(tokens, "get_key_set", lambda: load_key_set(settings))
+
+    exp = int(time.time()) + 600
+    token = encode_token({"sub": "1", "exp": exp})
+    assert jwt.get_unverified_header(token) == {"alg": "ES256", "kid": "es-2", "typ": "JWT"}
+    assert decode_token(token)["sub"] == "1"
+    # Токен, выданный до ротации, проверяется прежним ключом по kid
+    old = jwt.encode({"sub": "2", "exp": exp}, previous_key, algorithm="ES256", headers={"kid": "es-1"})
+    assert decode_token(old, use_cache=False)["sub"] == "2"
+    # Подпись чужим ключом с известным kid не проходит
+    forged = jwt.encode({"sub": "3", "exp": exp}, foreign_key, algorithm="ES256", headers={"kid": "es-2"})
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_token(forged, use_cache=False)
@@ -0,0 +1,91 @@
+import hashlib
+import time
+from functools import lru_cache
+from typing import Any
+
+import jwt
+
+from cache import TTLCache
+from settings import Settings, get_settings
+
+# Кеш проверенных access-токенов, см. Settings
+JWT_CACHE_SIZE = get_settings().jwt_cache_size
+JWT_CACHE_TTL_SECONDS = get_settings().jwt_cache_ttl_seconds
+
+verified_tokens = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL_SECONDS)
+
+
+class KeySet:
+    """Ключ подписи выдаваемых токенов и ключи проверки по kid."""
+
+    def __init__(self, algorithm: str, signing_key: Any, key_id: str | None, verify_keys: dict[str, Any], default_key: Any):
+        self.algorithm = algorithm
+        self.signing_key = signing_key
+        self.key_id = key_id
+        self.verify_keys = verify_keys
+        # Ключ для токенов без kid: выданных до включения kid или подписанных SECRET_KEY
+        self.default_key = default_key
+
+    def verification_key(self, token: str) -> Any:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            return self.default_key
+        key = self.verify_keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown key id")
+        return key
+
+
+def _read(path: str) -> str:
+    with open(path) as file:
+        return file.read()
+
+
+def load_key_set(settings: Settings) -> KeySet:
+    verify_keys = {}
+    for item in filter(None, (item.strip() for item in settings.jwt_verify_keys.split(","))):
+        kid, _, path = item.partition("=")
+        verify_keys[kid.strip()] = _read(path.strip())
+
+    if settings.jwt_symmetric:
+        signing_key = default_key = settings.secret_key
+    else:
+        # cryptography нужен только асимметричным алгоритмам, поэтому импортируется здесь
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        signing_key = load_pem_private_key(_read(settings.jwt_private_key_file).encode(), password=None)
+        default_key = signing_key.public_key()
+    if settings.jwt_key_id:
+        verify_keys[settings.jwt_key_id] = default_key
+    return KeySet(settings.algorithm, signing_key, settings.jwt_key_id, verify_keys, default_key)
+
+
+@lru_cache
+def get_key_set() -> KeySet:
+    return load_key_set(get_settings())
+
+
+def encode_token(payload: dict) -> str:
+    keys = get_key_set()
+    headers = {"kid": keys.key_id} if keys.key_id else None
+    return jwt.encode(payload, keys.signing_key, algorithm=keys.algorithm, headers=headers)
+
+
+def decode_token(token: str, use_cache: bool = True) -> dict:
+    """
+    Проверяет подпись и срок токена и возвращает его claims. Ошибки — исключения jwt, как у jwt.decode.
+    use_cache=False для одноразовых токенов (refresh): их кеширование только вытесняло бы access-токены.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    if use_cache:
+        claims = verified_tokens.get(digest)
+        if claims is not None:
+            return claims
+
+    keys = get_key_set()
+    claims = jwt.decode(token, keys.verification_key(token), algorithms=[keys.algorithm])
+    if use_cache and "exp" in claims:
+        ttl = min(claims["exp"] - time.time(), JWT_CACHE_TTL_SECONDS)
+        if ttl > 0:
+            verified_tokens.set(digest, claims, ttl=ttl)
+    return claims
@@ -1,23 +1,123 @@
+import asyncio
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import bcrypt
-from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import User, Task
+from settings import get_settings
+
+settings = get_settings()
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+PASSWORD_HASH_WORKERS = settings.password_hash_workers
+PASSWORD_HASH_QUEUE_LIMIT = settings.password_hash_queue_limit
+
+# bcrypt отпускает GIL, поэтому потоков достаточно, чтобы не блокировать event loop
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending_hashes = 0
 
-def get_user_or_404(user_id: int, db: Session):
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_user_or_404(user_id: int, db: AsyncSession):
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-def get_task_or_404(task_id: int, user_id: int, db: Session):
-    task = db.query(Task).filter(Task.id == task_id, Task.user_id == user_id).first()
+TASK_COLUMNS = (Task.id, Task.title, Task.description, Task.is_completed, Task.version, Task.updated_at)
+
+async def get_task_or_404(task_id: int, user_id: int, db: AsyncSession):
+    task = await db.scalar(
+        select(Task).where(Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None))
+    )
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+def next_task_version(user_id: int):
+    """Подзапрос max(version) + 1 по задачам пользователя, чтобы версия назначалась тем же запросом, что и запись."""
+    tasks = Task.__table__.alias("user_tasks")
+    return (
+        select(func.coalesce(func.max(tasks.c.version), 0) + 1)
+        .where(tasks.c.user_id == user_id)
+        .scalar_subquery()
+    )
+
+def is_version_conflict(error: IntegrityError) -> bool:
+    """
+    Нарушен ли уникальный индекс ix_tasks_user_id_version, то есть версию заняла параллельная запись.
+    Postgres называет индекс в сообщении, SQLite перечисляет его колонки.
+    """
+    message = str(error.orig)
+    return "ix_tasks_user_id_version" in message or "tasks.user_id, tasks.version" in message
+
+async def execute_versioned(statement, db: AsyncSession, attempts: int = 3):
+    """
+    Выполняет запись, назначающую версию через next_task_version.
+    Параллельная запись того же пользователя могла занять эту версию (уникальный индекс),
+    тогда повторяем: подзапрос увидит уже зафиксированную версию. Остальные нарушения не повторяем.
+    """
+    for attempt in range(attempts):
+        try:
+            return await db.execute(statement)
+        except IntegrityError as error:
+            await db.rollback()
+            if not is_version_conflict(error):
+                raise
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Concurrent modification, please retry")
+
+async def update_task_or_404(task_id: int, user_id: int, values: dict, db: AsyncSession):
+    """UPDATE ... RETURNING одним запросом вместо SELECT + UPDATE + SELECT."""
+    result = await execute_versioned(
+        update(Task)
+        .where(Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None))
+        .values(**values, version=next_task_version(user_id))
+        .returning(*TASK_COLUMNS),
+        db
+    )
+    task = result.mappings().one_or_none()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
+def encode_cursor(value: int, kind: str = "id") -> str:
+    """Непрозрачный курсор пагинации: клиент не должен полагаться на его содержимое."""
+    return base64.urlsafe_b64encode(f"{kind}:{value}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, kind: str = "id") -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, value = base64.urlsafe_b64decode(padded).decode().split(":")
+        if prefix != kind:
+            raise ValueError(prefix)
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def make_etag(*parts) -> str:
+    # Слабый ETag: ответ семантически тот же, байты могут отличаться (например, после сжатия)
+    return f'W/"{"-".join(str(part) for part in parts)}"'
+
+def query_digest(query_string: str) -> str:
+    """Короткий отпечаток параметров запроса, чтобы ETag списка различался для разных фильтров."""
+    normalized = "&".join(sorted(query_string.split("&")))
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Слабое сравнение из RFC 9110 для If-None-Match."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
 def get_password_hash(password):
     pwd_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(password=pwd_bytes, salt=salt)
     string_password = hashed_password.decode('utf8')
     return string_password
@@ -25,4 +125,36 @@ def get_password_hash(password):
 def verify_password(plain_password, hashed_password):
     password_byte_enc = plain_password.encode('utf-8')
     hashed_password = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_byte_enc, hashed_password)
\ No newline at end of file
+    return bcrypt.checkpw(password_byte_enc, hashed_password)
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Хеш вида $2b$12$... посчитан с другой стоимостью, чем сейчас в BCRYPT_ROUNDS."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+async def _run_in_hash_pool(func, *args):
+    """
+    Выполняет функцию bcrypt в пуле потоков.
+    Если пул и очередь заполнены, сразу отвечает 503, а не копит запросы.
+    """
+    global _pending_hashes
+    if _pending_hashes >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+    _pending_hashes += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, partial(func, *args))
+    finally:
+        _pending_hashes -= 1
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_in_hash_pool(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
@@ -6,8 +6,10 @@ final log = Logger("ApiClient");
 
 class ApiClient {
   final Dio _dio;
-  int retryCount = 0;
-  static const maxRetries = 3;
+  // Обновление, которое сейчас выполняется. refresh_token одноразовый: если запросы,
+  // получившие 401 одновременно, обновят токен каждый сам, сервер примет только первого
+  Future<bool>? _refreshing;
+  static const _retriedKey = 'auth_retried';
 
   final SharedPreferencesAsync prefs;
   
@@ -28,35 +30,24 @@ class ApiClient {
       onError: (error, handler) async {
         log.info('Запрос: ${error.requestOptions.method} ${error.requestOptions.path} ${error.requestOptions.headers}');
         // Логика обработки ошибок
-        if (error.response?.statusCode == 401) {
-          if (retryCount >= maxRetries) {
-            log.severe('Достигнут лимит повторных попыток. Прекращение.');
-            return handler.reject(error); // Прерываем обработку
+        final request = error.requestOptions;
+        // Сам запрос обновления и уже повторённый запрос второй раз не обновляем
+        if (error.response?.statusCode == 401 && request.path != '/auth/refresh' && request.extra[_retriedKey] != true) {
+          final sentToken = request.headers['Authorization'];
+          // Если токен уже сменился, пока запрос был в пути, достаточно повторить его с новым
+          if (sentToken == _dio.options.headers['Authorization']) {
+            log.warning('Токен истёк. идет процесс обновления...');
+            if (!await refreshAccessToken()) {
+              log.severe('Не удалось обновить токен.');
+              return handler.reject(error);
+            }
           }
-          retryCount++;
-
-          log.warning('Токен истёк. идет процесс обновления...');
-          final success = await refreshAccessToken();
-          if (success) {
-            log.info("Старый ${error.requestOptions.headers['Authorization']} : Новый ${_dio.options.headers['Authorization']}");
-            error.requestOptions.headers['Authorization'] = _dio.options.headers['Authorization'];
-            log.info("Заменилось? ${error.requestOptions.headers['Authorization'] != _dio.options.headers['Authorization']}");
-            final retryResponse = await _dio.request(
-              error.requestOptions.path,
-              options: Options(
-                method: error.requestOptions.method,
-                headers: error.requestOptions.headers,
-              ),
-              data: error.requestOptions.data,
-              queryParameters: error.requestOptions.queryParameters,
-            );
-            retryCount = 0;
-            return handler.resolve(retryResponse);
-          } else {
-            log.severe('Не удалось обновить токен.');
-
-            retryCount = 0;
-            return handler.reject(error);
+          request.headers['Authorization'] = _dio.options.headers['Authorization'];
+          request.extra[_retriedKey] = true;
+          try {
+            return handler.resolve(await _dio.fetch(request));
+          } on DioException catch (retryError) {
+            return handler.reject(retryError);
           }
         }
         return handler.next(error);
@@ -81,7 +72,12 @@ class ApiClient {
     log.info('Access token очищен');
   }
 
-  Future<bool> refreshAccessToken() async {
+  /// Обновляет access_token. Одновременные вызовы ждут одно и то же обновление.
+  Future<bool> refreshAccessToken() {
+    return _refreshing ??= _refresh().whenComplete(() => _refreshing = null);
+  }
+
+  Future<bool> _refresh() async {
     try {
       final refreshToken = await prefs.getString('refresh_token');
       if (refreshToken == null) {
@@ -96,6 +92,11 @@ class ApiClient {
       final String newAccessToken = response.data['access_token'];
       addToken(newAccessToken);
       await prefs.setString('access_token', newAccessToken);
+      // Сервер выдаёт новый refresh_token при каждом обновлении, старый больше недействителен
+      final String? newRefreshToken = response.data['refresh_token'];
+      if (newRefreshToken != null) {
+        await prefs.setString('refresh_token', newRefreshToken);
+      }
       log.info('Access token успешно обновлён $newAccessToken');
       return true;
     } catch (e) {